@@ -12,10 +12,16 @@ with a Slurm system.
 import os
 import copy
 import re
-from datetime import datetime
+import heapq
+import multiprocessing
+from datetime import datetime, timedelta
 from hex import Command
 from jobreports import JobReport,JobStep
-from util import runsh_i
+from columnar import JobStepTable,JobReportView,datetime_to_epoch,epoch_to_datetime
+from jobcache import JobCache,is_terminal_state
+from cursor import SacctCursor
+from sacctparser import SacctParser,format_fields
+from util import runsh_i,ShMultiplexer,ShStream
 
 #--- setup logging
 import logging
@@ -30,6 +36,26 @@ logger.addHandler(NullHandler())
 DEFAULT_SLURM_CONF_FILE = '/etc/slurm/slurm.conf'
 
 #--- misc
+def jobid_sort_key(JobID):
+    """
+    Sort key for JobIDs, so that they sort numerically, including job array
+    ids like 1234_5.
+    """
+    if JobID is None:
+        return ()
+    return tuple(int(p) if p.isdigit() else p for p in JobID.split('_'))
+
+def _sacct_slice_worker(args):
+    """
+    Process pool worker for Slurm._yield_sliced_job_reports.  Returns the 
+    sorted JobReports for one sacct query.
+    """
+    kwargs,columnar = args
+    reports = [jr for jr in Slurm.getJobReports(columnar=columnar,**kwargs) if jr.JobID is not None]
+    reports.sort(key=lambda jr: jobid_sort_key(jr.JobID))
+    return reports
+
+
 class Slurm(object):
     """
     Collection of static methods for interacting with a Slurm system
@@ -38,6 +64,10 @@ class Slurm(object):
     squeue = None
     scancel = None
     sbatch = None
+    sacct = None
+    
+    # Maximum number of job ids to put in one -j/--jobs argument
+    JOBS_PER_QUERY = 1000
     
     _sacct_format_parsable = \
         'JobID  ,User      ,JobName    ,State    ,Partition  ,NCPUS  ,\
@@ -50,42 +80,96 @@ class Slurm(object):
         I'd like to initialize these at compile time, but I can't.  This is called
         by the functions that use the slurm commands.
         """
-        if Slurm.squeue is None or Slurm.sbatch is None or Slurm.scancel is None:
+        if Slurm.squeue is None or Slurm.sbatch is None or Slurm.scancel is None or Slurm.sacct is None:
+            Slurm.sacct = Command.load("sacct",path=os.path.join(os.path.dirname(__file__),"conf/14.03.8"))
             Slurm.squeue = Command.load("squeue",path=os.path.join(os.path.dirname(__file__),"conf/14.03.8"))
             Slurm.sbatch = Command.load("sbatch",path=os.path.join(os.path.dirname(__file__),"conf/14.03.8"))
             Slurm.scancel = Command.load("scancel",path=os.path.join(os.path.dirname(__file__),"conf/14.03.8"))
     
+    @classmethod
+    def newCommand(cls,name):
+        """
+        Returns a new instance of one of the commands loaded by initcmds 
+        (squeue, sacct, sbatch, or scancel) for a single call.
+        
+        This is a copy.deepcopy of the template, as the Slurm methods have 
+        always made, except that the parameter definitions, which never 
+        change after loading, are shared through the deepcopy memo instead 
+        of copied, which is most of the cost.  Everything else, including
+        the parameter values, goes through Command's own copy behavior.
+        """
+        Slurm.initcmds()
+        template = getattr(Slurm,name)
+        memo = {}
+        parameterdefs = template.parameterdefs
+        if parameterdefs is not None:
+            memo[id(parameterdefs)] = parameterdefs
+        return copy.deepcopy(template,memo)
+    
     
     @classmethod
-    def getJobStatus(cls,jobid):
+    def getJobStatus(cls,jobid,cache=None):
         """
         Uses squeue, then sacct to determine job status.  Status value is 
-        returned.
+        returned, followed by a newline, or '' if neither knows the job.
+        
+        This is getJobStatuses for a single job, so it runs the same squeue
+        and sacct.  If cache is a queuecache.SqueueCache, the job is looked 
+        up in its snapshot of the queue instead of with a squeue of its own.
         """
-        Slurm.initcmds()
-        squeue = copy.deepcopy(Slurm.squeue)
-        squeue.reset()
-        squeue.jobs = jobid
-        squeue.noheader = True
-        squeue.format = "%%T"
-        [returncode,stdout,stderr] = squeue.run()
-        if stdout is not None and stdout.strip() != "":
-            logger.info("Status of jobid %s is %s" % (str(jobid),stdout))
-            return stdout
-        else:
-            """
-            Try sacct if squeue doesn't return anything
-            """
-            sacct = copy.deepcopy(Slurm.sacct)
-            sacct.reset()
-            sacct.jobs = "%s.batch" % jobid
-            sacct.format = "State"
-            sacct.noheader = True
-            [returncode,stdout,stderr] = sacct.run()
-            if returncode != 0:
-                raise Exception("sacct failed %s" % sacct.composeCmdString())
-            logger.info("Status of jobid %s is %s" % (str(jobid),stdout))
-            return stdout
+        status = Slurm.getJobStatuses([jobid],cache=cache)[str(jobid)]
+        if status is None:
+            return ''
+        logger.info("Status of jobid %s is %s" % (str(jobid),status))
+        return status + '\n'
+
+    @classmethod
+    def getJobStatuses(cls,jobids,cache=None):
+        """
+        getJobStatus for many jobs at once.  Returns a dict of jobid (as a 
+        string) to status, e.g. RUNNING or COMPLETED, or None if neither 
+        squeue nor sacct knows the job.
+        
+        Rather than a squeue and a sacct per job, this runs one squeue per
+        JOBS_PER_QUERY jobs, then one sacct per JOBS_PER_QUERY of the jobs
+        squeue did not report.  If cache is a queuecache.SqueueCache, its
+        snapshot of the queue is used instead of the squeues.
+        """
+        jobids = [str(jobid) for jobid in jobids]
+        statuses = dict((jobid,None) for jobid in jobids)
+        
+        queued = jobids
+        if cache is not None:
+            snapshot = cache.get()
+            for jobid in jobids:
+                statuses[jobid] = snapshot.status(jobid)
+            queued = []
+        
+        for i in range(0,len(queued),Slurm.JOBS_PER_QUERY):
+            chunk = ','.join(queued[i:i+Slurm.JOBS_PER_QUERY])
+            # squeue complains about jobs it no longer has, so its errors are ignored
+            with ShStream(['squeue','--jobs',chunk,'--noheader','--format','%i %T'],check=False) as stream:
+                for line in stream:
+                    fields = line.split()
+                    if len(fields) == 2 and fields[0] in statuses:
+                        statuses[fields[0]] = fields[1]
+        
+        missing = [jobid for jobid in jobids if statuses[jobid] is None]
+        for i in range(0,len(missing),Slurm.JOBS_PER_QUERY):
+            chunk = ','.join('%s.batch' % jobid for jobid in missing[i:i+Slurm.JOBS_PER_QUERY])
+            argv = ['sacct','--jobs',chunk,'--format','JobID,State','--noheader','--parsable2']
+            with ShStream(argv,check=False) as stream:
+                for line in stream:
+                    fields = line.strip().split('|')
+                    if len(fields) == 2 and fields[0].endswith('.batch'):
+                        jobid = fields[0][:-len('.batch')]
+                        if jobid in statuses:
+                            statuses[jobid] = fields[1]
+            if stream.returncode != 0:
+                raise Exception("sacct failed %s" % ' '.join(argv))
+        
+        logger.info("Got the status of %d jobs" % len(statuses))
+        return statuses
 
     
     @classmethod
@@ -167,8 +251,7 @@ class Slurm(object):
         """
         Uses scancel to kill the specified job
         """
-        Slurm.initcmds()
-        scancel = copy.deepcopy(Slurm.scancel)
+        scancel = Slurm.newCommand('scancel')
         scancel.jobid = jobid
         [returncode,stdout,stderr] = scancel.run()
         if returncode != 0:
@@ -184,8 +267,7 @@ class Slurm(object):
         Any slurm parameters that are set as keyword args will override the 
         environment variables.
         """
-        Slurm.initcmds()
-        sbatch = copy.deepcopy(Slurm.sbatch)
+        sbatch = Slurm.newCommand('sbatch')
         sbatch.command = command
                 
         for arg,value in kwargs.iteritems():
@@ -332,20 +414,47 @@ class Slurm(object):
             raise Exception("un-parsable AllocMem [%r]" % AllocMem)
         
     @classmethod
-    def _yield_raw_sacct_job_text_blocks(cls,**kwargs):
+    def _yield_raw_sacct_job_text_blocks(cls,fields=None,**kwargs):
         """
         Yields multi-line strings of sacct text for each job.
+        
+        fields is the list of sacct columns to request; by default, 
+        _sacct_format_parsable.
         """
         logger.debug("yielding sacct text with args %s" % kwargs)
         
         # If an command line executor is defined in the arguments, use that
         # otherwise, use runsh_i
-        executor = runsh_i
-        if 'execfunc' in kwargs:
-            executor = kwargs['execfunc']
-                        
+        kwargs = dict(kwargs)
+        executor = kwargs.pop('execfunc',runsh_i)
+        shv = Slurm._sacct_argv(fields=fields,**kwargs)
+                    
+        #the lines of the text that's yielded, joined once it's complete
+        text = []
+        debug = logger.isEnabledFor(logging.DEBUG)
+    
+        # Execute the sacct command
+        for line in executor(shv):
+            if debug:
+                logger.debug("Command output line %s" % line)
+            if line.startswith('|'):
+                text.append(line)
+            else:
+                if text: yield ''.join(text)
+                text = [line]
         
-        shv = ['sacct', '--noheader', '--parsable2', '--format', Slurm._sacct_format_parsable]            
+        if text:
+            yield ''.join(text)
+            
+    @classmethod
+    def _sacct_argv(cls,fields=None,**kwargs):
+        """
+        Returns the sacct argv for the given fields and sacct parameters.
+        """
+        sacctformat = Slurm._sacct_format_parsable
+        if fields is not None:
+            sacctformat = ','.join(fields)
+        shv = ['sacct', '--noheader', '--parsable2', '--format', sacctformat]
         
         # Set of parameters that can't be passed along because they would 
         # interfere with JobStep creation
@@ -370,27 +479,293 @@ class Slurm(object):
                     shv.extend(['--%s' % key])
                 else:
                     shv.extend(['--%s' % key, value])
-                            
-                    
-        #this will be the text that's yielded
-        text = ''
+        return shv
+            
+    @classmethod
+    def _yield_sacct_job_texts(cls,**kwargs):
+        """
+        Yields (JobID,text) tuples, where text has all of the sacct lines for
+        the job (the main line and the job steps).
+        """
+        jobid = None
+        lines = []
+        for saccttext in Slurm._yield_raw_sacct_job_text_blocks(**kwargs):
+            for line in saccttext.splitlines():
+                if line.strip() == '':
+                    continue
+                JobID = line.split('|',1)[0].split('.',1)[0]
+                if JobID != jobid and lines:
+                    yield jobid, '\n'.join(lines) + '\n'
+                    lines = []
+                jobid = JobID
+                lines.append(line)
+        if lines:
+            yield jobid, '\n'.join(lines) + '\n'
     
-        #for line in open('_fake_data/sacct_alljobs_parsable.out').readlines():
-        # Execute the sacct command
-        #print("Executing with %s" % execfunc)
-        for line in executor(shv):
-            logger.debug("Command output line %s" % line)
-            if line.startswith('|'):
-                text += line
+    @classmethod
+    def _sacct_job_text_summary(cls,text,fields):
+        """
+        Return (State,Start,End) from the main line of a job's sacct text.
+        Start and End are in epoch seconds (see columnar.datetime_to_epoch), 
+        or None if Unknown.
+        
+        Fields after JobName are counted from the end of the line, so that 
+        pipes in the JobName don't matter.
+        """
+        lines = text.splitlines()
+        line = lines[0]
+        for l in lines:
+            if '.' not in l.split('|',1)[0]:
+                line = l
+                break
+        values = line.split('|')
+        
+        def value(name):
+            i = fields.index(name)
+            if 'JobName' in fields and i > fields.index('JobName'):
+                i -= len(fields)
+            return values[i]
+        
+        times = []
+        for name in ('Start','End'):
+            t = value(name)
+            if t and t != 'Unknown':
+                times.append(datetime_to_epoch(datetime.strptime(t,"%Y-%m-%dT%H:%M:%S")))
             else:
-                if text!='': yield text
-                text = line
+                times.append(None)
+        return value('State'),times[0],times[1]
+    
+    @classmethod
+    def _yield_cached_sacct_job_text_blocks(cls,cache,fields=None,**kwargs):
+        """
+        Yields sacct text for each job in the starttime/endtime window, using
+        the given JobCache (or path to one) where possible.
         
-        if text!='':
-            yield text
+        sacct is only run for the parts of the window the cache has not seen 
+        with these same arguments before, and for the jobs that were not yet 
+        finished the last time they were seen.  Jobs are considered part of 
+        the window if they were running at any time within it.
+        """
+        close = False
+        if isinstance(cache,basestring):
+            cache = JobCache(cache)
+            close = True
+        
+        kwargs = dict(kwargs)
+        if 'starttime' not in kwargs:
+            raise Exception("A starttime is required to use the job cache")
+        now = datetime.now()
+        starttime = Slurm.parse_slurm_timestamp(kwargs.pop('starttime'),now)
+        endtime = now
+        if kwargs.get('endtime') is not None:
+            endtime = Slurm.parse_slurm_timestamp(kwargs['endtime'],now)
+        kwargs.pop('endtime',None)
+        
+        # Everything except the time window determines what comes back
+        if fields is None:
+            fields = Slurm._sacct_format_parsable.split(',')
+        if any(name not in fields for name in ('State','Start','End')):
+            raise Exception("The job cache needs the State, Start, and End fields")
+        query = ';'.join(['%s=%s' % (k,kwargs[k]) for k in sorted(kwargs) if k != 'execfunc'])
+        query += '|' + ','.join(fields)
+        kwargs['fields'] = fields
+        
+        now = datetime_to_epoch(datetime.now())
+        start = datetime_to_epoch(starttime)
+        end = datetime_to_epoch(endtime)
+        seen = set()
+        
+        def fetch(**args):
+            for JobID,text in Slurm._yield_sacct_job_texts(**args):
+                if JobID in seen:
+                    continue
+                State,Start,End = Slurm._sacct_job_text_summary(text,fields)
+                if End is not None and is_terminal_state(State):
+                    if Start is None:
+                        Start = End
+                    cache.store(query,JobID,Start,End,State,text)
+                    if End < start or Start > end:
+                        continue
+                else:
+                    cache.add_pending(query,JobID)
+                    if Start is not None and Start > end:
+                        continue
+                seen.add(JobID)
+                yield text
+        
+        try:
+            for s,e in cache.uncovered(query,start,end):
+                logger.debug("Fetching uncached sacct range %d-%d" % (s,e))
+                args = dict(kwargs)
+                args['starttime'] = Slurm.datetime_to_slurm_timestamp(epoch_to_datetime(s))
+                args['endtime'] = Slurm.datetime_to_slurm_timestamp(epoch_to_datetime(e))
+                for text in fetch(**args):
+                    yield text
+                cache.add_coverage(query,s,min(e,now))
+            
+            # Refresh whatever was unfinished last time
+            pending = [JobID for JobID in cache.pending(query) if JobID not in seen]
+            for i in range(0,len(pending),Slurm.JOBS_PER_QUERY):
+                args = dict(kwargs)
+                args['jobs'] = ','.join(pending[i:i+Slurm.JOBS_PER_QUERY])
+                for text in fetch(**args):
+                    yield text
+            cache.commit()
             
+            for JobID,text in cache.texts(query,start,end):
+                if JobID not in seen:
+                    seen.add(JobID)
+                    yield text
+        finally:
+            cache.commit()
+            if close:
+                cache.close()
+    
+    # sacct's relative times, e.g. now-2days, and its named times of day
+    _relative_time_re = re.compile(r'^now(?:([-+])(\d+)(seconds?|minutes?|hours?|days?|weeks?)?)?$')
+    _relative_time_units = {'second':1,'minute':60,'hour':3600,'day':86400,'week':604800}
+    _named_times = {'today':0,'midnight':0,'elevenses':11,'noon':12,'fika':15,'teatime':16}
+    _time_of_day_re = re.compile(r'^(\d{1,2}):(\d\d)(?::(\d\d))?\s*([AP]M)?$',re.I)
+    _date_formats = ('%Y-%m-%d','%m/%d/%y','%m/%d','%m.%d.%y','%m.%d','%m%d%y','%m%d')
+    
+    @classmethod
+    def parse_slurm_timestamp(cls,ts,now=None):
+        """Convert a slurm timestamp string to a datetime.
+        
+        Accepts the time formats sacct does for --starttime and --endtime:
+        YYYY-MM-DD[THH:MM[:SS]] (which is what datetime_to_slurm_timestamp
+        produces), MM/DD[/YY][-HH:MM[:SS]], MM.DD[.YY], MMDD[YY], 
+        HH:MM[:SS][AM|PM], now[{+|-}count[seconds|minutes|hours|days|weeks]],
+        today, midnight, noon, elevenses, fika, teatime, and tomorrow.  Times
+        of day are today's, and relative times are from now (default 
+        datetime.now()), so pass the same now to resolve several timestamps
+        consistently.  datetimes are returned as is.
+        
+        Raises a ValueError for anything else.
+        """
+        if isinstance(ts,datetime):
+            return ts
+        if now is None:
+            now = datetime.now()
+        today = now.replace(hour=0,minute=0,second=0,microsecond=0)
+        s = ts.strip().lower()
+        
+        m = Slurm._relative_time_re.match(s)
+        if m:
+            sign,count,unit = m.groups()
+            if sign is None:
+                return now.replace(microsecond=0)
+            seconds = int(count) * Slurm._relative_time_units[(unit or 'seconds').rstrip('s')]
+            if sign == '-':
+                seconds = -seconds
+            return now.replace(microsecond=0) + timedelta(seconds=seconds)
+        if s in Slurm._named_times:
+            return today.replace(hour=Slurm._named_times[s])
+        if s == 'tomorrow':
+            return today + timedelta(days=1)
+        
+        m = Slurm._time_of_day_re.match(s)
+        if m:
+            hour,minute,second,ampm = m.groups()
+            hour = int(hour)
+            if ampm is not None:
+                if not 1 <= hour <= 12:
+                    raise ValueError("unable to parse timestamp [%s]" % ts)
+                hour = hour % 12 + (12 if ampm.lower() == 'pm' else 0)
+            return today.replace(hour=hour,minute=int(minute),second=int(second or 0))
+        
+        date,sep,time_of_day = s.partition('t' if 't' in s else '-' if '/' in s else ' ')
+        for fmt in Slurm._date_formats:
+            try:
+                d = datetime.strptime(date,fmt)
+            except ValueError:
+                continue
+            if '%y' not in fmt.lower():
+                d = d.replace(year=now.year)
+            if not sep:
+                return d
+            for tfmt in ('%H:%M:%S','%H:%M'):
+                try:
+                    t = datetime.strptime(time_of_day,tfmt)
+                except ValueError:
+                    continue
+                return d.replace(hour=t.hour,minute=t.minute,second=t.second)
+            break
+        raise ValueError("unable to parse timestamp [%s]" % ts)
+    
     @classmethod
-    def getJobReports(cls,**kwargs):
+    def split_time_window(cls,starttime,endtime,n):
+        """Split the window between two datetimes into n contiguous intervals.
+        
+        Returns a list of (start,end) datetime tuples.  Interval boundaries 
+        are whole seconds, and each interval starts where the previous one 
+        ended.
+        """
+        if n < 1:
+            raise ValueError("can not split a time window into %d intervals" % n)
+        if endtime <= starttime:
+            raise ValueError("endtime %s is not after starttime %s" % (endtime,starttime))
+        length = endtime - starttime
+        seconds = length.days * 86400 + length.seconds
+        bounds = [starttime]
+        for i in range(1,n):
+            bounds.append(starttime + timedelta(seconds=seconds * i // n))
+        bounds.append(endtime)
+        return [(bounds[i],bounds[i+1]) for i in range(n) if bounds[i] < bounds[i+1]]
+    
+    @classmethod
+    def _yield_sliced_job_reports(cls,slices,processes=None,columnar=False,**kwargs):
+        """
+        Yield JobReports for the starttime/endtime window in kwargs by running
+        one sacct per sub-interval in a process pool.
+        
+        sacct returns every job that was active during the interval, so jobs
+        that span a boundary come back from more than one interval; only the
+        first copy is yielded.  JobReports are yielded in JobID order.
+        """
+        if 'starttime' not in kwargs:
+            raise Exception("A starttime is required to split sacct queries by time")
+        now = datetime.now()
+        starttime = Slurm.parse_slurm_timestamp(kwargs['starttime'],now)
+        endtime = now
+        if kwargs.get('endtime') is not None:
+            endtime = Slurm.parse_slurm_timestamp(kwargs['endtime'],now)
+        
+        tasks = []
+        for start,end in Slurm.split_time_window(starttime,endtime,slices):
+            sliceargs = dict(kwargs)
+            sliceargs['starttime'] = Slurm.datetime_to_slurm_timestamp(start)
+            sliceargs['endtime'] = Slurm.datetime_to_slurm_timestamp(end)
+            tasks.append((sliceargs,columnar))
+        
+        logger.debug("Running %d sacct queries" % len(tasks))
+        if processes == 1:
+            results = map(_sacct_slice_worker,tasks)
+        else:
+            pool = multiprocessing.Pool(processes or len(tasks))
+            try:
+                results = pool.map(_sacct_slice_worker,tasks)
+                pool.close()
+            except:
+                pool.terminate()
+                raise
+            finally:
+                pool.join()
+        
+        # Each slice is already sorted, so merge them, dropping duplicates
+        decorated = [
+            [(jobid_sort_key(jr.JobID),i,k,jr) for k,jr in enumerate(reports)]
+            for i,reports in enumerate(results)
+        ]
+        lastkey = None
+        for key,i,k,jr in heapq.merge(*decorated):
+            if key == lastkey:
+                continue
+            lastkey = key
+            yield jr
+    
+    @classmethod
+    def getJobReports(cls,columnar=False,slices=1,processes=None,cache=None,cursor=None,parser=None,fields=None,compact=False,**kwargs):
         """
         Yield JobReport objects that match the given parameters.  
         
@@ -398,163 +773,211 @@ class Slurm(object):
         are collected, a JobReport is created and yielded.  Assumes that 
         jobsteps come out in sequence (though it doesn't matter which one is
         first.
+        
+        If columnar is True, no JobSteps are made.  The sacct values are 
+        appended to a single JobStepTable, and JobReportViews over each job's
+        rows are yielded instead (a batch at a time, see 
+        SacctParser.parse_into).  This uses far less memory when many reports
+        are retained.
+        
+        If compact is True, each JobReport only keeps its aggregated JobSummary
+        (all of the JobReport.keys) and its jobsteps are None.  This is the
+        smallest form for buffering many reports, and takes precedence over
+        columnar.
+        
+        If slices is more than 1, the starttime/endtime window is split into 
+        that many intervals and sacct is run for each of them concurrently, in
+        a pool of processes (one per slice by default).  Jobs are de-duplicated
+        and yielded in JobID order once all the queries are done.  An execfunc,
+        if given, has to be picklable (e.g. a module-level function) unless 
+        processes is 1.
+        
+        If cache is a JobCache, or the path to one, finished jobs are taken
+        from it rather than from sacct whenever possible, and any that are 
+        fetched are added to it.  A starttime is required.
+        
+        If cursor is a SacctCursor, only jobs that have finished since the 
+        cursor was last committed are yielded.  The starttime defaults to the
+        cursor position and the endtime to now.  Committing the cursor once 
+        the reports have been handled is up to the caller.
+        
+        parser is the SacctParser to use.  Passing one in lets the caller look
+        at its counters afterwards (e.g. slow_rows, the number of lines that 
+        had pipes in the JobName).  It determines the sacct --format.
+        
+        fields is the list of JobReport keys the caller needs (e.g. User, 
+        CPU_Efficiency).  If given, sacct is only asked for the columns those
+        are computed from (see sacctparser.format_fields), and the JobSteps 
+        only have the corresponding attributes.  Other keys are None, except
+        for the JobReport.max_keys, which come back as their floors (e.g. 
+        NCPUS is 0 and MaxRSS_kB is -1).  Names JobReport doesn't know about
+        are requested from sacct as is.
         """
+        if cursor is not None:
+            kwargs = dict(kwargs)
+            if kwargs.get('starttime') is None and cursor.starttime() is not None:
+                kwargs['starttime'] = Slurm.datetime_to_slurm_timestamp(cursor.starttime())
+            if kwargs.get('endtime') is None:
+                kwargs['endtime'] = Slurm.datetime_to_slurm_timestamp(datetime.now())
+            if fields is not None:
+                fields = list(fields) + ['State','End']
+            for jr in Slurm.getJobReports(columnar=columnar,slices=slices,processes=processes,cache=cache,parser=parser,fields=fields,compact=compact,**kwargs):
+                if cursor.accept(jr):
+                    yield jr
+            return
+        
+        if slices > 1:
+            if cache is not None:
+                raise Exception("The job cache can not be used with sliced queries")
+            for jr in Slurm._yield_sliced_job_reports(slices,processes=processes,columnar=columnar,fields=fields,compact=compact,**kwargs):
+                yield jr
+            return
+        
+        if parser is None:
+            if fields is None:
+                parser = SacctParser(Slurm._sacct_format_parsable.split(','))
+            else:
+                if cache is not None:
+                    fields = list(fields) + ['State','Start','End']
+                parser = SacctParser(format_fields(fields))
+        
+        if cache is not None:
+            blocks = Slurm._yield_cached_sacct_job_text_blocks(cache,fields=parser.fields,**kwargs)
+        else:
+            blocks = Slurm._yield_raw_sacct_job_text_blocks(fields=parser.fields,**kwargs)
         
-        # Regular expression for testing for state "CANCELLED by <uid>"
-        cancelledbyre = re.compile(r'CANCELLED by (\d+)')
+        lines = (line for saccttext in blocks for line in saccttext.split('\n'))
+        if columnar and not compact:
+            for jr in Slurm._yield_job_report_views(lines,parser):
+                yield jr
+            return
         
         jobsteps = []
         currentjobid = None
-        for saccttext in Slurm._yield_raw_sacct_job_text_blocks(**kwargs):
-            for line in saccttext.split('\n'):
-                line = line.strip()
-                if line=='':
-                    continue
-                
-                # Parse the sacct output
-                # If there is a ValueError, there is probably a pipe in the 
-                # command string
-                JobID = User = JobName = State = Partition = NCPUS = NNodes = CPUTime = \
-                        TotalCPU = UserCPU = SystemCPU = ReqMem = MaxRSS = Start = End = \
-                        NodeList = Elapsed = MaxVMSize = AveVMSize = None
-                try:
-
-                    JobID,User,JobName,State,Partition,NCPUS,NNodes,CPUTime,\
-                        TotalCPU,UserCPU,SystemCPU,ReqMem,MaxRSS,Start,End,\
-                        NodeList,Elapsed,MaxVMSize,AveVMSize = line.split("|")
-                    logger.debug("User %s, JobID %s" % (User,JobID))
-                except ValueError, e:
-                    print "unable to parse sacct job text [%r]: %r\n" % (saccttext, e)
-                    
-                    # Probably due to pipes in the JobName, so try alternate parsing strategy
-                    # result = re.match(r'([^\|]+)\|([^\|]+)\|(.*?)\|(BOOT_FAIL|CANCELLED|COMPLETED|FAILED|NODE_FAIL|PREEMPTED|TIMEOUT)\|(.*)',line)
-                    result = re.match(r'(.*?)\|(BOOT_FAIL|CANCELLED|COMPLETED|FAILED|NODE_FAIL|PREEMPTED|TIMEOUT)\|(.*)',line)
-                    if result is not None:
-                        fields = result.group(1).split('|')
-                        JobID   = fields[0]
-                        User    = fields[1]
-                        JobName = "".join(fields[2:])
-                        State   = result.group(2)
-                        remainder = result.group(3)
-                        Partition,NCPUS,NNodes,CPUTime, \
-                            TotalCPU,UserCPU,SystemCPU,ReqMem,MaxRSS,Start,End,\
-                            NodeList,Elapsed,MaxVMSize,AveVMSize = remainder.split("|")
-                    else:
-                        print "Second attempt to parse sacct job text failed.  Giving up on this one."
-                        continue
-                
-                # Convert JobID to just the base id, and set an extra 
-                # JobStepName variable with the step key
-                JobStepName = ''
-                if '.' in JobID:
-                    JobID, JobStepName = JobID.split('.')
+        
+        debug = logger.isEnabledFor(logging.DEBUG)
+        
+        for j in parser.parse(lines):
+            JobID = j.JobID
+            
+            if currentjobid is None:
+                currentjobid = JobID
                 
-                if currentjobid is None:
-                    currentjobid = JobID
-                    
-                # If this is a new JobID, yield the last one
-                if JobID != currentjobid:
+            # If this is a new JobID, yield the last one
+            if JobID != currentjobid:
+                if debug:
                     logger.debug("---New JobID %s" % JobID)
-                    currentjobid = JobID
-                    yield JobReport(jobsteps)
-                    jobsteps = []
-    
-                j = JobStep()
-                j.JobID         = JobID
-                j.JobStepName   = JobStepName
-                j.User          = User
-                j.JobName       = JobName
-                
-                m1 = cancelledbyre.match(State)
-                CancelledBy = None
-                if m1 is not None:
-                    CancelledBy = m1.group(1)
-                    State = 'CANCELLED'
-                
-                j.State         = State
-                j.CancelledBy   = CancelledBy
-                j.Partition     = Partition
-                j.NCPUS         = int(NCPUS)
-                j.NNodes        = int(NNodes)
-                j.CPUTime       = Slurm.slurmtime_to_seconds(CPUTime)
-                j.TotalCPU      = Slurm.slurmtime_to_seconds(TotalCPU)
-                j.UserCPU       = Slurm.slurmtime_to_seconds(UserCPU)
-                j.SystemCPU     = Slurm.slurmtime_to_seconds(SystemCPU)
-                j.Elapsed       = Slurm.slurmtime_to_seconds(Elapsed)
-                
-                starttime = None
-                if Start and Start != 'Unknown':
-                    starttime = datetime.strptime(Start,"%Y-%m-%dT%H:%M:%S")
-                j.Start         = starttime
-                
-                endtime = None
-                if End and End != 'Unknown':
-                    endtime = datetime.strptime(End,"%Y-%m-%dT%H:%M:%S")
-                j.End           = endtime
-                
-                j.NodeList      = NodeList
-
-                #these are the job steps after the main entry
-
-                #ReqMem
-                j.ReqMem_bytes = 0
-
-                if ReqMem.endswith('Mn'):
-                    ReqMem_bytes_per_node = int(ReqMem[:-2])*1024**2
-                    j.ReqMem_bytes_per_node = ReqMem_bytes_per_node
-                    j.ReqMem_bytes          = ReqMem_bytes_per_node
-                    j.ReqMem_bytes_per_core = None
-                    j.ReqMem_MB_total       = int(ReqMem[:-2])
-                elif ReqMem.endswith('Mc'):
-                    ReqMem_bytes_per_core = int(ReqMem[:-2])*1024**2
-                    j.ReqMem_bytes_per_node = None
-                    j.ReqMem_bytes_per_core = ReqMem_bytes_per_core
-                    j.ReqMem_bytes          = ReqMem_bytes_per_core
-                    j.ReqMem_MB_total       = int(ReqMem[:-2]) * int(NCPUS)
-                elif ReqMem.endswith('Gn'):
-                    ReqMem_bytes_per_node = int(round(float(ReqMem[:-2])*1024**3))
-                    j.ReqMem_bytes_per_node = ReqMem_bytes_per_node
-                    j.ReqMem_bytes_per_core = None
-                    j.ReqMem_bytes          = ReqMem_bytes_per_node
-                    j.ReqMem_MB_total       = int(round(float(ReqMem[:-2]) * int(NCPUS)))
-                elif ReqMem.endswith('Gc'):
-                    ReqMem_bytes_per_core = int(round(float(ReqMem[:-2])*1024**3))
-                    j.ReqMem_bytes_per_node = None
-                    j.ReqMem_bytes_per_core = ReqMem_bytes_per_core
-                    j.ReqMem_bytes          = ReqMem_bytes_per_core
-                    j.ReqMem_MB_total       = int(round(float(ReqMem[:-2]) * int(NCPUS)))
-                elif ReqMem.endswith('Tn'):
-                    ReqMem_bytes_per_node = int(round(float(ReqMem[:-2])*1024**4))
-                    j.ReqMem_bytes_per_node = ReqMem_bytes_per_node
-                    j.ReqMem_bytes_per_core = None
-                    j.ReqMem_bytes          = ReqMem_bytes_per_node
-                    j.ReqMem_MB_total       = int(round(float(ReqMem[:-2]) * int(NCPUS)))
-                elif ReqMem.endswith('Tc'):
-                    ReqMem_bytes_per_core = int(round(float(ReqMem[:-2])*1024**4))
-                    j.ReqMem_bytes_per_node = None
-                    j.ReqMem_bytes_per_core = ReqMem_bytes_per_core
-                    j.ReqMem_bytes          = ReqMem_bytes_per_core
-                    j.ReqMem_MB_total       = int(round(float(ReqMem[:-2]) * int(NCPUS)))
-                    
-                #MaxRSS
-                j.MaxRSS_kB = 0
-                j.MaxRSS_MB = 0
-                if MaxRSS:
-                    j.MaxRSS_kB = Slurm.MaxRSS_to_kB(MaxRSS)
-                    j.MaxRSS_MB = j.MaxRSS_kB / 1024
-
-                # MaxVMSize
-                j.MaxVMSize_MB = 0
-                if MaxVMSize:
-                    j.MaxVMSize_MB = Slurm.MaxRSS_to_kB(MaxVMSize) / 1024
-                    
-                # AveVMSize
-                j.AveVMSize_MB = 0
-                if AveVMSize:
-                    j.AveVMSize_MB = Slurm.MaxRSS_to_kB(AveVMSize) / 1024
+                currentjobid = JobID
+                yield JobReport(jobsteps,keep_steps=not compact)
+                jobsteps = []
+            
+            jobsteps.append(j)
                 
-                jobsteps.append(j)
-                    
 
+        if parser.slow_rows:
+            logger.info("%d sacct lines had extra pipes, %d could not be parsed" % (parser.slow_rows,parser.bad_rows))
+        
         # Send off the final JobReport
-        yield JobReport(jobsteps)    
+        yield JobReport(jobsteps,keep_steps=not compact)
+    
+    @classmethod
+    def _yield_job_report_views(cls,lines,parser):
+        """
+        Yield a JobReportView for each job in the sacct lines, all over one
+        JobStepTable.  The rows go straight from the split sacct fields into
+        the table's columns (SacctParser.parse_into), without JobSteps.
+        """
+        table = JobStepTable(parser.attributes)
+        for start,end in parser.parse_into(table,lines):
+            yield JobReportView(table,start,end)
+        
+        if parser.slow_rows:
+            logger.info("%d sacct lines had extra pipes, %d could not be parsed" % (parser.slow_rows,parser.bad_rows))
+        
+        # Like object mode, there's always at least one, if empty, report
+        if len(table) == 0:
+            yield JobReportView(table,0,0)
+    
+    @classmethod
+    def getJobReportsAsync(cls,mux,callback,ondone=None,fields=None,compact=False,**kwargs):
+        """
+        getJobReports on a util.ShMultiplexer.  This starts sacct and returns
+        right away; callback is then called with each JobReport as mux.run()
+        reads the output, so many queries can run at once.  ondone is called
+        with None or the error once sacct is done (see ShMultiplexer.add).
+        
+        fields, compact, and the sacct parameters are as for getJobReports;
+        the columnar, sliced, cache, and cursor modes aren't supported.
+        """
+        if fields is None:
+            parser = SacctParser(Slurm._sacct_format_parsable.split(','))
+        else:
+            parser = SacctParser(format_fields(fields))
+        shv = Slurm._sacct_argv(fields=parser.fields,**kwargs)
+        
+        # (a dict, so the closures can update it)
+        state = {'JobID' : None, 'jobsteps' : []}
+        
+        def online(line):
+            j = parser.parse_line(line)
+            if j is None:
+                return
+            if j.JobID != state['JobID'] and state['jobsteps']:
+                callback(JobReport(state['jobsteps'],keep_steps=not compact))
+                state['jobsteps'] = []
+            state['JobID'] = j.JobID
+            state['jobsteps'].append(j)
+        
+        def done(error):
+            if error is None and state['jobsteps']:
+                callback(JobReport(state['jobsteps'],keep_steps=not compact))
+            if ondone is not None:
+                ondone(error)
+            elif error is not None:
+                raise error
+        
+        mux.add(shv,online=online,ondone=done)
+    
+    @classmethod
+    def getJobStatusAsync(cls,mux,jobid,callback,ondone=None):
+        """
+        getJobStatus on a util.ShMultiplexer.  callback is called with the 
+        status as mux.run() gets it, from squeue, or else from sacct.  ondone
+        is called with None or the error.
+        """
+        squeueout = []
+        sacctout = []
+        procs = {}
+        
+        def finish(error):
+            if ondone is not None:
+                ondone(error)
+            elif error is not None:
+                raise error
+        
+        def sacct_done(error):
+            if procs['sacct'].returncode != 0:
+                finish(Exception("sacct failed %s" % ' '.join(procs['sacct'].sh)))
+                return
+            stdout = ''.join(sacctout)
+            logger.info("Status of jobid %s is %s" % (str(jobid),stdout))
+            callback(stdout)
+            finish(None)
+        
+        def squeue_done(error):
+            stdout = ''.join(squeueout)
+            if stdout.strip() != "":
+                logger.info("Status of jobid %s is %s" % (str(jobid),stdout))
+                callback(stdout)
+                finish(None)
+            else:
+                # Try sacct if squeue doesn't return anything
+                procs['sacct'] = mux.add(
+                    ['sacct','--jobs','%s.batch' % jobid,'--format','State','--noheader'],
+                    online=sacctout.append,ondone=sacct_done,check=False
+                )
+        
+        mux.add(
+            ['squeue','--jobs',str(jobid),'--noheader','--format','%T'],
+            online=squeueout.append,ondone=squeue_done,check=False
+        )
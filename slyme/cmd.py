@@ -8,9 +8,15 @@ import tempfile
 import subprocess, socket
 import time, datetime
 from hex import Command, ShellRunner, DefaultFileLogger, RunLog, RunHandler
+from slyme import Slurm
 
 SBATCH_NOSUBMIT_OPTIONS =  ['usage','help']
 
+SLURM_TERMINAL_STATES = ["CANCELLED","COMPLETED","FAILED","TIMEOUT","NODE_FAIL","SPECIAL_EXIT"]
+
+# Seconds a SlurmRunner's bulk status lookup is used before it's redone
+STATUS_TTL = 10
+
 class SbatchCommand(Command):
     """
     Modifications specific to Sbatch, including script generation
@@ -132,32 +138,36 @@ class SlurmRunner(ShellRunner):
     ShellRunner class that gets job ids instead of pids and uses squeue
     to determine status
     """
-    def __init__(self,logpath=None,verbose=0,usevenv=False):
+    def __init__(self,logpath=None,verbose=0,usevenv=False,squeuecache=None):
+        """
+        If squeuecache is a queuecache.SqueueCache, job states are looked up
+        in its snapshot of the queue rather than with squeue.
+        """
         super(self.__class__,self).__init__(logpath=logpath,verbose=verbose,usevenv=usevenv)
+        self.squeuecache = squeuecache
+        # The jobs to look up, and the last lookup of them
+        self.jobids = set()
+        self.statuses = {}
+        self.statusestime = None
 
     def getSlurmStatus(self,jobid):
-        checkcmd = "squeue -j %s --format=%%T -h" % jobid
-        if self.verbose > 1: 
-            print "checkcmd %s" % checkcmd
-        p = subprocess.Popen(checkcmd,shell=True,stdout=subprocess.PIPE,stderr=subprocess.PIPE)
-        (out,err) = p.communicate()
-        out = out.strip()
-        err = err.strip()
-        if self.verbose > 1:
-            print "squeue out %s err %s" % (out,err)
-        if out is not None and out != "":
-            # It's still running
-            return out
-        else:
-            # Get the result from sacct
-            sacctcmd = "sacct -j %s.batch --format=State -n" % jobid
-            p = subprocess.Popen(sacctcmd,shell=True,stdout=subprocess.PIPE,stderr=subprocess.PIPE)
-            (out,err) = p.communicate()
-            out = out.strip()
-            err = err.strip()
-            if self.verbose > 1:
-                print "sacct out is %s" % out
-            return out
+        """
+        Returns the status of a job, or '' if Slurm doesn't know it.
+        
+        Statuses come from one getSlurmStatuses lookup of every job this 
+        runner has submitted or been asked about, which is reused for 
+        STATUS_TTL seconds, so polling many runlogs one checkStatus at a 
+        time doesn't mean a squeue per job.
+        """
+        jobid = str(jobid)
+        now = time.time()
+        if jobid not in self.statuses or now - self.statusestime >= STATUS_TTL:
+            self.jobids.add(jobid)
+            self.statuses = self.getSlurmStatuses(sorted(self.jobids))
+            self.statusestime = now
+            # Jobs that have finished won't change
+            self.jobids = set(j for j,status in self.statuses.iteritems() if status not in SLURM_TERMINAL_STATES)
+        return self.statuses[jobid] or ''
         
     def checkStatus(self,runlog=None,proc=None):
         """
@@ -173,10 +183,33 @@ class SlurmRunner(ShellRunner):
                 return super(self.__class__,self).checkStatus(runlog,proc)
        
         result = self.getSlurmStatus(runlog["jobid"]) 
-        if result in ["CANCELLED","COMPLETED","FAILED","TIMEOUT","NODE_FAIL","SPECIAL_EXIT"]:
+        if result in SLURM_TERMINAL_STATES:
             return result
         else:
             return None
+    
+    def getSlurmStatuses(self,jobids):
+        """
+        getSlurmStatus for many jobs at once, with one squeue and one sacct
+        per Slurm.JOBS_PER_QUERY jobs.  Returns a dict of jobid to status.
+        """
+        statuses = Slurm.getJobStatuses(jobids,cache=self.squeuecache)
+        if self.verbose > 1:
+            print "statuses %s" % statuses
+        return statuses
+    
+    def checkStatuses(self,runlogs):
+        """
+        checkStatus for many runlogs, returning a list of the results in the
+        same order.  The Slurm jobs are all looked up together, as for
+        checkStatus.
+        """
+        for runlog in runlogs:
+            if runlog is not None and runlog.get("jobid") is not None:
+                self.jobids.add(str(runlog["jobid"]))
+        # Look them all up now, rather than reuse a lookup of only some of them
+        self.statuses = {}
+        return [self.checkStatus(runlog) for runlog in runlogs]
                  
     def getCmdString(self,cmd):
         """
@@ -275,9 +308,13 @@ class SlurmRunner(ShellRunner):
             while not ready:
                 time.sleep(2)
                 try:
-                    logger.getRunSet(runsetname)
+                    runset = logger.getRunSet(runsetname)
                     ready = True
                 except Exception:
                     pass
+            # So the first checkStatus looks up all of them
+            for runlog in runset:
+                if runlog.get("jobid") is not None:
+                    self.jobids.add(str(runlog["jobid"]))
         return runhandler    
 
@@ -0,0 +1,290 @@
+'''
+Copyright (c) 2014
+Harvard FAS Research Computing
+All rights reserved.
+
+Columnar storage of JobStep data.
+
+A JobStepTable keeps the parsed sacct rows as one typed array per JobStep
+attribute instead of one JobStep object per row.  Numbers are stored in
+array.array columns, strings are interned into a per-table pool and stored as
+indexes into it, and datetimes are stored as integer seconds.  A JobReportView
+is a JobReport that reads its steps out of a row range of a table.
+
+This is what Slurm.getJobReports(columnar=True) produces.  For a large
+history, this is an order of magnitude smaller than the JobStep objects, and
+the per-job aggregates (max of MaxRSS_kB, etc.) are computed over array
+slices rather than attribute lookups.
+'''
+import sys
+import calendar
+import logging
+from array import array
+from datetime import datetime
+from slyme.jobreports import JobReport, JobStep, JobSummary, JOBSUMMARY_FIRST_KEYS
+
+
+logger = logging.getLogger('slyme')
+
+
+#--- column kinds
+
+KIND_STR = 's'        #str or None, stored as an index into the string pool
+KIND_INT = 'i'        #int, never None
+KIND_NULLINT = 'n'    #int or None
+KIND_FLOAT = 'f'      #float, never None
+KIND_DATETIME = 't'   #datetime or None, stored as seconds since the epoch
+
+#array typecodes for each kind
+TYPECODES = {
+    KIND_STR      : 'l',
+    KIND_INT      : 'l',
+    KIND_NULLINT  : 'l',
+    KIND_FLOAT    : 'd',
+    KIND_DATETIME : 'l',
+}
+
+#stands in for None in KIND_NULLINT and KIND_DATETIME columns
+NULL_INT = -sys.maxint - 1
+
+#the JobStep attributes set by Slurm.getJobReports, and how they're stored
+COLUMNS = (
+    ('JobID'                 , KIND_STR),
+    ('JobStepName'           , KIND_STR),
+    ('User'                  , KIND_STR),
+    ('JobName'               , KIND_STR),
+    ('State'                 , KIND_STR),
+    ('CancelledBy'           , KIND_STR),
+    ('Partition'             , KIND_STR),
+    ('NCPUS'                 , KIND_INT),
+    ('NNodes'                , KIND_INT),
+    ('CPUTime'               , KIND_FLOAT),
+    ('TotalCPU'              , KIND_FLOAT),
+    ('UserCPU'               , KIND_FLOAT),
+    ('SystemCPU'             , KIND_FLOAT),
+    ('Elapsed'               , KIND_FLOAT),
+    ('Start'                 , KIND_DATETIME),
+    ('End'                   , KIND_DATETIME),
+    ('NodeList'              , KIND_STR),
+    ('ReqMem_bytes'          , KIND_NULLINT),
+    ('ReqMem_bytes_per_node' , KIND_NULLINT),
+    ('ReqMem_bytes_per_core' , KIND_NULLINT),
+    ('ReqMem_MB_total'       , KIND_NULLINT),
+    ('MaxRSS_kB'             , KIND_INT),
+    ('MaxRSS_MB'             , KIND_INT),
+    ('MaxVMSize_MB'          , KIND_INT),
+    ('AveVMSize_MB'          , KIND_INT),
+)
+
+
+def datetime_to_epoch(dt):
+    """Convert a naive datetime to integer seconds, or NULL_INT for None.
+
+    The datetime is treated as if it were UTC, so that the conversion is an
+    exact round trip with epoch_to_datetime regardless of the local timezone
+    and DST changes.
+    """
+    if dt is None:
+        return NULL_INT
+    return calendar.timegm(dt.timetuple())
+
+def epoch_to_datetime(t):
+    """Convert the output of datetime_to_epoch back to a datetime."""
+    if t == NULL_INT:
+        return None
+    return datetime.utcfromtimestamp(t)
+
+
+class StringIds(dict):
+    '''
+    dict of string to index in a string pool, that adds strings to the pool
+    when they're looked up for the first time
+    '''
+
+    def __init__(self,strings):
+        dict.__init__(self,((s,i) for i,s in enumerate(strings)))
+        self.strings = strings
+
+    def __missing__(self,s):
+        if isinstance(s,str):
+            s = intern(s)
+        i = self[s] = len(self.strings)
+        self.strings.append(s)
+        return i
+
+
+class JobStepTable(object):
+    '''
+    Typed, column-oriented storage for many JobSteps
+    '''
+
+    def __init__(self,attributes=None):
+        '''
+        Constructor.  Creates an empty table.
+        
+        attributes is the list of JobStep attributes to store (see 
+        SacctParser.attributes); by default, everything in COLUMNS.  Ones 
+        that aren't in COLUMNS are stored as strings.
+        '''
+        if attributes is None:
+            self.layout = COLUMNS
+        else:
+            kinds = dict(COLUMNS)
+            self.layout = tuple((name,kinds.get(name,KIND_STR)) for name in attributes)
+        self.kinds = dict(self.layout)
+        self.columns = dict((name,array(TYPECODES[kind])) for name,kind in self.layout)
+
+        #string pool; index 0 is always None
+        self.strings = [None]
+        self._string_ids = StringIds(self.strings)
+
+        self.nrows = 0
+
+    def __len__(self):
+        return self.nrows
+
+    def _string_id(self,s):
+        """
+        Return the pool index of the given string, adding it if necessary.
+        """
+        return self._string_ids[s]
+
+    def append(self,jobstep):
+        """
+        Add a row built from the attributes of the given JobStep.  Attributes
+        the JobStep does not have are stored as None.
+        """
+        for name,kind in self.layout:
+            value = jobstep[name]
+            if kind == KIND_STR:
+                value = self._string_id(value)
+            elif kind == KIND_NULLINT:
+                if value is None:
+                    value = NULL_INT
+            elif kind == KIND_DATETIME:
+                value = datetime_to_epoch(value)
+            self.columns[name].append(value)
+        self.nrows += 1
+
+    def column(self,name,start=0,end=None):
+        """
+        Return the raw array for the given column, or a slice of it.
+
+        String columns are string pool indexes, datetimes are integer seconds,
+        and None is NULL_INT.  These are plain array.arrays, so they can be
+        handed to numpy.frombuffer and the like without copying.
+        """
+        col = self.columns[name]
+        if start == 0 and end is None:
+            return col
+        return col[start:end]
+
+    def values(self,name,start=0,end=None):
+        """
+        Return the Python values of the given column for a range of rows.
+
+        int and float columns that can't contain None come back as the array
+        slice itself, since that's already what the caller wants.
+        """
+        kind = self.kinds[name]
+        col = self.columns[name][start:end]
+        if kind == KIND_STR:
+            strings = self.strings
+            return [strings[i] for i in col]
+        elif kind == KIND_NULLINT:
+            return [None if v == NULL_INT else v for v in col]
+        elif kind == KIND_DATETIME:
+            return [epoch_to_datetime(v) for v in col]
+        return col
+
+    def row(self,i):
+        """
+        Return a new JobStep for row i.
+        """
+        j = JobStep()
+        for name,kind in self.layout:
+            v = self.columns[name][i]
+            if kind == KIND_STR:
+                v = self.strings[v]
+            elif kind == KIND_NULLINT:
+                if v == NULL_INT:
+                    v = None
+            elif kind == KIND_DATETIME:
+                v = epoch_to_datetime(v)
+            setattr(j,name,v)
+        return j
+
+    def nbytes(self):
+        """
+        Approximate size of the column data, in bytes, not counting the
+        string pool.
+        """
+        return sum(col.itemsize * len(col) for col in self.columns.itervalues())
+
+
+class JobStepRows(object):
+    '''
+    Read-only sequence of JobSteps for a row range of a JobStepTable.
+
+    JobSteps are built on demand, so this is only for compatibility with code
+    that expects JobReport.jobsteps to be a list.
+    '''
+
+    def __init__(self,table,start,end):
+        self.table = table
+        self.start = start
+        self.end = end
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __getitem__(self,i):
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError("JobStep index out of range")
+        return self.table.row(self.start + i)
+
+    def __iter__(self):
+        for i in xrange(self.start,self.end):
+            yield self.table.row(i)
+
+
+class JobReportView(JobReport):
+    '''
+    JobReport backed by rows [start,end) of a JobStepTable rather than by a
+    list of JobStep objects
+    '''
+
+    def __init__(self,table,start,end):
+        '''
+        Constructor.  Takes the table and the row range of this job's steps.
+        '''
+        self.table = table
+        self.start = start
+        self.end = end
+
+    @property
+    def jobsteps(self):
+        return JobStepRows(self.table,self.start,self.end)
+
+    def _step_values(self,index):
+        # Same as a JobStep that doesn't have the attribute
+        if index not in self.table.columns:
+            return [None] * (self.end - self.start)
+        return self.table.values(index,self.start,self.end)
+
+    def _summarize(self):
+        # A column at a time, so the maxes are over array slices
+        summary = JobSummary()
+        for key,floor in JobReport.max_keys:
+            setattr(summary,key,max([floor] + list(self._step_values(key))))
+        for key in JOBSUMMARY_FIRST_KEYS:
+            first = None
+            for value in self._step_values(key):
+                if value is not None and value != '':
+                    first = value
+                    break
+            setattr(summary,key,first)
+        summary.JobName = self.get_JobName()
+        return summary
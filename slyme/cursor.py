@@ -0,0 +1,131 @@
+'''
+Copyright (c) 2014
+Harvard FAS Research Computing
+All rights reserved.
+
+Persistent "since last run" cursors for sacct queries.
+
+A SacctCursor remembers, per report name, the latest End time of the jobs a
+report has already processed.  Slurm.getJobReports(cursor=...) then only
+queries sacct from that point on and only yields finished jobs that have not
+been yielded before.  The new position is only saved when the cursor is
+committed, which happens automatically when a with block exits cleanly:
+
+    with SacctCursor('whitespace') as cursor:
+        for jr in Slurm.getJobReports(cursor=cursor, allusers=True):
+            ...
+
+If the consumer fails, nothing is saved and the next run sees the same jobs.
+'''
+import os
+import re
+import json
+import logging
+import tempfile
+from datetime import datetime
+from slyme.columnar import datetime_to_epoch, epoch_to_datetime
+from slyme.jobcache import is_terminal_state
+
+
+logger = logging.getLogger('slyme')
+
+
+DEFAULT_CURSOR_DIR = os.path.expanduser(os.path.join('~','.slyme','cursors'))
+
+#how far before the saved position to start the next query, in seconds, to
+#allow for jobs that reach slurmdbd a little after they end
+DEFAULT_OVERLAP = 300
+
+
+class SacctCursor(object):
+    '''
+    High-water mark of job End times for one named report
+    '''
+
+    def __init__(self,name,path=DEFAULT_CURSOR_DIR,overlap=DEFAULT_OVERLAP):
+        '''
+        Constructor.  Loads the cursor called name from the directory path,
+        if it has been saved before.
+        '''
+        if not re.match(r'^[\w.-]+$',name):
+            raise ValueError("Bad cursor name [%s]" % name)
+        self.name = name
+        self.path = path
+        self.overlap = overlap
+        self.filename = os.path.join(path,'%s.json' % name)
+
+        #committed state: the latest End (epoch seconds) and the JobIDs that
+        #ended within overlap seconds of it
+        self.mark = None
+        self.recent = {}
+
+        #uncommitted JobID -> End of jobs yielded since the last commit
+        self.uncommitted = {}
+
+        if os.path.exists(self.filename):
+            with open(self.filename,'r') as f:
+                state = json.load(f)
+            self.mark = state['mark']
+            self.recent = state['recent']
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,type,value,traceback):
+        if type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+    def starttime(self):
+        """
+        Return the datetime sacct queries should start from, or None if this
+        cursor has never been committed.
+        """
+        if self.mark is None:
+            return None
+        return epoch_to_datetime(self.mark - self.overlap)
+
+    def accept(self,jobreport):
+        """
+        Return True if the job has finished and has not been accepted before,
+        and note it so that it is included when the cursor is committed.
+        """
+        End = jobreport.End
+        if End is None or jobreport.State is None or not is_terminal_state(jobreport.State):
+            return False
+        t = datetime_to_epoch(End)
+        if self.mark is not None and t < self.mark - self.overlap:
+            return False
+        JobID = jobreport.JobID
+        if JobID in self.recent or JobID in self.uncommitted:
+            return False
+        self.uncommitted[JobID] = t
+        return True
+
+    def commit(self):
+        """
+        Advance the cursor past every accepted job and save it.
+        """
+        if self.uncommitted:
+            recent = dict(self.recent)
+            recent.update(self.uncommitted)
+            self.mark = max([self.mark] + recent.values())
+            self.recent = dict((k,t) for k,t in recent.iteritems() if t >= self.mark - self.overlap)
+            self.uncommitted = {}
+
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        # Write and rename, so that a crash never leaves a partial file
+        fd,tmpname = tempfile.mkstemp(dir=self.path,prefix='.%s.' % self.name)
+        with os.fdopen(fd,'w') as f:
+            json.dump({'mark' : self.mark, 'recent' : self.recent},f)
+        os.rename(tmpname,self.filename)
+        logger.debug("Committed sacct cursor %s at %s" % (self.name,self.mark))
+
+    def rollback(self):
+        """
+        Forget the jobs accepted since the last commit.
+        """
+        self.uncommitted = {}
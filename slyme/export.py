@@ -0,0 +1,182 @@
+'''
+Copyright (c) 2014
+Harvard FAS Research Computing
+All rights reserved.
+
+Bulk export of sacct job step accounting to columnar files.
+
+export_job_steps runs sacct once and reads its output batch_rows lines at a
+time, converting each batch into a JobStepTable a column at a time (see
+kernels.parse_table) and writing the table out as a record batch.  Memory use
+is bounded by the batch size no matter how large the time window is, and the
+values are the same ones getJobReports produces (seconds, kB, ReqMem totals,
+CancelledBy, etc.).
+
+The output formats are:
+
+    parquet     Parquet file (needs pyarrow)
+    arrow       Arrow IPC file (needs pyarrow)
+    jsonl       one JSON object per line: a schema line, then one line per
+                batch holding a list of values for each column
+
+Datetimes are written as seconds since the epoch, as in JobStepTable.
+'''
+import json
+import logging
+from slyme import Slurm
+from slyme.columnar import JobStepTable, NULL_INT, KIND_STR, KIND_INT, \
+    KIND_NULLINT, KIND_FLOAT, KIND_DATETIME
+from slyme.sacctparser import SacctParser, format_fields
+from slyme.kernels import parse_table
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+logger = logging.getLogger('slyme')
+
+
+FORMATS = ('parquet', 'arrow', 'jsonl')
+
+DEFAULT_BATCH_ROWS = 65536
+
+
+def default_format():
+    """Parquet if pyarrow is available, otherwise jsonl."""
+    if pyarrow is not None:
+        return 'parquet'
+    return 'jsonl'
+
+def column_values(table,name):
+    """
+    Return the values of a table column as a list, with datetimes left as
+    seconds since the epoch and None for nulls.
+    """
+    if table.kinds[name] == KIND_DATETIME:
+        return [None if v == NULL_INT else v for v in table.column(name)]
+    return list(table.values(name))
+
+
+class JSONLinesWriter(object):
+    '''
+    Writes batches as JSON lines.  This is the fallback when pyarrow is not
+    installed; read_jsonl_batches reads it back.
+    '''
+
+    def __init__(self,path,layout):
+        self.f = open(path,'w')
+        self.layout = layout
+        json.dump({'schema' : [list(c) for c in layout]},self.f)
+        self.f.write('\n')
+
+    def write(self,table):
+        columns = dict((name,column_values(table,name)) for name,kind in self.layout)
+        json.dump({'rows' : len(table), 'columns' : columns},self.f)
+        self.f.write('\n')
+
+    def close(self):
+        self.f.close()
+
+
+class ArrowWriter(object):
+    '''
+    Writes batches to an Arrow IPC file, or to a Parquet file with one row
+    group per batch.
+    '''
+
+    def __init__(self,path,layout,parquet=False):
+        if pyarrow is None:
+            raise Exception("pyarrow is required to write Arrow and Parquet files")
+        types = {
+            KIND_STR      : pyarrow.string(),
+            KIND_INT      : pyarrow.int64(),
+            KIND_NULLINT  : pyarrow.int64(),
+            KIND_FLOAT    : pyarrow.float64(),
+            KIND_DATETIME : pyarrow.timestamp('s'),
+        }
+        self.layout = layout
+        self.schema = pyarrow.schema([pyarrow.field(name,types[kind]) for name,kind in layout])
+        self.parquet = parquet
+        if parquet:
+            self.writer = pyarrow.parquet.ParquetWriter(path,self.schema)
+        else:
+            self.writer = pyarrow.ipc.new_file(path,self.schema)
+
+    def write(self,table):
+        arrays = [
+            pyarrow.array(column_values(table,name),type=field.type)
+            for (name,kind),field in zip(self.layout,self.schema)
+        ]
+        batch = pyarrow.RecordBatch.from_arrays(arrays,schema=self.schema)
+        if self.parquet:
+            self.writer.write_table(pyarrow.Table.from_batches([batch]))
+        else:
+            self.writer.write_batch(batch)
+
+    def close(self):
+        self.writer.close()
+
+
+def open_writer(path,layout,format):
+    """Return a writer for the given format."""
+    if format == 'jsonl':
+        return JSONLinesWriter(path,layout)
+    if format == 'parquet':
+        return ArrowWriter(path,layout,parquet=True)
+    if format == 'arrow':
+        return ArrowWriter(path,layout)
+    raise Exception("Unknown export format [%s], use one of %s" % (format,', '.join(FORMATS)))
+
+def export_job_steps(path,format=None,batch_rows=DEFAULT_BATCH_ROWS,fields=None,parser=None,**kwargs):
+    """
+    Run sacct with the given parameters and write every job step to path.
+    Returns the number of rows written.
+
+    format is one of FORMATS; by default, Parquet if pyarrow is available and
+    jsonl otherwise.  fields are the JobReport keys to export, as for
+    Slurm.getJobReports; by default, everything.  Other keyword arguments
+    are passed to sacct, as for getJobReports.
+    """
+    if format is None:
+        format = default_format()
+    if parser is None:
+        if fields is None:
+            parser = SacctParser(Slurm._sacct_format_parsable.split(','))
+        else:
+            parser = SacctParser(format_fields(fields))
+
+    writer = open_writer(path,JobStepTable(parser.attributes).layout,format)
+    nrows = 0
+    try:
+        blocks = Slurm._yield_raw_sacct_job_text_blocks(fields=parser.fields,**kwargs)
+        lines = []
+        for saccttext in blocks:
+            lines.extend(line for line in saccttext.split('\n') if line.strip())
+            if len(lines) >= batch_rows:
+                table = parse_table(lines[:batch_rows],parser)
+                del lines[:batch_rows]
+                writer.write(table)
+                nrows += len(table)
+        if lines or nrows == 0:
+            table = parse_table(lines,parser)
+            writer.write(table)
+            nrows += len(table)
+    finally:
+        writer.close()
+
+    logger.info("Exported %d job steps to %s" % (nrows,path))
+    return nrows
+
+def read_jsonl_batches(path):
+    """
+    Yield a dict of column name to list of values for each batch in a jsonl
+    export.
+    """
+    with open(path) as f:
+        f.readline()
+        for line in f:
+            yield json.loads(line)['columns']
@@ -0,0 +1,249 @@
+'''
+Copyright (c) 2014
+Harvard FAS Research Computing
+All rights reserved.
+
+Slurm hostlist expressions, e.g. the NodeList holy2a[01-04,07],holybigmem08.
+
+expand turns an expression into the list of node names and compress does the
+reverse.  Node names are interned, and expanding the same expression again
+returns the same frozenset from node_set without parsing it, since a long
+history has many jobs but comparatively few distinct NodeLists.
+
+A NodeIndex numbers node names so that a set of nodes can also be a bitmap
+(a Python int with bit i set for node i).  JobReport.nodes and
+JobReport.node_bitmap use these, so per-node questions over many jobs are set
+and bitwise operations rather than string parsing.
+'''
+import re
+import logging
+
+
+logger = logging.getLogger('slyme')
+
+
+#NodeList values that mean no nodes
+EMPTY = ('', 'None assigned', '(null)')
+
+#node_set results kept, before the cache is cleared
+CACHE_SIZE = 100000
+
+_range_re = re.compile(r'^(\d+)(?:-(\d+))?$')
+_numbered_re = re.compile(r'^(.*?)(\d+)$')
+
+
+def split(hostlist):
+    """
+    Split a hostlist on the commas that are not inside brackets.
+    """
+    parts = []
+    depth = 0
+    start = 0
+    for i,c in enumerate(hostlist):
+        if c == '[':
+            depth += 1
+        elif c == ']':
+            depth -= 1
+        elif c == ',' and depth == 0:
+            parts.append(hostlist[start:i])
+            start = i + 1
+    parts.append(hostlist[start:])
+    return [p for p in parts if p != '']
+
+def _expand_ranges(ranges):
+    """
+    Expand the inside of a bracket, e.g. 01-04,07, to a list of strings,
+    keeping the zero padding.
+    """
+    values = []
+    for r in ranges.split(','):
+        m = _range_re.match(r)
+        if m is None:
+            raise ValueError("Bad hostlist range [%s]" % r)
+        first,last = m.groups()
+        if last is None:
+            values.append(first)
+            continue
+        width = len(first)
+        for i in xrange(int(first),int(last)+1):
+            values.append('%0*d' % (width,i))
+    return values
+
+def _expand_one(expression):
+    """
+    Expand one comma-free hostlist expression, which may have several bracket
+    groups (e.g. rack[1-2]node[01-02]).
+    """
+    names = ['']
+    rest = expression
+    while rest:
+        i = rest.find('[')
+        if i < 0:
+            names = [n + rest for n in names]
+            break
+        j = rest.find(']',i)
+        if j < 0:
+            raise ValueError("Unbalanced brackets in hostlist [%s]" % expression)
+        prefix = rest[:i]
+        values = _expand_ranges(rest[i+1:j])
+        names = [n + prefix + v for n in names for v in values]
+        rest = rest[j+1:]
+    return names
+
+def expand(hostlist):
+    """
+    Return the list of node names in a hostlist expression, in order.
+    """
+    if hostlist is None or hostlist in EMPTY:
+        return []
+    names = []
+    for expression in split(hostlist):
+        names.extend(intern(str(n)) for n in _expand_one(expression))
+    return names
+
+_node_sets = {}
+
+def node_set(hostlist):
+    """
+    Return the frozenset of node names in a hostlist expression.  Results
+    are cached, so jobs with the same NodeList share one set.
+    """
+    try:
+        return _node_sets[hostlist]
+    except KeyError:
+        if len(_node_sets) >= CACHE_SIZE:
+            _node_sets.clear()
+        nodes = _node_sets[hostlist] = frozenset(expand(hostlist))
+        return nodes
+
+def _ranges(numbers):
+    """
+    Return the insides of a bracket, e.g. ['08-10', '12'], for a set of
+    number strings.
+
+    A range's width is that of its first number, as in expand, so a run of
+    zero padded numbers carries on into numbers of that natural width
+    (08-10), but 8 and 08 never share a range.
+    """
+    runs = []
+    current = {}  #width -> the latest run of that width
+    for number in sorted(numbers, key=lambda s: (int(s),len(s))):
+        n = int(number)
+        if len(number) > 1 and number[0] == '0':
+            widths = [len(number)]
+        else:
+            #any width up to its own prints it unchanged
+            widths = range(len(number),0,-1)
+        for width in widths:
+            run = current.get(width)
+            if run is not None and run[2] == n - 1:
+                run[2] = n
+                break
+        else:
+            run = current[len(number)] = [len(number),n,n]
+            runs.append(run)
+
+    ranges = []
+    for width,first,last in runs:
+        if first == last:
+            ranges.append('%0*d' % (width,first))
+        else:
+            ranges.append('%0*d-%0*d' % (width,first,width,last))
+    return ranges
+
+def compress(names):
+    """
+    Return a hostlist expression for the given node names.
+
+    Names ending in a number are grouped by prefix into bracketed ranges;
+    others are listed as is.  Prefixes come out in the order they're first
+    seen, numbers in increasing order, and duplicates are dropped, so
+    compress(expand(hostlist)) gives back a hostlist written that way.
+    """
+    groups = {}
+    order = []
+    for name in names:
+        m = _numbered_re.match(name)
+        if m is None:
+            key = (name,False)
+        else:
+            key = (m.group(1),True)
+        if key not in groups:
+            groups[key] = set()
+            order.append(key)
+        if m is not None:
+            groups[key].add(m.group(2))
+
+    parts = []
+    for prefix,numbered in order:
+        if not numbered:
+            parts.append(prefix)
+            continue
+        ranges = _ranges(groups[(prefix,numbered)])
+        if len(ranges) == 1 and '-' not in ranges[0]:
+            parts.append(prefix + ranges[0])
+        else:
+            parts.append('%s[%s]' % (prefix,','.join(ranges)))
+    return ','.join(parts)
+
+
+class NodeIndex(object):
+    '''
+    Numbering of node names, for representing sets of nodes as bitmaps
+    '''
+
+    def __init__(self):
+        self.names = []
+        self.numbers = {}
+        self.bitmaps = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def number(self,name):
+        """
+        Return the number of the given node name, adding it if necessary.
+        """
+        try:
+            return self.numbers[name]
+        except KeyError:
+            i = self.numbers[intern(str(name))] = len(self.names)
+            self.names.append(name)
+            return i
+
+    def bitmap(self,names):
+        """
+        Return the bitmap of the given node names.
+        """
+        bitmap = 0
+        for name in names:
+            bitmap |= 1 << self.number(name)
+        return bitmap
+
+    def hostlist_bitmap(self,hostlist):
+        """
+        Return the bitmap of the nodes in a hostlist expression.  Results are
+        cached, like node_set's.
+        """
+        try:
+            return self.bitmaps[hostlist]
+        except KeyError:
+            if len(self.bitmaps) >= CACHE_SIZE:
+                self.bitmaps.clear()
+            bitmap = self.bitmaps[hostlist] = self.bitmap(node_set(hostlist))
+            return bitmap
+
+    def nodes(self,bitmap):
+        """
+        Return the list of node names in a bitmap, in number order.
+        """
+        names = []
+        while bitmap:
+            low = bitmap & -bitmap
+            names.append(self.names[low.bit_length() - 1])
+            bitmap ^= low
+        return names
+
+
+#the NodeIndex used by default
+NODES = NodeIndex()
@@ -0,0 +1,250 @@
+# Copyright (c) 2013-2014
+# Harvard FAS Research Computing
+# All rights reserved.
+
+"""cheap, repeatable readings of this host's resource usage
+
+This is for agents that sample every second or so.  Facts that don't change
+(the number of cores) are read once and cached, and /proc/loadavg,
+/proc/meminfo, and /proc/stat are opened once and re-read from the start
+each time (Python 2 has no os.pread, so that's an lseek and a read), with
+just the needed values picked out by regular expression instead of
+splitting every line.
+
+HostMetrics.cpu_utilization() is the busy fraction of the cpus since the
+previous call, from the /proc/stat counters, and job_usage() reads the
+cpu and memory usage of each Slurm job from its cgroup.
+
+HOST is the instance used by util.get_cpu and util.get_mem.  Its open files
+belong to the process that opened them; a forked child (e.g. a
+multiprocessing.Pool worker) that inherits them opens its own on first
+use, so parent and child never share a file offset.
+"""
+
+
+import os, re, time, threading
+
+
+#--- parsing
+
+#/proc/meminfo values that count as free memory
+MEMINFO_FREE = ('MemFree', 'Buffers', 'Cached', 'SwapCached')
+
+_meminfo_re = re.compile(r'^(MemTotal|MemFree|Buffers|Cached|SwapCached):\s+(\d+)', re.M)
+
+def parse_meminfo(text):
+	"""Return [total memory in kB, used memory in kB] from /proc/meminfo text.
+
+	The used memory does not count Buffers, Cached, and SwapCached.
+	"""
+	values = dict(_meminfo_re.findall(text))
+	total = int(values.get('MemTotal', 0))
+	free = sum(int(values.get(k, 0)) for k in MEMINFO_FREE)
+	return total, total - free
+
+def parse_loadavg(text):
+	"""Return the number of running tasks from /proc/loadavg text, less one
+	for the process asking."""
+	#e.g. 52.10 52.07 52.04 53/2016 54847 -> 53-1 = 52
+	return max(int(text.split()[3].split('/')[0]) - 1, 0)
+
+def parse_stat(text):
+	"""Return the aggregate cpu line of /proc/stat text as (busy, total)
+	jiffies."""
+	fields = text[:text.index('\n')].split()
+	times = [int(f) for f in fields[1:]]
+	#user nice system idle iowait irq softirq steal [guest guest_nice], and
+	#guest time is already counted in user and nice
+	times = times[:8]
+	idle = sum(times[3:5])
+	total = sum(times)
+	return total - idle, total
+
+def parse_cpu_list(text):
+	"""Return the number of cpus in a list like 0-3,8,10-11."""
+	n = 0
+	for part in text.strip().split(','):
+		if part=='':
+			continue
+		if '-' in part:
+			first, last = part.split('-')
+			n += int(last) - int(first) + 1
+		else:
+			n += 1
+	return n
+
+
+#--- reading
+
+class ProcFile(object):
+	"""A file, e.g. in /proc, that's opened once and re-read from the start."""
+
+	BLOCK_SIZE = 65536
+
+	def __init__(self, path):
+		self.path = path
+		self.fd = os.open(path, os.O_RDONLY)
+		self.lock = threading.Lock()
+
+	def read(self):
+		with self.lock:
+			os.lseek(self.fd, 0, os.SEEK_SET)
+			blocks = []
+			while True:
+				s = os.read(self.fd, self.BLOCK_SIZE)
+				if s=='':
+					break
+				blocks.append(s)
+		return ''.join(blocks)
+
+	def close(self):
+		os.close(self.fd)
+
+def read_file(path):
+	with open(path, 'r') as f:
+		return f.read()
+
+
+#root of the Slurm job cgroups: cgroup v1 has a hierarchy per controller,
+#cgroup v2 has one, under slurmstepd's scope
+CGROUP_V1_CPU = '/sys/fs/cgroup/cpuacct/slurm'
+CGROUP_V1_MEMORY = '/sys/fs/cgroup/memory/slurm'
+CGROUP_V2 = '/sys/fs/cgroup/system.slice/slurmstepd.scope'
+
+_usage_usec_re = re.compile(r'^usage_usec\s+(\d+)', re.M)
+
+class HostMetrics(object):
+	"""Readings of this host's cpu, memory, and Slurm job usage."""
+
+	def __init__(self, proc='/proc', cgroup_v1_cpu=CGROUP_V1_CPU, cgroup_v1_memory=CGROUP_V1_MEMORY, cgroup_v2=CGROUP_V2):
+		self.proc = proc
+		self.cgroup_v1_cpu = cgroup_v1_cpu
+		self.cgroup_v1_memory = cgroup_v1_memory
+		self.cgroup_v2 = cgroup_v2
+		self._files = {}
+		self._pid = os.getpid()
+		self._cores = None
+		self._last_stat = None
+		self._last_jobs = {}
+
+	def _read(self, name):
+		if os.getpid()!=self._pid:
+			#forked since the files were opened; the descriptors are this
+			#process's copies, so closing them leaves the parent's alone
+			self.close()
+			self._pid = os.getpid()
+		try:
+			f = self._files[name]
+		except KeyError:
+			f = self._files[name] = ProcFile(os.path.join(self.proc, name))
+		return f.read()
+
+	def close(self):
+		for f in self._files.itervalues():
+			f.close()
+		self._files.clear()
+
+	#--- static facts
+
+	def cores(self):
+		"""The number of online cpus (cached)."""
+		if self._cores is None:
+			try:
+				self._cores = os.sysconf('SC_NPROCESSORS_ONLN')
+			except (ValueError, OSError):
+				self._cores = read_file(os.path.join(self.proc, 'cpuinfo')).count('\nprocessor') + 1
+		return self._cores
+
+	def cores_allowed(self):
+		"""The number of cpus this process may run on, e.g. within a job's
+		cpuset (cached)."""
+		if not hasattr(self, '_cores_allowed'):
+			self._cores_allowed = self.cores()
+			for line in read_file(os.path.join(self.proc, 'self', 'status')).splitlines():
+				if line.startswith('Cpus_allowed_list:'):
+					self._cores_allowed = parse_cpu_list(line.split(':', 1)[1])
+					break
+		return self._cores_allowed
+
+	#--- readings
+
+	def running_tasks(self):
+		"""The number of running tasks, less this process (see util.get_cpu)."""
+		return parse_loadavg(self._read('loadavg'))
+
+	def memory(self):
+		"""[total memory in kB, used memory in kB] (see util.get_mem)."""
+		return parse_meminfo(self._read('meminfo'))
+
+	def cpu_utilization(self):
+		"""The fraction of the cpus' time that was busy since the last call,
+		or since boot on the first call."""
+		busy, total = parse_stat(self._read('stat'))
+		last = self._last_stat
+		self._last_stat = busy, total
+		if last is not None:
+			busy, total = busy - last[0], total - last[1]
+		if total <= 0:
+			return 0.0
+		return float(busy) / total
+
+	#--- Slurm jobs
+
+	def _job_dirs(self):
+		"""Yield (JobID, cpu cgroup dir, memory cgroup dir) for each job."""
+		if os.path.isdir(self.cgroup_v2):
+			for name in os.listdir(self.cgroup_v2):
+				if name.startswith('job_'):
+					path = os.path.join(self.cgroup_v2, name)
+					yield name[4:], path, path
+			return
+		if os.path.isdir(self.cgroup_v1_cpu):
+			for uid in os.listdir(self.cgroup_v1_cpu):
+				if not uid.startswith('uid_'):
+					continue
+				for name in os.listdir(os.path.join(self.cgroup_v1_cpu, uid)):
+					if name.startswith('job_'):
+						yield name[4:], os.path.join(self.cgroup_v1_cpu, uid, name), os.path.join(self.cgroup_v1_memory, uid, name)
+
+	def _job_cpu_seconds(self, path):
+		if os.path.exists(os.path.join(path, 'cpu.stat')):
+			m = _usage_usec_re.search(read_file(os.path.join(path, 'cpu.stat')))
+			return int(m.group(1)) / 1e6
+		return int(read_file(os.path.join(path, 'cpuacct.usage'))) / 1e9
+
+	def _job_memory_bytes(self, path):
+		for name in ('memory.current', 'memory.usage_in_bytes'):
+			if os.path.exists(os.path.join(path, name)):
+				return int(read_file(os.path.join(path, name)))
+		return None
+
+	def job_usage(self):
+		"""Return a dict of JobID to (cpu seconds, cores in use, memory bytes)
+		for each Slurm job on this host.
+
+		cores in use is the cpu seconds used since the last call, per second,
+		or None on the first call for a job.
+		"""
+		now = time.time()
+		usage = {}
+		last_jobs = {}
+		for JobID, cpu_path, memory_path in self._job_dirs():
+			try:
+				cpu = self._job_cpu_seconds(cpu_path)
+				memory = self._job_memory_bytes(memory_path)
+			except (IOError, OSError, ValueError, AttributeError):
+				#the job ended while it was being read
+				continue
+			cores = None
+			if JobID in self._last_jobs:
+				t, last_cpu = self._last_jobs[JobID]
+				if now > t:
+					cores = (cpu - last_cpu) / (now - t)
+			last_jobs[JobID] = now, cpu
+			usage[JobID] = cpu, cores, memory
+		self._last_jobs = last_jobs
+		return usage
+
+
+#the instance used by util
+HOST = HostMetrics()
@@ -0,0 +1,153 @@
+'''
+Copyright (c) 2014
+Harvard FAS Research Computing
+All rights reserved.
+
+Persistent cache of sacct accounting text for finished jobs.
+
+Once a job reaches a terminal state its sacct record never changes, so there
+is no reason to ask slurmdbd for it again.  A JobCache is a SQLite file that
+stores the raw sacct text of such jobs, along with which time ranges have
+already been fetched (per distinct set of sacct arguments) and which jobs
+were still unfinished when they were last seen.
+
+Slurm.getJobReports(cache=...) uses this to only run sacct for the parts of
+the starttime/endtime window that haven't been fetched before, plus one
+sacct --jobs query to refresh the unfinished jobs.
+'''
+import logging
+import sqlite3
+
+
+logger = logging.getLogger('slyme')
+
+
+#states a job never leaves
+TERMINAL_STATES = (
+    'BOOT_FAIL',
+    'CANCELLED',
+    'COMPLETED',
+    'FAILED',
+    'NODE_FAIL',
+    'PREEMPTED',
+    'TIMEOUT',
+)
+
+def is_terminal_state(State):
+    """
+    True if the sacct State is final.  "CANCELLED by <uid>" counts.
+    """
+    return State.split(' ',1)[0] in TERMINAL_STATES
+
+
+class JobCache(object):
+    '''
+    SQLite-backed store of finished jobs' sacct text
+
+    Times are integer seconds, as produced by columnar.datetime_to_epoch.
+    Everything is scoped by a query string, which identifies the sacct
+    arguments (other than the time window) the data was fetched with.
+    '''
+
+    def __init__(self,path):
+        '''
+        Constructor.  Takes the path of the SQLite file, which is created if
+        it does not exist.
+        '''
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript('''
+            create table if not exists jobs (
+                query text, JobID text, Start integer, End integer, State text, sacct text,
+                primary key (query, JobID)
+            );
+            create index if not exists jobs_end on jobs (query, End);
+            create table if not exists coverage (
+                query text, start integer, end integer
+            );
+            create table if not exists pending (
+                query text, JobID text,
+                primary key (query, JobID)
+            );
+        ''')
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    #--- covered time ranges
+
+    def coverage(self,query):
+        """
+        Return the sorted, non-overlapping (start,end) ranges already fetched.
+        """
+        return self.conn.execute(
+            'select start, end from coverage where query = ? order by start',(query,)
+        ).fetchall()
+
+    def uncovered(self,query,start,end):
+        """
+        Return the sub-ranges of [start,end] that have not been fetched.
+        """
+        gaps = []
+        for s,e in self.coverage(query):
+            if e < start:
+                continue
+            if s > end:
+                break
+            if s > start:
+                gaps.append((start,s))
+            start = max(start,e)
+        if start < end:
+            gaps.append((start,end))
+        return gaps
+
+    def add_coverage(self,query,start,end):
+        """
+        Record [start,end] as fetched, merging it with any ranges it touches.
+        """
+        if end <= start:
+            return
+        for s,e in self.coverage(query):
+            if e >= start and s <= end:
+                start = min(start,s)
+                end = max(end,e)
+        self.conn.execute(
+            'delete from coverage where query = ? and end >= ? and start <= ?',(query,start,end)
+        )
+        self.conn.execute('insert into coverage values (?, ?, ?)',(query,start,end))
+        self.conn.commit()
+
+    #--- jobs
+
+    def store(self,query,JobID,Start,End,State,sacct):
+        """
+        Save a finished job's sacct text, and forget that it was pending.
+        """
+        self.conn.execute(
+            'insert or replace into jobs values (?, ?, ?, ?, ?, ?)',(query,JobID,Start,End,State,sacct)
+        )
+        self.conn.execute('delete from pending where query = ? and JobID = ?',(query,JobID))
+
+    def add_pending(self,query,JobID):
+        """
+        Note a job that was seen in a state that might still change.
+        """
+        self.conn.execute('insert or ignore into pending values (?, ?)',(query,JobID))
+
+    def pending(self,query):
+        return [r[0] for r in self.conn.execute('select JobID from pending where query = ?',(query,))]
+
+    def texts(self,query,start,end):
+        """
+        Yield (JobID,sacct text) for cached jobs active at some point in
+        [start,end], in JobID order.
+        """
+        for row in self.conn.execute(
+            'select JobID, sacct from jobs where query = ? and End >= ? and Start <= ? order by length(JobID), JobID',
+            (query,start,end)
+        ):
+            yield row
+
+    def commit(self):
+        self.conn.commit()
@@ -0,0 +1,273 @@
+'''
+Copyright (c) 2014
+Harvard FAS Research Computing
+All rights reserved.
+
+Persistent index of jobs by node, user, partition, and time.
+
+A JobIndex is a SQLite file with one row per job (JobID, User, Partition,
+State, Start, End, NodeList) and one row per (node, job) pair, with the
+NodeList expanded by hostlist.  It answers questions like "which jobs ran on
+holy2a18206 between T1 and T2" with index lookups rather than a sacct scan
+and string matching.
+
+Time overlap queries use the Start index: a job that overlaps [start,end]
+must have started no earlier than start minus the longest duration of any
+finished job in the index, so only that range of Starts has to be looked at,
+plus the jobs that have not ended.
+
+Jobs are added with add(), or fetched with update(), which only asks sacct
+for the jobs that ended since the last update (and refreshes the ones that
+were still running then).
+'''
+import logging
+import sqlite3
+from slyme import Slurm, jobid_sort_key
+from slyme import hostlist
+from slyme.columnar import datetime_to_epoch, epoch_to_datetime
+from slyme.jobcache import is_terminal_state
+
+
+logger = logging.getLogger('slyme')
+
+
+#the JobReport keys stored
+INDEX_FIELDS = ['JobID','User','Partition','State','Start','End','NodeList']
+
+#how far before the last update the next one starts, in seconds
+DEFAULT_OVERLAP = 300
+
+#most node names in one query, under SQLite's default limit of 999 variables
+NODES_PER_QUERY = 500
+
+
+class JobIndex(object):
+    '''
+    SQLite-backed index of jobs by node, user, partition, and time
+
+    Times are integer seconds, as produced by columnar.datetime_to_epoch, but
+    the methods take and return datetimes.
+    '''
+
+    def __init__(self,path):
+        '''
+        Constructor.  Takes the path of the SQLite file, which is created if
+        it does not exist.
+        '''
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript('''
+            create table if not exists jobs (
+                JobID text primary key, User text, Partition text, State text,
+                Start integer, End integer, NodeList text
+            );
+            create index if not exists jobs_start on jobs (Start);
+            create index if not exists jobs_user on jobs (User, Start);
+            create index if not exists jobs_partition on jobs (Partition, Start);
+            create table if not exists job_nodes (
+                node text, JobID text,
+                primary key (node, JobID)
+            );
+            create index if not exists job_nodes_jobid on job_nodes (JobID);
+            create table if not exists meta (
+                key text primary key, value integer
+            );
+        ''')
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def commit(self):
+        self.conn.commit()
+
+    def __len__(self):
+        return self.conn.execute('select count(*) from jobs').fetchone()[0]
+
+    #--- bookkeeping
+
+    def _get_meta(self,key):
+        row = self.conn.execute('select value from meta where key = ?',(key,)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def _set_meta(self,key,value):
+        self.conn.execute('insert or replace into meta values (?, ?)',(key,value))
+
+    def max_duration(self):
+        """
+        Return the longest End - Start of any finished job, in seconds.
+        """
+        return self._get_meta('max_duration') or 0
+
+    def mark(self):
+        """
+        Return the latest End of any finished job, as a datetime, or None if
+        there are none.
+        """
+        mark = self._get_meta('mark')
+        if mark is None:
+            return None
+        return epoch_to_datetime(mark)
+
+    #--- adding jobs
+
+    def add(self,jobreport):
+        """
+        Add or replace a job.  Running jobs are stored without an End, and
+        replaced when they're added again later.
+        """
+        JobID = jobreport.JobID
+        if JobID is None:
+            return
+        Start = jobreport.Start
+        End = jobreport.End
+        State = jobreport.State
+        if End is not None and not (State is not None and is_terminal_state(State)):
+            End = None
+        start = None
+        if Start is not None:
+            start = datetime_to_epoch(Start)
+        end = None
+        if End is not None:
+            end = datetime_to_epoch(End)
+            if start is None:
+                start = end
+
+        self.conn.execute(
+            'insert or replace into jobs values (?, ?, ?, ?, ?, ?, ?)',
+            (JobID,jobreport.User,jobreport.Partition,State,start,end,jobreport.NodeList)
+        )
+        self.conn.execute('delete from job_nodes where JobID = ?',(JobID,))
+        self.conn.executemany(
+            'insert or ignore into job_nodes values (?, ?)',
+            [(node,JobID) for node in hostlist.node_set(jobreport.NodeList)]
+        )
+
+        if end is not None:
+            if end - start > self.max_duration():
+                self._set_meta('max_duration',end - start)
+            mark = self._get_meta('mark')
+            if mark is None or end > mark:
+                self._set_meta('mark',end)
+
+    def add_all(self,jobreports):
+        """
+        Add each of the jobs, and commit.  Returns the number added.
+        """
+        n = 0
+        for jr in jobreports:
+            if jr.JobID is not None:
+                self.add(jr)
+                n += 1
+        self.commit()
+        return n
+
+    def update(self,starttime=None,overlap=DEFAULT_OVERLAP,**kwargs):
+        """
+        Fetch jobs from sacct and add them.  Returns the number added.
+
+        The sacct window starts at starttime, or else overlap seconds before
+        the latest End seen so far; a starttime is required the first time.
+        Jobs that were still running the last time are looked up by JobID.
+        Other keyword arguments are passed to Slurm.getJobReports.
+        """
+        if starttime is None:
+            mark = self._get_meta('mark')
+            if mark is None:
+                raise Exception("A starttime is required to build a new job index")
+            starttime = Slurm.datetime_to_slurm_timestamp(epoch_to_datetime(mark - overlap))
+        running = [r[0] for r in self.conn.execute('select JobID from jobs where End is null')]
+
+        n = self.add_all(Slurm.getJobReports(fields=INDEX_FIELDS,compact=True,starttime=starttime,**kwargs))
+        for i in range(0,len(running),Slurm.JOBS_PER_QUERY):
+            jobs = ','.join(running[i:i+Slurm.JOBS_PER_QUERY])
+            n += self.add_all(Slurm.getJobReports(fields=INDEX_FIELDS,compact=True,jobs=jobs,**kwargs))
+        logger.info("Added %d jobs to the job index %s" % (n,self.path))
+        return n
+
+    #--- queries
+
+    def jobs(self,node=None,user=None,partition=None,start=None,end=None):
+        """
+        Return the sorted JobIDs of the jobs matching all of the given
+        criteria.  node may be a node name or a hostlist expression, in which
+        case jobs that ran on any of its nodes match.  start and end are
+        datetimes; jobs that were running at any time within them match.
+
+        A hostlist of more than NODES_PER_QUERY nodes is looked up that many
+        nodes at a time.
+        """
+        conditions = []
+        args = []
+        if user is not None:
+            conditions.append('User = ?')
+            args.append(user)
+        if partition is not None:
+            conditions.append('Partition = ?')
+            args.append(partition)
+
+        if start is None and end is None:
+            selects = ['select JobID from jobs']
+            selectargs = [[]]
+        else:
+            s = datetime_to_epoch(start) if start is not None else None
+            e = datetime_to_epoch(end) if end is not None else None
+            finished = ['End is not null']
+            finishedargs = []
+            running = ['End is null']
+            runningargs = []
+            if s is not None:
+                #nothing that started before this can have lasted until start
+                finished.append('Start >= ? and End >= ?')
+                finishedargs.extend([s - self.max_duration(),s])
+            if e is not None:
+                finished.append('Start <= ?')
+                finishedargs.append(e)
+                running.append('Start <= ?')
+                runningargs.append(e)
+            selects = [
+                'select JobID from jobs where ' + ' and '.join(finished),
+                'select JobID from jobs where ' + ' and '.join(running),
+            ]
+            selectargs = [finishedargs,runningargs]
+
+        chunks = [None]
+        if node is not None:
+            nodes = sorted(hostlist.node_set(node))
+            chunks = [nodes[i:i+NODES_PER_QUERY] for i in range(0,len(nodes),NODES_PER_QUERY)]
+
+        JobIDs = set()
+        for chunk in chunks:
+            chunkconditions = list(conditions)
+            chunkargs = list(args)
+            if chunk is not None:
+                chunkconditions.append('JobID in (select JobID from job_nodes where node in (%s))' % ','.join('?' * len(chunk)))
+                chunkargs.extend(chunk)
+            for select,selectarg in zip(selects,selectargs):
+                if chunkconditions:
+                    joiner = ' and ' if ' where ' in select else ' where '
+                    select += joiner + ' and '.join(chunkconditions)
+                for row in self.conn.execute(select,selectarg + chunkargs):
+                    JobIDs.add(row[0])
+        return sorted(JobIDs,key=jobid_sort_key)
+
+    def job(self,JobID):
+        """
+        Return a dict of the stored values of the given job, or None.
+        """
+        row = self.conn.execute('select * from jobs where JobID = ?',(JobID,)).fetchone()
+        if row is None:
+            return None
+        d = dict(zip(INDEX_FIELDS,row))
+        for key in ('Start','End'):
+            if d[key] is not None:
+                d[key] = epoch_to_datetime(d[key])
+        return d
+
+    def nodes(self,JobID):
+        """
+        Return the set of nodes the given job ran on.
+        """
+        return set(r[0] for r in self.conn.execute('select node from job_nodes where JobID = ?',(JobID,)))
@@ -12,6 +12,7 @@ import logging
 import re
 from datetime import datetime
 from slyme.util import runsh_i
+from slyme import hostlist
 
 
 logger = logging.getLogger('slyme')
@@ -29,11 +30,7 @@ class JobStep(object):
         '''
                 
     def __getitem__(self, index):
-        logger.debug("Looking for %s in JobStep" % index)
-        if index in self.__dict__:
-            return self.__dict__[index]
-        else:
-            return None
+        return self.__dict__.get(index)
 
 
 
@@ -173,15 +170,153 @@ class JobReport(object):
         'AveVMSize_MB',
         #Average amount of virtual memory used in MB.
     ]
+    
+    # How each of the keys is aggregated over the JobSteps.  Keys that are
+    # the max of the steps, with the value used if all the steps are smaller
+    # (this is the only place these are defined; see _summarize)
+    max_keys = (
+        ('MaxRSS_kB'    , -1),
+        ('MaxRSS_MB'    , -1),
+        ('MaxVMSize_MB' , -1),
+        ('AveVMSize_MB' , -1),
+        ('NCPUS'        , 0),
+        ('CPUTime'      , 0),
+    )
+    
+    # Keys computed from the other keys by their getter
+    derived_keys = ('CPU_Efficiency','Mem_Wasted')
                         
 
-    def __init__(self,jobsteps=[]):
+    def __init__(self,jobsteps=[],aggregate=False,keep_steps=True):
         '''
         Constructor.  Takes an array of job steps
+        
+        The keys are aggregated over the steps in one pass on first access, 
+        or right away if aggregate is True.  If keep_steps is False, that's 
+        done right away and the steps are then dropped (see drop_steps).
         '''
         self.jobsteps = jobsteps
+        if aggregate or not keep_steps:
+            self.summarize()
+        if not keep_steps:
+            self.drop_steps()
         
+    def _get_jobsteps(self):
+        return self.__dict__.get('_jobsteps')
+    
+    def _set_jobsteps(self,jobsteps):
+        self.__dict__['_jobsteps'] = jobsteps
+        self.clear_cache()
+    
+    jobsteps = property(_get_jobsteps,_set_jobsteps)
+    
+    def clear_cache(self):
+        """
+        Forget the computed values.  This happens automatically when jobsteps 
+        is set or its length changes, but not when a JobStep is modified in
+        place.
+        """
+        self.__dict__['_cache'] = {}
+        self.__dict__['_cache_nsteps'] = None
+        self.__dict__['_summary'] = None
+        self.__dict__['_summary_nsteps'] = None
         
+    @property
+    def nodes(self):
+        """
+        frozenset of the names of the nodes in NodeList (see hostlist), 
+        computed on first access.
+        """
+        NodeList = self.NodeList
+        cached = self.__dict__.get('_nodes')
+        if cached is None or cached[0] != NodeList:
+            cached = self.__dict__['_nodes'] = (NodeList,hostlist.node_set(NodeList))
+        return cached[1]
+    
+    def node_bitmap(self,index=None):
+        """
+        Returns the nodes as a bitmap of the given hostlist.NodeIndex, by 
+        default hostlist.NODES.
+        """
+        if index is None:
+            index = hostlist.NODES
+        return index.hostlist_bitmap(self.NodeList)
+    
+    def summarize(self):
+        """
+        Returns the JobSummary of the jobsteps, computing it if it hasn't 
+        been yet or the number of jobsteps has changed.  Returns None if there
+        are no jobsteps.
+        """
+        summary = self.__dict__.get('_summary')
+        jobsteps = self.jobsteps
+        if jobsteps is None:
+            # Dropped, or never had any
+            return summary
+        nsteps = len(jobsteps)
+        if nsteps == 0:
+            return None
+        if summary is None or self.__dict__['_summary_nsteps'] != nsteps:
+            summary = self._summarize()
+            self.__dict__['_summary'] = summary
+            self.__dict__['_summary_nsteps'] = nsteps
+        return summary
+    
+    def drop_steps(self):
+        """
+        Discard the JobSteps, keeping only the JobSummary, so that the keys 
+        are still available.  jobsteps is None afterwards.
+        """
+        self.summarize()
+        self.__dict__['_jobsteps'] = None
+        self.__dict__['_cache'] = {}
+        
+    def _summarize(self):
+        """
+        Returns a new JobSummary of the jobsteps, computed in a single pass.
+        """
+        summary = JobSummary()
+        maxes = [floor for key,floor in JobReport.max_keys]
+        maxkeys = [key for key,floor in JobReport.max_keys]
+        nmax = len(maxkeys)
+        firsts = {}
+        missing = list(JOBSUMMARY_FIRST_KEYS)
+        JobName = None
+        for js in self.jobsteps:
+            d = js.__dict__
+            for i in xrange(nmax):
+                value = d.get(maxkeys[i])
+                if value > maxes[i]:
+                    maxes[i] = value
+            if missing:
+                for key in list(missing):
+                    value = d.get(key)
+                    if value is not None and value != '':
+                        firsts[key] = value
+                        missing.remove(key)
+            if JobName is None:
+                value = d.get('JobName')
+                if value and value != 'batch':
+                    JobName = value
+        for i in xrange(nmax):
+            setattr(summary,maxkeys[i],maxes[i])
+        for key in JOBSUMMARY_FIRST_KEYS:
+            setattr(summary,key,firsts.get(key))
+        summary.JobName = JobName
+        return summary
+        
+    def _value_cache(self):
+        """
+        Returns the dict of values computed so far, emptying it first if the
+        number of jobsteps has changed since they were computed.
+        """
+        nsteps = len(self.jobsteps)
+        if '_cache' not in self.__dict__ or self.__dict__['_cache_nsteps'] != nsteps:
+            self.__dict__['_cache'] = {}
+            self.__dict__['_cache_nsteps'] = nsteps
+        return self.__dict__['_cache']
+        
+
     def __getattr__(self, name):
         """
         __getattr__ just calls __getitem__ 
@@ -202,15 +337,36 @@ class JobReport(object):
         
     
     def get_value_for_index(self,index):
+        # The keys come from the JobSummary
+        if index in JOBSUMMARY_KEYS:
+            summary = self.summarize()
+            if summary is None:
+                logger.debug("No job steps")
+                return None
+            try:
+                return getattr(summary,index)
+            except AttributeError:
+                # Derived values are only computed if they're asked for
+                value = getattr(self,"get_%s" % index)()
+                setattr(summary,index,value)
+                return value
+        
         # If no jobsteps return None
         if self.jobsteps is None or len(self.jobsteps) == 0:
             logger.debug("No job steps")
             return None
         
-        # We can cache values for large JobStep arrays
-        if index in self.__dict__:
-            return __dict__[index]
+        # Aggregates scan every JobStep, so only do it once per index
+        cache = self._value_cache()
+        try:
+            return cache[index]
+        except KeyError:
+            pass
+        value = self._compute_value(index)
+        cache[index] = value
+        return value
         
+    def _compute_value(self,index):
         # If there is a getter function, use it
         funcname = "get_%s" % index
         try:            
@@ -221,78 +377,26 @@ class JobReport(object):
             pass
         
         # Return the first non-null thing you find
-        for js in self.jobsteps:
-            logger.debug("Checking jobstep against index %s" % index)
-            if js[index] is not None and js[index] != '':
-                logger.debug("Got %s" % index)
-                return js[index]
+        for value in self._step_values(index):
+            if value is not None and value != '':
+                logger.debug("Got %s", index)
+                return value
                 
+    def _step_values(self,index):
+        """
+        Returns the values of index for each of the jobsteps, in order.
+        
+        All of the aggregate getters go through this, so that subclasses 
+        storing steps differently (e.g. JobReportView) only have to override
+        this.
+        """
+        return [js[index] for js in self.jobsteps]
                 
     def get_JobName(self):
-        for js in self.jobsteps:
-            if js.JobName and js.JobName != 'batch':
-                return js.JobName
+        for JobName in self._step_values('JobName'):
+            if JobName and JobName != 'batch':
+                return JobName
             
-    def get_MaxRSS_kB(self):
-        """
-        Gets the max value from the jobsteps
-        """
-        max = -1
-        for js in self.jobsteps:
-            if js.MaxRSS_kB > max:
-                max = js.MaxRSS_kB
-        return max
-    
-    def get_MaxRSS_MB(self):
-        """
-        Gets the max value from the jobsteps
-        """
-        max = -1
-        for js in self.jobsteps:
-            if js.MaxRSS_MB > max:
-                max = js.MaxRSS_MB
-        return max
-    
-    def get_MaxVMSize_MB(self):
-        """
-        Gets the max value from the jobsteps
-        """
-        max = -1
-        for js in self.jobsteps:
-            if js.MaxVMSize_MB > max:
-                max = js.MaxVMSize_MB
-        return max
-    
-    def get_AveVMSize_MB(self):
-        """
-        Gets the max value from the jobsteps
-        """
-        max = -1
-        for js in self.jobsteps:
-            if js.AveVMSize_MB > max:
-                max = js.AveVMSize_MB
-        return max
-    
-    def get_NCPUS(self):
-        """
-        Gets the max value from the jobsteps
-        """
-        max = 0
-        for js in self.jobsteps:
-            if js.NCPUS > max:
-                max = js.NCPUS
-        return max
-    
-    def get_CPUTime(self):
-        """
-        Largest CPUTime of the individual job steps
-        """
-        cputime = 0
-        for js in self.jobsteps:
-            if js.CPUTime > cputime:
-                cputime = js.CPUTime
-        return cputime
-    
     def get_CPU_Efficiency(self):
         if self.CPUTime != 0:
             return self.TotalCPU / self.CPUTime
@@ -307,6 +411,26 @@ class JobReport(object):
             return int(round(float(self.ReqMem_MB_total / self.MaxRSS_MB) * 100))
         else:
             return 0
-        
 
+
+class JobSummary(object):
+    '''
+    The aggregated JobReport.keys values of a job, without the JobSteps
+    '''
+    __slots__ = tuple(JobReport.keys)
     
+    def __getstate__(self):
+        return dict((key,getattr(self,key)) for key in self.__slots__ if hasattr(self,key))
+    
+    def __setstate__(self,state):
+        for key,value in state.iteritems():
+            setattr(self,key,value)
+
+
+JOBSUMMARY_KEYS = frozenset(JobReport.keys)
+
+# Keys that are the first non-null value of the steps
+JOBSUMMARY_FIRST_KEYS = tuple(
+    key for key in JobReport.keys 
+    if key not in dict(JobReport.max_keys) and key not in JobReport.derived_keys and key != 'JobName'
+)
@@ -0,0 +1,222 @@
+'''
+Copyright (c) 2014
+Harvard FAS Research Computing
+All rights reserved.
+
+Batch versions of the sacct field conversions.
+
+Each function here takes a whole column of strings (a list, or a NumPy string
+array) and converts it at once.  sacct columns are very repetitive (the same
+ReqMem, MaxRSS of 0, Unknown End, and so on), so every distinct value is
+converted only once with the scalar function and the results are gathered
+back out by index.  With NumPy that is numpy.unique and a fancy-indexing
+gather, and the results are NumPy arrays; without it, it's a memoized loop
+and the results are array.arrays of the same typecodes JobStepTable uses.
+Values that can be None (ReqMem_bytes_per_node, Start, etc.) are NULL_INT,
+as in JobStepTable.
+
+parse_table uses these to build a JobStepTable from sacct lines a column at a
+time rather than a JobStep at a time.  That needs all of the lines up front,
+so it's for whole batches (e.g. export); getJobReports(columnar=True) streams
+rows into its table with SacctParser.parse_into instead.
+'''
+import sys
+import gc
+import logging
+from array import array
+from slyme import Slurm
+from slyme import sacctparser
+from slyme.columnar import JobStepTable, NULL_INT
+from slyme.sacctparser import SacctParser, Memo
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+logger = logging.getLogger('slyme')
+
+
+def convert_columns(values,function,typecodes):
+    """
+    Apply function to each of the values and return one column per item of
+    the tuples it returns, with the given array typecodes.  Each distinct 
+    value is only converted once.
+    """
+    if numpy is not None:
+        values = numpy.asarray(values)
+        if len(values) == 0:
+            return [numpy.zeros(0,dtype=typecode) for typecode in typecodes]
+        unique,inverse = numpy.unique(values,return_inverse=True)
+        converted = [function(v) for v in unique.tolist()]
+        return [
+            numpy.array([c[i] for c in converted],dtype=typecode)[inverse]
+            for i,typecode in enumerate(typecodes)
+        ]
+    
+    memo = Memo(function,size=sys.maxint)
+    converted = [memo[v] for v in values]
+    if not converted:
+        return [array(typecode) for typecode in typecodes]
+    return [array(typecode,column) for typecode,column in zip(typecodes,zip(*converted))]
+
+def convert_column(values,function,typecode):
+    """
+    Apply function to each of the values, converting each distinct value 
+    only once, and return the results as a column of the given typecode.
+    """
+    if numpy is not None:
+        return convert_columns(values,lambda v: (function(v),),(typecode,))[0]
+    memo = Memo(function,size=sys.maxint)
+    return array(typecode,[memo[v] for v in values])
+
+def _null(v):
+    if v is None:
+        return NULL_INT
+    return v
+
+
+#--- batch versions of the Slurm conversions
+
+def slurmtime_to_seconds(tstrs):
+    """Batch Slurm.slurmtime_to_seconds; floats."""
+    return convert_column(tstrs,Slurm.slurmtime_to_seconds,'d')
+
+def slurm_time_interval_to_seconds(tstrs):
+    """Batch Slurm.slurm_time_interval_to_seconds; floats."""
+    return convert_column(tstrs,Slurm.slurm_time_interval_to_seconds,'d')
+
+def MaxRSS_to_kB(MaxRSSs):
+    """Batch Slurm.MaxRSS_to_kB; ints."""
+    return convert_column(MaxRSSs,Slurm.MaxRSS_to_kB,'l')
+
+def slurmmemory_to_kB(mems):
+    """Batch Slurm.slurmmemory_to_kB; ints."""
+    return convert_column(mems,Slurm.slurmmemory_to_kB,'l')
+
+def timestamp_to_epoch(tss):
+    """Convert sacct timestamps to seconds since the epoch (see
+    columnar.datetime_to_epoch), with NULL_INT for Unknown."""
+    return convert_column(tss,sacctparser.epoch,'l')
+
+def ReqMem_to_bytes(ReqMems,NCPUSs):
+    """
+    Batch conversion of ReqMem, with the NCPUS of the same rows, to the four
+    columns getJobReports sets: ReqMem_bytes, ReqMem_bytes_per_node,
+    ReqMem_bytes_per_core, and ReqMem_MB_total.  NCPUSs may be ints or
+    strings.
+    """
+    #the distinct (ReqMem,NCPUS) pairs are numbered so that convert_columns
+    #(and numpy.unique) only has to deal with ints
+    pairs = {}
+    indexes = [pairs.setdefault(pair,len(pairs)) for pair in zip(ReqMems,[int(n) for n in NCPUSs])]
+    unique = [None]*len(pairs)
+    for pair,i in pairs.iteritems():
+        unique[i] = pair
+    def convert(i):
+        return tuple(_null(v) for v in sacctparser.reqmem(unique[i]))
+    return convert_columns(indexes,convert,('l','l','l','l'))
+
+
+#--- columnar ingestion
+
+def _jobid(JobID):
+    if '.' in JobID:
+        return tuple(JobID.split('.',1))
+    return JobID,''
+
+def _kB_MB(mem):
+    kB = sacctparser.memory_kB(mem)
+    return kB,kB/1024
+
+
+# For each sacct column, the JobStep attributes it sets, the conversion to a
+# tuple of their values, and whether those are strings (stored as string pool
+# indexes).  Columns not listed here are kept as strings.  ReqMem needs NCPUS
+# too, so it's done separately.
+COLUMN_CONVERSIONS = {
+    'JobID'     : (('JobID','JobStepName'),      _jobid,                                     True),
+    'State'     : (('State','CancelledBy'),      sacctparser.state,                          True),
+    'NCPUS'     : (('NCPUS',),                   lambda v: (int(v),),                        False),
+    'NNodes'    : (('NNodes',),                  lambda v: (int(v),),                        False),
+    'CPUTime'   : (('CPUTime',),                 lambda v: (sacctparser.seconds(v),),        False),
+    'TotalCPU'  : (('TotalCPU',),                lambda v: (sacctparser.seconds(v),),        False),
+    'UserCPU'   : (('UserCPU',),                 lambda v: (sacctparser.seconds(v),),        False),
+    'SystemCPU' : (('SystemCPU',),               lambda v: (sacctparser.seconds(v),),        False),
+    'Elapsed'   : (('Elapsed',),                 lambda v: (sacctparser.seconds(v),),        False),
+    'Start'     : (('Start',),                   lambda v: (sacctparser.epoch(v),),          False),
+    'End'       : (('End',),                     lambda v: (sacctparser.epoch(v),),          False),
+    'MaxRSS'    : (('MaxRSS_kB','MaxRSS_MB'),    _kB_MB,                                     False),
+    'MaxVMSize' : (('MaxVMSize_MB',),            lambda v: (sacctparser.memory_kB(v)/1024,), False),
+    'AveVMSize' : (('AveVMSize_MB',),            lambda v: (sacctparser.memory_kB(v)/1024,), False),
+}
+
+def _extend(column,values):
+    if numpy is not None:
+        column.fromstring(values.astype(column.typecode).tostring())
+    else:
+        column.extend(values)
+
+def parse_table(lines,parser=None):
+    """
+    Parse sacct --parsable2 lines into a new JobStepTable, converting a 
+    column at a time.  The result is the same as appending each JobStep from
+    parser.parse(lines) to a JobStepTable(parser.attributes).
+    
+    parser is only used for its fields and its handling of lines with extra
+    pipes (and their counters); by default it's a SacctParser of the default
+    fields.
+    """
+    if parser is None:
+        parser = SacctParser()
+    
+    # The rows and converted values are millions of small objects that can't
+    # form cycles, so don't let the collector keep rescanning them
+    gcenabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _parse_table(lines,parser)
+    finally:
+        if gcenabled:
+            gc.enable()
+
+def _parse_table(lines,parser):
+    nfields = parser.nfields
+    rows = []
+    for line in lines:
+        line = line.strip()
+        if line == '':
+            continue
+        values = line.split('|')
+        if len(values) != nfields:
+            values = parser._split_slow(line)
+            if values is None:
+                continue
+        rows.append(values)
+    
+    table = JobStepTable(parser.attributes)
+    if not rows:
+        return table
+    raw = dict(zip(parser.fields,zip(*rows)))
+    
+    string_id = table._string_id
+    for field,values in raw.iteritems():
+        if field == 'ReqMem':
+            columns = ReqMem_to_bytes(values,raw.get('NCPUS',['1']*len(rows)))
+            attributes = sacctparser.COLUMN_ATTRIBUTES['ReqMem']
+        elif field in COLUMN_CONVERSIONS:
+            attributes,function,strings = COLUMN_CONVERSIONS[field]
+            if strings:
+                convert = lambda v,function=function: tuple(string_id(s) for s in function(v))
+            else:
+                convert = function
+            typecodes = [table.columns[a].typecode for a in attributes]
+            columns = convert_columns(values,convert,typecodes)
+        else:
+            attributes = (field,)
+            columns = [convert_column(values,string_id,'l')]
+        for attribute,column in zip(attributes,columns):
+            _extend(table.columns[attribute],column)
+    table.nrows = len(rows)
+    return table
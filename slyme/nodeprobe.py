@@ -0,0 +1,161 @@
+# Copyright (c) 2013-2014
+# Harvard FAS Research Computing
+# All rights reserved.
+
+"""concurrent collection of OS metrics from many nodes
+
+scontrol only knows what Slurm allocated on a node; whether the cores and
+memory are actually in use has to come from the node itself.  collect()
+runs PROBE_COMMAND on each node through a transport, up to fanout nodes at
+a time, and sets the OS_* keys of the Nodes from the output:
+
+	nodes = list(slyme.nodes.get_nodes())
+	errors = nodeprobe.collect(nodes, nodeprobe.SSHTransport(), fanout=64)
+
+A transport is any callable taking a NodeName and a timeout in seconds and
+returning the text PROBE_COMMAND prints there, or raising an exception.
+SSHTransport runs it with ssh, LocalTransport runs it on this host, and
+FakeTransport returns canned text, for tests.
+"""
+
+
+import time, logging
+from multiprocessing.pool import ThreadPool
+
+from slyme import util, hostmetrics
+
+
+logger = logging.getLogger('slyme')
+
+
+#the sh code run on each node: /proc/loadavg, the number of cores, then /proc/meminfo
+PROBE_COMMAND = "cat /proc/loadavg; grep -c ^processor /proc/cpuinfo; cat /proc/meminfo"
+
+#the ssh argv, to which the NodeName and PROBE_COMMAND are added
+SSH_ARGV = ['ssh', '-o', 'BatchMode=yes', '-o', 'StrictHostKeyChecking=no']
+
+#how many nodes are probed at once
+DEFAULT_FANOUT = 32
+
+#seconds allowed for each node
+DEFAULT_TIMEOUT = 10
+
+#the keys collect() sets
+OS_KEYS = ('OS_Cores_Total', 'OS_Cores_Used', 'OS_Memory_Total', 'OS_Memory_Used')
+
+#a Node's os_data when it couldn't be probed (not None, so LazyDict keeps it)
+OS_UNAVAILABLE = ()
+
+def parse_probe_output(text):
+	"""Parse PROBE_COMMAND output into values for OS_KEYS.
+
+	The /proc/loadavg and /proc/meminfo parts are read with the hostmetrics
+	parsers that util.get_cpu and util.get_mem use for this host.
+	"""
+	lines = text.splitlines()
+	if len(lines) < 3:
+		raise ValueError("unable to parse node probe output [%r]" % text)
+	cores_used = hostmetrics.parse_loadavg(lines[0])
+	cores_total = int(lines[1])
+	mem_total, mem_used = hostmetrics.parse_meminfo('\n'.join(lines[2:]))
+	return cores_total, cores_used, mem_total, mem_used
+
+
+#--- transports
+
+class SSHTransport(object):
+	"""Runs the probe on each node with ssh."""
+	def __init__(self, ssh=SSH_ARGV, command=PROBE_COMMAND):
+		self.ssh = list(ssh)
+		self.command = command
+
+	def __call__(self, NodeName, timeout):
+		argv = self.ssh + ['-o', 'ConnectTimeout=%d' % max(int(timeout), 1), NodeName, self.command]
+		with util.ShStream(argv, timeout=timeout) as stream:
+			return ''.join(stream)
+
+class LocalTransport(object):
+	"""Runs the probe on this host, whatever the NodeName."""
+	def __init__(self, command=PROBE_COMMAND):
+		self.command = command
+
+	def __call__(self, NodeName, timeout):
+		with util.ShStream(self.command, timeout=timeout) as stream:
+			return ''.join(stream)
+
+class FakeTransport(object):
+	"""Returns canned probe output, for tests.
+
+	texts maps each NodeName to its output, or to an exception to raise.
+	Each call sleeps for delay seconds first, or raises util.ShError if that's
+	longer than the timeout.  calls counts the calls.
+	"""
+	def __init__(self, texts, delay=0):
+		self.texts = texts
+		self.delay = delay
+		self.calls = 0
+
+	def __call__(self, NodeName, timeout):
+		self.calls += 1
+		if self.delay > timeout:
+			time.sleep(timeout)
+			raise util.ShError("probe of %s timed out" % NodeName)
+		time.sleep(self.delay)
+		text = self.texts[NodeName]
+		if isinstance(text, Exception):
+			raise text
+		return text
+
+
+#--- collection
+
+def probe(NodeNames, transport, fanout=DEFAULT_FANOUT, timeout=DEFAULT_TIMEOUT):
+	"""Probe the named nodes concurrently.
+
+	Yields (NodeName, values, error) for each node as it finishes, where
+	values are for OS_KEYS, or None if error is the exception that kept the
+	node from being probed.
+	"""
+	def probe_one(NodeName):
+		try:
+			return NodeName, parse_probe_output(transport(NodeName, timeout)), None
+		except Exception, e:
+			return NodeName, None, e
+
+	NodeNames = list(NodeNames)
+	if not NodeNames:
+		return
+	pool = ThreadPool(min(fanout, len(NodeNames)))
+	try:
+		for result in pool.imap_unordered(probe_one, NodeNames):
+			yield result
+	finally:
+		pool.terminate()
+		pool.join()
+
+def collect(nodes, transport, fanout=DEFAULT_FANOUT, timeout=DEFAULT_TIMEOUT):
+	"""Probe the given Nodes concurrently and set their OS_* keys.
+
+	The keys of nodes that can't be probed are left unset, since LazyDict
+	values are never None, and their os_data is set to OS_UNAVAILABLE so
+	that asking for the keys doesn't probe them again.  Returns a dict of
+	NodeName to the exception for those nodes.
+	"""
+	byname = {}
+	for n in nodes:
+		byname.setdefault(n['NodeName'], []).append(n)
+
+	errors = {}
+	t = time.time()
+	for NodeName, values, error in probe(byname.keys(), transport, fanout, timeout):
+		if error is not None:
+			logger.debug("unable to probe node %s: %r" % (NodeName, error))
+			errors[NodeName] = error
+			for n in byname[NodeName]:
+				n['os_data'] = OS_UNAVAILABLE
+			continue
+		for n in byname[NodeName]:
+			for key, value in zip(OS_KEYS, values):
+				n[key] = value
+	logger.info("probed %d nodes in %.2fs, %d failed" % (len(byname), time.time() - t, len(errors)))
+	return errors
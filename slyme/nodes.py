@@ -8,7 +8,59 @@
 import socket
 import slyme
 from dio import lazydict
-from slyme import config, util, Slurm
+from slyme import config, util, nodeprobe, scontrol, Slurm
+
+
+#--- extensions
+
+class x_scontrol_text(lazydict.Extension):
+	"""The node's scontrol show node --oneliner line; the one scontrol call."""
+	source = ('NodeName',)
+	target = ('scontrol_text',)
+	def __call__(self, NodeName):
+		for scontroltext in _yield_raw_scontrol_node_texts(NodeName):
+			return scontroltext,
+		return None,
+
+class x_scontrol(lazydict.Extension):
+	"""All the scontrol data, parsed from the scontrol line at once."""
+	source = ('scontrol_text',)
+	target = ('CPUTot', 'CPUAlloc', 'CPULoad', 'AllocMem_kB')
+	def __call__(self, scontroltext):
+		d = parse_scontrol_text(scontroltext)
+		return tuple(d.get(k) for k in self.target)
+
+class x_os_data(lazydict.Extension):
+	"""The os data, from one probe of the node.
+
+	This is only available for the local host, unless Node.probe_transport
+	is set to a nodeprobe transport for reaching other nodes.  A node that
+	can't be probed gets nodeprobe.OS_UNAVAILABLE, so it isn't probed again
+	each time one of the os keys is asked for.
+	"""
+	source = ('NodeName',)
+	target = ('os_data',)
+	def __call__(self, NodeName):
+		if NodeName == util.get_hostname():
+			return util.get_cpu() + util.get_mem(),
+		if Node.probe_transport is not None:
+			for NodeName, values, error in nodeprobe.probe([NodeName], Node.probe_transport):
+				if values is not None:
+					return tuple(values),
+		return nodeprobe.OS_UNAVAILABLE,
+
+class x_os(lazydict.Extension):
+	"""All the os data at once, or none of it if the node couldn't be probed."""
+	source = ('os_data',)
+	target = nodeprobe.OS_KEYS
+	def __call__(self, os_data):
+		return os_data or (None,) * len(self.target)
+
+class x_cores_wasted(lazydict.Extension):
+	source = ('CPUAlloc', 'CPULoad')
+	target = ('Cores_Wasted',)
+	def __call__(self, CPUAlloc, CPULoad):
+		return float(CPUAlloc) - CPULoad,
 
 
 class Node(lazydict.LazyDict):
@@ -16,6 +68,9 @@ class Node(lazydict.LazyDict):
 
 	This is dict-like.
 	Attributes are named to match scontrol's variables very closely.
+
+	Given just a NodeName, the scontrol data comes from one scontrol call and
+	the os data from one probe, however many of the keys are used.
 	"""
 	
 	_keys = [
@@ -25,6 +80,10 @@ class Node(lazydict.LazyDict):
 		'NodeName',
 		#str
 
+		'scontrol_text',
+		#str
+		#the node's line of scontrol show node --oneliner
+
 		'CPUTot',
 		#int
 
@@ -34,21 +93,29 @@ class Node(lazydict.LazyDict):
 		'CPULoad',
 		#float
 
+		'AllocMem_kB',
+		#int
+
 
 		#=== os data
 
-		'OS_Cores_total',
+		'os_data',
+		#tuple
+		#the values of the OS_* keys below, from one probe, or
+		#nodeprobe.OS_UNAVAILABLE (empty) if the node couldn't be probed
+
+		'OS_Cores_Total',
 		#int
 
 		'OS_Cores_Used',
 		#int
 		#number of running tasks, derived from the 4th colum of /proc/loadavg
 
-		'OS_Memory_total',
+		'OS_Memory_Total',
 		#int
 		#in kB
 
-		'OS_Memory_used',
+		'OS_Memory_Used',
 		#int
 		#in kB
 		#does not count Buffers, Cached, and SwapCached
@@ -61,32 +128,17 @@ class Node(lazydict.LazyDict):
 	]
 
 	primary_key = 'NodeName'
-	
-	def load_data(self, keys=[]):
-		for key in keys:
-			if not self.has_key(key):
-				#--- scontrol data
-
-				self.load_data_from_scontrol_text(_yield_raw_scontrol_node_texts(util.get_hostname()).next())
-
 
-				#--- os data
-
-				if self['NodeName'] == util.get_hostname():
-					self['OS_Cores_Total'] , self['OS_Cores_Used']  = util.get_cpu()
-					self['OS_Memory_Total'], self['OS_Memory_Used'] = util.get_mem()
-				else:
-					self['OS_Cores_Total'] , self['OS_Cores_Used']  = None, None
-					self['OS_Memory_Total'], self['OS_Memory_Used'] = None, None
-
-
-				#--- derived
+	extensions = [
+		x_scontrol_text(),
+		x_scontrol(),
+		x_os_data(),
+		x_os(),
+		x_cores_wasted(),
+	]
 
-				if key=='Cores_Wasted':
-					try:
-						self['Cores_Wasted'] = float(self['CPUAlloc']) - self['CPULoad']
-					except KeyError:
-						self['Cores_Wasted'] = None
+	#the nodeprobe transport used for the os data of other hosts, if any
+	probe_transport = None
 
 	def load_data_from_scontrol_text(self, scontroltext):
 		"""Load data from a scontrol text.
@@ -94,29 +146,22 @@ class Node(lazydict.LazyDict):
 		This does not respect the internal laziness setting -- everything 
 		possible is loaded.
 		"""
-		try:
-			for kv in scontroltext.split():
-				if kv.startswith('NodeName'):
-					self['NodeName'] = kv.split('=')[1]
-				elif kv.startswith('CPUTot'):
-					self['CPUTot'] = int(kv.split('=')[1])
-				elif kv.startswith('CPULoad'):
-					try:
-						self['CPULoad'] = float(kv.split('=')[1])
-					except ValueError:
-						#often 'N/A'
-						pass
-				elif kv.startswith('CPUAlloc'):
-					self['CPUAlloc'] = int(kv.split('=')[1])
-				elif kv.startswith('AllocMem'):
-					self['AllocMem_kB'] = Slurm.AllocMem_to_kB(kv.split('=')[1])
-				#elif kv.startswith('AllocMem'):
-				#	memory = int(kv.split('=')[1]) * 1024
-				#	if cores is not None:
-				#		break
-
-		except Exception, e:
-			raise Exception("unable to parse scontrol node text [%r]: %r\n" % (scontroltext, e))
+		self['scontrol_text'] = scontroltext
+		self.update(parse_scontrol_text(scontroltext))
+
+
+def parse_scontrol_text(scontroltext):
+	"""Return a dict of the Node values in a scontrol text."""
+	record = scontrol.parse_node(scontroltext)
+	d = {}
+	for key in ('NodeName', 'CPUTot', 'CPUAlloc', 'CPULoad'):
+		value = getattr(record, key)
+		#(CPULoad is often N/A)
+		if value is not None:
+			d[key] = value
+	if record.AllocMem is not None:
+		d['AllocMem_kB'] = Slurm.AllocMem_to_kB(record.AllocMem)
+	return d
 
 
 #--- node retrieval
@@ -136,6 +181,22 @@ def get_nodes(filter=lambda j: True):
 		if filter(n):
 			yield n
 
+def get_nodes_async(mux, callback, filter=lambda j: True, ondone=None):
+	"""get_nodes on a util.ShMultiplexer.
+
+	This starts scontrol and returns right away; callback is then called with
+	each Node as mux.run() reads the output.  ondone is called with None or
+	the error once scontrol is done.
+	"""
+	def online(line):
+		line = line.strip()
+		if line!='':
+			n = Node()
+			n.load_data_from_scontrol_text(line)
+			if filter(n):
+				callback(n)
+	mux.add(['scontrol', 'show', 'node', '--oneliner'], online=online, ondone=ondone)
+
 
 if __name__=='__main__':
 	n = Node(NodeName=util.get_hostname())
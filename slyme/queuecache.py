@@ -0,0 +1,178 @@
+'''
+Copyright (c) 2014
+Harvard FAS Research Computing
+All rights reserved.
+
+Process-wide snapshot of the Slurm queue.
+
+Asking squeue about one job at a time, from many places in the same process,
+adds up to a lot of slurmctld RPCs for what is the same information.  A
+SqueueCache runs one squeue for the whole queue at most once per ttl seconds
+and answers lookups by JobID, User, and Partition from that snapshot.
+
+Refreshes are single-flight: if several threads find the snapshot stale at
+once, one of them runs squeue and the others wait for its result rather than
+running their own.
+
+SQUEUE is the cache shared by default, e.g.
+
+    Slurm.getJobStatus(jobid,cache=queuecache.SQUEUE)
+'''
+import time
+import threading
+import logging
+from slyme.util import runsh_i
+
+
+logger = logging.getLogger('slyme')
+
+
+#seconds a snapshot is used for
+DEFAULT_TTL = 30
+
+#the squeue fields kept for each job, and the squeue --format that prints them
+QUEUE_FIELDS = ('JobID','ArrayJobID','User','Partition','State')
+SQUEUE_FORMAT = '%i|%A|%u|%P|%T'
+
+
+class QueueJob(object):
+    '''
+    One line of squeue output
+    '''
+    __slots__ = QUEUE_FIELDS
+
+    def __init__(self,JobID,ArrayJobID,User,Partition,State):
+        self.JobID = JobID
+        self.ArrayJobID = ArrayJobID
+        self.User = User
+        self.Partition = Partition
+        self.State = State
+
+    def __repr__(self):
+        return 'QueueJob(%s)' % ', '.join('%s=%r' % (k,getattr(self,k)) for k in QUEUE_FIELDS)
+
+
+class QueueSnapshot(object):
+    '''
+    The jobs in the queue at one time, indexed by JobID, User, and Partition
+    '''
+
+    def __init__(self,jobs,snapshot_time=None):
+        '''
+        Constructor.  Takes a list of QueueJobs.
+        '''
+        if snapshot_time is None:
+            snapshot_time = time.time()
+        self.time = snapshot_time
+        self.jobs = jobs
+        self.by_jobid = {}
+        self.by_user = {}
+        self.by_partition = {}
+        for job in jobs:
+            self.by_jobid[job.JobID] = job
+            # Array tasks can also be looked up by their own job id
+            self.by_jobid.setdefault(job.ArrayJobID,job)
+            self.by_user.setdefault(job.User,[]).append(job)
+            self.by_partition.setdefault(job.Partition,[]).append(job)
+
+    @classmethod
+    def parse(cls,lines,snapshot_time=None):
+        """
+        Build a snapshot from squeue --format SQUEUE_FORMAT lines.
+        """
+        jobs = []
+        for line in lines:
+            fields = line.strip().split('|')
+            if len(fields) != len(QUEUE_FIELDS):
+                continue
+            jobs.append(QueueJob(*[intern(f) for f in fields]))
+        return cls(jobs,snapshot_time)
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def age(self):
+        return time.time() - self.time
+
+    def job(self,JobID):
+        """The QueueJob for the given JobID, or None if it's not in the queue."""
+        return self.by_jobid.get(str(JobID))
+
+    def status(self,JobID):
+        """The State of the given JobID, or None if it's not in the queue."""
+        job = self.by_jobid.get(str(JobID))
+        if job is None:
+            return None
+        return job.State
+
+    def user_jobs(self,User):
+        """The list of the given user's QueueJobs."""
+        return self.by_user.get(User,[])
+
+    def partition_jobs(self,Partition):
+        """The list of the QueueJobs in the given partition."""
+        return self.by_partition.get(Partition,[])
+
+
+class SqueueCache(object):
+    '''
+    Thread-safe, single-flight cache of the squeue output for the whole queue
+    '''
+
+    def __init__(self,ttl=DEFAULT_TTL):
+        self.ttl = ttl
+        self.snapshot = None
+        self.refreshes = 0
+        self._cond = threading.Condition(threading.Lock())
+        self._refreshing = False
+
+    def get(self):
+        """
+        Return a QueueSnapshot no more than ttl seconds old, running squeue if
+        there isn't one.  If another thread is already running squeue, wait
+        for its snapshot instead.
+        """
+        with self._cond:
+            refreshes = self.refreshes
+            while True:
+                snapshot = self.snapshot
+                if snapshot is not None:
+                    if snapshot.age() < self.ttl or self.refreshes != refreshes:
+                        return snapshot
+                if not self._refreshing:
+                    self._refreshing = True
+                    break
+                self._cond.wait()
+
+        snapshot = None
+        try:
+            snapshot = self._fetch()
+        finally:
+            with self._cond:
+                self._refreshing = False
+                if snapshot is not None:
+                    self.snapshot = snapshot
+                    self.refreshes += 1
+                self._cond.notify_all()
+        return snapshot
+
+    def _fetch(self):
+        t = time.time()
+        snapshot = QueueSnapshot.parse(
+            runsh_i(['squeue','--all','--noheader','--format',SQUEUE_FORMAT]),t
+        )
+        logger.debug("Fetched a squeue snapshot of %d jobs in %.2fs" % (len(snapshot),time.time() - t))
+        return snapshot
+
+    def invalidate(self):
+        """Make the next get() run squeue."""
+        with self._cond:
+            self.snapshot = None
+
+    def status(self,JobID):
+        """The State of the given JobID, or None if it's not in the queue."""
+        return self.get().status(JobID)
+
+
+#the cache shared by default
+SQUEUE = SqueueCache()
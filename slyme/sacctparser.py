@@ -0,0 +1,558 @@
+'''
+Copyright (c) 2014
+Harvard FAS Research Computing
+All rights reserved.
+
+Parsing of `sacct --parsable2' output into JobSteps.
+
+SacctParser does the same field transformations JobReport documents, but it
+is built for throughput on large histories:
+
+    * each row is split once, and the columns go through a function compiled
+      for the particular --format fields from a table of per-column
+      conversions, rather than through a chain of if/elif tests
+
+    * timestamps are parsed by slicing the fixed-width string instead of by
+      datetime.strptime
+
+    * conversions of values that repeat a lot from row to row (times,
+      timestamps, memory sizes, states, users, partitions, node lists) are
+      memoized
+
+    * debug logging is only done if it is enabled when parsing starts
+
+parse_into does the same for a JobStepTable, appending each row's values
+straight to the table's columns without making JobSteps.
+'''
+import re
+import calendar
+import logging
+from datetime import datetime
+from slyme.jobreports import JobStep
+from slyme.columnar import NULL_INT, datetime_to_epoch
+
+
+logger = logging.getLogger('slyme')
+
+
+#the columns Slurm.getJobReports asks sacct for, in order
+DEFAULT_FIELDS = (
+    'JobID'   , 'User'      , 'JobName'   , 'State'    , 'Partition' , 'NCPUS'  ,
+    'NNodes'  , 'CPUTime'   , 'TotalCPU'  , 'UserCPU'  , 'SystemCPU' , 'ReqMem' , 'MaxRSS',
+    'Start'   , 'End'       , 'NodeList'  , 'Elapsed'  , 'MaxVMSize' , 'AveVMSize',
+)
+
+#the JobStep attributes set from each sacct column, where they aren't just
+#the column name
+COLUMN_ATTRIBUTES = {
+    'JobID'     : ('JobID','JobStepName'),
+    'State'     : ('State','CancelledBy'),
+    'ReqMem'    : ('ReqMem_bytes','ReqMem_bytes_per_node','ReqMem_bytes_per_core','ReqMem_MB_total'),
+    'MaxRSS'    : ('MaxRSS_kB','MaxRSS_MB'),
+    'MaxVMSize' : ('MaxVMSize_MB',),
+    'AveVMSize' : ('AveVMSize_MB',),
+}
+
+#the sacct columns needed for each JobReport key, where they aren't just the
+#key itself
+KEY_SOURCES = {
+    'JobStepName'           : ('JobID',),
+    'CancelledBy'           : ('State',),
+    'MaxRSS_kB'             : ('MaxRSS',),
+    'MaxRSS_MB'             : ('MaxRSS',),
+    'ReqMem_bytes'          : ('ReqMem',),
+    'ReqMem_bytes_per_node' : ('ReqMem',),
+    'ReqMem_bytes_per_core' : ('ReqMem',),
+    'ReqMem_bytes_total'    : ('ReqMem','NCPUS'),
+    'ReqMem_MB_total'       : ('ReqMem','NCPUS'),
+    'CPU_Efficiency'        : ('TotalCPU','CPUTime'),
+    'CPU_Wasted'            : ('TotalCPU','CPUTime'),
+    'Mem_Wasted'            : ('ReqMem','NCPUS','MaxRSS'),
+    'MaxVMSize_MB'          : ('MaxVMSize',),
+    'AveVMSize_MB'          : ('AveVMSize',),
+}
+
+def format_fields(keys):
+    """Return the sacct --format columns needed for the given JobReport keys.
+
+    keys may also include sacct columns that JobReport doesn't know about
+    (e.g. Account); those are passed through as is.  JobID is always
+    included, since JobSteps are grouped by it.  Known columns come out in
+    DEFAULT_FIELDS order, followed by the others.
+    """
+    needed = set(['JobID'])
+    others = []
+    for key in keys:
+        if key in KEY_SOURCES:
+            needed.update(KEY_SOURCES[key])
+        elif key in DEFAULT_FIELDS:
+            needed.add(key)
+        elif key not in others:
+            others.append(key)
+    return [f for f in DEFAULT_FIELDS if f in needed] + others
+
+#memory size suffixes used by sacct for MaxRSS, MaxVMSize, etc.; sizes are
+#assumed to be powers of 10**3, at least until kB
+MEMORY_UNITS_kB = {
+    'K' : 1,
+    'M' : 1000,
+    'G' : 1000**2,
+    'T' : 1000**3,
+    'P' : 1000**4,
+}
+
+#ReqMem suffixes: the size unit, in bytes, and whether it is per core (c) or
+#per node (n)
+REQMEM_UNITS = {
+    'Mn' : (1024**2, False),
+    'Mc' : (1024**2, True),
+    'Gn' : (1024**3, False),
+    'Gc' : (1024**3, True),
+    'Tn' : (1024**4, False),
+    'Tc' : (1024**4, True),
+}
+
+#memo dicts are cleared when they reach this many entries, to bound memory
+#on columns that have few repeats
+MEMO_SIZE = 100000
+
+
+class Memo(dict):
+    '''
+    dict that fills in missing keys with a conversion function
+    '''
+
+    def __init__(self,function,size=MEMO_SIZE):
+        self.function = function
+        self.size = size
+
+    def __missing__(self,key):
+        if len(self) >= self.size:
+            self.clear()
+        value = self[key] = self.function(key)
+        return value
+
+
+#--- scalar conversions
+
+def string(s):
+    """Intern the str, so repeated values share one object.  unicode is left as is."""
+    if type(s) is str:
+        return intern(s)
+    return s
+
+def seconds(tstr):
+    """Convert a slurm time (MM:SS.SSS, HH:MM:SS, D-HH:MM:SS, etc.) to seconds, a float.
+
+    The empty string is 0.0.
+    """
+    t = 0.0
+    if tstr == '':
+        return t
+    rest = tstr
+    if '-' in rest:
+        days,rest = rest.split('-')
+        t += int(days) * 86400
+    l = rest.split(':')
+    if len(l) == 3:
+        t += int(l[0]) * 3600 + int(l[1]) * 60 + int(l[2])
+    elif len(l) == 2:
+        t += 60 * int(l[0]) + float(l[1])
+    else:
+        raise ValueError("unable to parse time [%s]" % tstr)
+    return t
+
+def memory_kB(mem):
+    """Convert a sacct memory string such as MaxRSS (e.g. 1024K, 1.5G) to kB, an int.
+
+    The empty string, 0, and the 16? that shows up on lines that are not
+    .batch, are all 0.
+    """
+    if mem == '' or mem == '0' or mem == '16?':
+        return 0
+    try:
+        return int(round(float(mem[:-1]) * MEMORY_UNITS_kB[mem[-1]]))  #(float because it's often given that way)
+    except (KeyError,ValueError):
+        raise Exception("un-parsable memory size [%r]" % mem)
+
+def timestamp(ts):
+    """Convert a sacct YYYY-MM-DDTHH:MM:SS timestamp to a datetime.
+
+    Unknown and the empty string are None.
+    """
+    if ts == 'Unknown' or ts == '':
+        return None
+    if len(ts) == 19 and ts[4] == '-' and ts[10] == 'T':
+        return datetime(int(ts[0:4]),int(ts[5:7]),int(ts[8:10]),int(ts[11:13]),int(ts[14:16]),int(ts[17:19]))
+    return datetime.strptime(ts,"%Y-%m-%dT%H:%M:%S")
+
+def state(State):
+    """Split a sacct State into (State,CancelledBy).
+
+    "CANCELLED by <uid>" becomes ('CANCELLED','<uid>'); anything else has a
+    CancelledBy of None.
+    """
+    if State.startswith('CANCELLED by '):
+        return 'CANCELLED', State[13:]
+    return State, None
+
+def reqmem(ReqMem_NCPUS):
+    """Convert a (ReqMem,NCPUS) pair to the tuple
+    (ReqMem_bytes, ReqMem_bytes_per_node, ReqMem_bytes_per_core, ReqMem_MB_total).
+
+    Unrecognized ReqMem values are (0,None,None,None).
+    """
+    ReqMem,NCPUS = ReqMem_NCPUS
+    try:
+        unit,percore = REQMEM_UNITS[ReqMem[-2:]]
+    except KeyError:
+        return 0, None, None, None
+    size = ReqMem[:-2]
+    if unit == 1024**2:
+        #megabytes are always whole numbers
+        nbytes = int(size) * unit
+        MB_total = int(size)
+        if percore:
+            MB_total *= NCPUS
+    else:
+        nbytes = int(round(float(size) * unit))
+        MB_total = int(round(float(size) * NCPUS))
+    if percore:
+        return nbytes, None, nbytes, MB_total
+    else:
+        return nbytes, nbytes, None, MB_total
+
+
+#Python source that converts each sacct column.  The column's raw value is
+#in the variable of the same name, and the code sets the JobStep attributes
+#derived from it in the dict d.  Columns not listed here are kept as strings.
+#ReqMem is finished off after all the columns, since it needs NCPUS.
+CONVERSIONS = {
+    'JobID' : """
+# Split off the step key, e.g. 1234.batch
+if '.' in JobID:
+    JobID,JobStepName = JobID.split('.',1)
+else:
+    JobStepName = ''
+d['JobID'] = strings[JobID]
+d['JobStepName'] = strings[JobStepName]
+""",
+    'State'     : "d['State'],d['CancelledBy'] = states[State]",
+    'NCPUS'     : "d['NCPUS'] = ints[NCPUS]",
+    'NNodes'    : "d['NNodes'] = ints[NNodes]",
+    'CPUTime'   : "d['CPUTime'] = seconds[CPUTime]",
+    'TotalCPU'  : "d['TotalCPU'] = seconds[TotalCPU]",
+    'UserCPU'   : "d['UserCPU'] = seconds[UserCPU]",
+    'SystemCPU' : "d['SystemCPU'] = seconds[SystemCPU]",
+    'Elapsed'   : "d['Elapsed'] = seconds[Elapsed]",
+    'Start'     : "d['Start'] = timestamps[Start]",
+    'End'       : "d['End'] = timestamps[End]",
+    'ReqMem'    : "",
+    'MaxRSS'    : """
+MaxRSS_kB = memory_kB[MaxRSS]
+d['MaxRSS_kB'] = MaxRSS_kB
+d['MaxRSS_MB'] = MaxRSS_kB / 1024
+""",
+    'MaxVMSize' : "d['MaxVMSize_MB'] = memory_kB[MaxVMSize] / 1024",
+    'AveVMSize' : "d['AveVMSize_MB'] = memory_kB[AveVMSize] / 1024",
+}
+
+REQMEM_CONVERSION = """
+d['ReqMem_bytes'],ReqMem_bytes_per_node,ReqMem_bytes_per_core,ReqMem_MB_total = reqmems[(ReqMem,d.get('NCPUS',1))]
+if ReqMem_MB_total is not None:
+    d['ReqMem_bytes_per_node'] = ReqMem_bytes_per_node
+    d['ReqMem_bytes_per_core'] = ReqMem_bytes_per_core
+    d['ReqMem_MB_total'] = ReqMem_MB_total
+"""
+
+#Python source that converts each sacct column to what a JobStepTable stores
+#(string pool indexes, epoch seconds, and NULL_INT for None), like 
+#CONVERSIONS.  The code sets a variable v_<attribute> for each JobStep 
+#attribute derived from the column, and columns not listed here are kept as
+#strings.  ReqMem's NCPUS is filled in when the fields are known.
+TABLE_CONVERSIONS = {
+    'JobID' : """
+# Split off the step key, e.g. 1234.batch
+if '.' in JobID:
+    JobID,JobStepName = JobID.split('.',1)
+else:
+    JobStepName = ''
+v_JobID = string_ids[JobID]
+v_JobStepName = string_ids[JobStepName]
+""",
+    'State'     : "v_State,v_CancelledBy = state_ids[State]",
+    'NCPUS'     : "v_NCPUS = ints[NCPUS]",
+    'NNodes'    : "v_NNodes = ints[NNodes]",
+    'CPUTime'   : "v_CPUTime = seconds[CPUTime]",
+    'TotalCPU'  : "v_TotalCPU = seconds[TotalCPU]",
+    'UserCPU'   : "v_UserCPU = seconds[UserCPU]",
+    'SystemCPU' : "v_SystemCPU = seconds[SystemCPU]",
+    'Elapsed'   : "v_Elapsed = seconds[Elapsed]",
+    'Start'     : "v_Start = epochs[Start]",
+    'End'       : "v_End = epochs[End]",
+    'ReqMem'    : "v_ReqMem_bytes,v_ReqMem_bytes_per_node,v_ReqMem_bytes_per_core,v_ReqMem_MB_total = reqmem_values[(ReqMem,%s)]",
+    'MaxRSS'    : """
+v_MaxRSS_kB = memory_kB[MaxRSS]
+v_MaxRSS_MB = v_MaxRSS_kB / 1024
+""",
+    'MaxVMSize' : "v_MaxVMSize_MB = memory_kB[MaxVMSize] / 1024",
+    'AveVMSize' : "v_AveVMSize_MB = memory_kB[AveVMSize] / 1024",
+}
+
+def _null(v):
+    if v is None:
+        return NULL_INT
+    return v
+
+#seconds since the epoch of each YYYY-MM-DD
+_day_epochs = Memo(lambda day: calendar.timegm((int(day[0:4]),int(day[5:7]),int(day[8:10]),0,0,0)))
+
+def epoch(ts):
+    """Convert a sacct timestamp to seconds since the epoch (see 
+    columnar.datetime_to_epoch), with NULL_INT for Unknown.
+    
+    This is datetime_to_epoch(timestamp(ts)), without making the datetime.
+    """
+    if len(ts) == 19 and ts[4] == '-' and ts[10] == 'T':
+        return _day_epochs[ts[:10]] + int(ts[11:13]) * 3600 + int(ts[14:16]) * 60 + int(ts[17:19])
+    return datetime_to_epoch(timestamp(ts))
+
+
+class SacctParser(object):
+    '''
+    Converts sacct --parsable2 lines, with the given format fields, into
+    JobSteps
+    '''
+
+    def __init__(self,fields=DEFAULT_FIELDS):
+        '''
+        Constructor.  fields is the list of sacct --format columns, in order.
+        '''
+        self.fields = tuple(fields)
+        self.nfields = len(self.fields)
+
+        #conversion caches
+        self.strings = Memo(string)
+        self.ints = Memo(int)
+        self.seconds = Memo(seconds)
+        self.memory_kB = Memo(memory_kB)
+        self.states = Memo(state)
+        self.reqmems = Memo(reqmem)
+        self.timestamps = Memo(timestamp)
+
+        self.parse_values = self._compile()
+
+        #the JobStep attributes parse_values sets
+        self.attributes = []
+        for f in self.fields:
+            self.attributes.extend(COLUMN_ATTRIBUTES.get(f,(f,)))
+
+        #where the free-text column is, if present
+        self.jobname = None
+        if 'JobName' in self.fields:
+            self.jobname = self.fields.index('JobName')
+
+        #counts of lines that had the wrong number of columns: slow_rows went
+        #through _split_slow, and bad_rows are the ones that still failed
+        self.slow_rows = 0
+        self.bad_rows = 0
+
+    def _compile(self):
+        """
+        Build the function that converts a list of column values to a JobStep.
+        
+        This is straight-line code generated from CONVERSIONS for this 
+        particular list of fields, so there's no per-column dispatch.
+        """
+        for f in self.fields:
+            if not re.match(r'^[A-Za-z]\w*$',f):
+                raise ValueError("Bad sacct field name [%s]" % f)
+
+        body = ['%s, = values' % ','.join(self.fields), 'd = {}']
+        for f in self.fields:
+            body.append(CONVERSIONS.get(f,"d['%s'] = strings[%s]" % (f,f)))
+        if 'ReqMem' in self.fields:
+            body.append(REQMEM_CONVERSION)
+        body.extend(['j = JobStep()','j.__dict__ = d','return j'])
+
+        namespace = {
+            'JobStep'    : JobStep,
+            'strings'    : self.strings,
+            'ints'       : self.ints,
+            'seconds'    : self.seconds,
+            'memory_kB'  : self.memory_kB,
+            'states'     : self.states,
+            'reqmems'    : self.reqmems,
+            'timestamps' : self.timestamps,
+        }
+        parse_values = self._define('parse_values',body,namespace)
+        parse_values.__doc__ = "Return a JobStep for the list of column values."
+        return parse_values
+
+    def _compile_appender(self,table,rows):
+        """
+        Build the function that converts a list of column values to a tuple
+        of what the JobStepTable stores for self.attributes, appends that to
+        the list rows, and returns the row's JobID as a string pool index.
+        
+        Like parse_values, this is straight-line code for these fields.
+        """
+        string_ids = table._string_ids
+        ncpus = 'ints[NCPUS]' if 'NCPUS' in self.fields else '1'
+        
+        body = ['%s, = values' % ','.join(self.fields)]
+        for f in self.fields:
+            code = TABLE_CONVERSIONS.get(f,"v_%s = string_ids[%s]" % (f,f))
+            if f == 'ReqMem':
+                code = code % ncpus
+            body.append(code)
+        body.append('append_row((%s,))' % ','.join('v_%s' % a for a in self.attributes))
+        body.append('return v_JobID')
+        
+        namespace = {
+            'string_ids'    : string_ids,
+            'ints'          : self.ints,
+            'seconds'       : self.seconds,
+            'memory_kB'     : self.memory_kB,
+            'state_ids'     : Memo(lambda State: tuple(string_ids[s] for s in state(State))),
+            'reqmem_values' : Memo(lambda key: tuple(_null(v) for v in reqmem(key))),
+            'epochs'        : Memo(epoch),
+            'append_row'    : rows.append,
+        }
+        append_values = self._define('append_values',body,namespace)
+        append_values.__doc__ = "Append a row of table values for the list of column values."
+        return append_values
+
+    def _define(self,name,body,namespace):
+        """
+        Compile a function of values from the list of code blocks, with the
+        given globals.
+        """
+        lines = []
+        for code in body:
+            lines.extend(['    ' + line for line in code.strip().split('\n') if line.strip()])
+        source = 'def %s(values):\n' % name + '\n'.join(lines) + '\n'
+        exec compile(source,'<SacctParser %s>' % ','.join(self.fields),'exec') in namespace
+        return namespace[name]
+
+    def split(self,line):
+        """
+        Return the list of column values for a line, or None if it can't be
+        split into the right number of columns.
+        """
+        values = line.split('|')
+        if len(values) == self.nfields:
+            return values
+        return self._split_slow(line)
+
+    def _split_slow(self,line):
+        """
+        split() for lines that don't have the right number of columns.
+        
+        JobName is the only free-text column, so any extra pipes must be part
+        of it.  The columns before JobName are taken from the front of the 
+        line, the ones after it from the end, and JobName gets what's left.
+        """
+        self.slow_rows += 1
+        values = line.split('|')
+        extra = len(values) - self.nfields
+        if extra > 0 and self.jobname is not None:
+            i = self.jobname
+            return values[:i] + ['|'.join(values[i:i+extra+1])] + values[i+extra+1:]
+        self.bad_rows += 1
+        logger.warning("Unable to parse sacct line [%r]: %d columns instead of %d" % (line,len(values),self.nfields))
+        return None
+
+    def parse_line(self,line):
+        """
+        Return a JobStep for one line of sacct output, or None if the line is
+        blank or can't be parsed.
+        """
+        line = line.strip()
+        if line == '':
+            return None
+        values = self.split(line)
+        if values is None:
+            return None
+        return self.parse_values(values)
+
+    def parse(self,lines):
+        """
+        Yield a JobStep for each parsable line in the iterable of lines.
+        """
+        debug = logger.isEnabledFor(logging.DEBUG)
+        parse_values = self.parse_values
+        nfields = self.nfields
+        for line in lines:
+            # (this is parse_line, inlined)
+            line = line.strip()
+            if line == '':
+                continue
+            values = line.split('|')
+            if len(values) != nfields:
+                values = self._split_slow(line)
+                if values is None:
+                    continue
+            j = parse_values(values)
+            if debug:
+                logger.debug("User %s, JobID %s" % (j['User'],j['JobID']))
+            yield j
+
+    def parse_into(self,table,lines,batch_rows=1024):
+        """
+        Append a row to the JobStepTable for each parsable line in the 
+        iterable of lines, and yield the (start,end) row range of each job.
+        The table must have been made with self.attributes.
+        
+        The rows are the same as appending the JobSteps from parse(), but the
+        values go straight into the columns, without making JobSteps.  Rows 
+        are buffered as tuples and added to the columns about batch_rows at 
+        a time, a column at a time, since filling an array from a list is 
+        much cheaper than appending to it a value at a time.  So the ranges
+        come out in batches too.  (When they do, the columns may already have
+        the first row of the next job, though len(table) doesn't count it 
+        yet.)
+        """
+        if 'JobID' not in self.fields:
+            raise ValueError("JobID is required to parse sacct lines into a table")
+        rows = []
+        append_values = self._compile_appender(table,rows)
+        columns = [table.columns[a] for a in self.attributes]
+        def flush():
+            for column,values in zip(columns,zip(*rows)):
+                column.fromlist(list(values))
+            del rows[:]
+        
+        nfields = self.nfields
+        start = n = table.nrows
+        ranges = []
+        currentjobid = None
+        for line in lines:
+            line = line.strip()
+            if line == '':
+                continue
+            values = line.split('|')
+            if len(values) != nfields:
+                values = self._split_slow(line)
+                if values is None:
+                    continue
+            JobID = append_values(values)
+            if JobID != currentjobid:
+                if n > start:
+                    ranges.append((start,n))
+                    start = n
+                    if len(rows) > batch_rows:
+                        flush()
+                        table.nrows = n
+                        for r in ranges:
+                            yield r
+                        ranges = []
+                currentjobid = JobID
+            n += 1
+        
+        flush()
+        table.nrows = n
+        if n > start:
+            ranges.append((start,n))
+        for r in ranges:
+            yield r
@@ -0,0 +1,206 @@
+# Copyright (c) 2013-2014
+# Harvard FAS Research Computing
+# All rights reserved.
+
+"""parsing of scontrol show node --oneliner output
+
+tokenize() splits a line into key=value pairs in one regular expression
+pass.  A key is only recognized after whitespace, so values that contain
+spaces (OS=Linux 3.10.0 #1 SMP ..., Reason=Not responding [slurm@...]) stay
+whole.
+
+parse_node() turns a line into a NodeRecord, a __slots__ object with the
+common fields converted to Python types (see FIELD_TYPES); anything else is
+kept as a str in its extra dict.  Repeated values (States, Partitions,
+Features, etc.) are converted once and shared between records, so a
+snapshot() of the whole cluster is cheap to take and to keep.
+"""
+
+
+import re
+
+from slyme import util
+from slyme.sacctparser import Memo, timestamp
+
+
+#--- tokenizing
+
+_key_re = re.compile(r'(?:^|\s+)([A-Za-z][A-Za-z0-9_]*)=')
+
+def tokenize(line):
+	"""Return the list of (key, value) pairs in a scontrol --oneliner line."""
+	parts = _key_re.split(line.strip())
+	#parts is ['', key1, value1, key2, value2, ...]
+	return zip(parts[1::2], parts[2::2])
+
+
+#--- conversions
+
+#values that mean there's no value
+NULLS = ('', '(null)', 'N/A', 'n/a', 'n/s', 'None', 'Unknown')
+
+#State suffixes, which scontrol appends to the state to flag it
+STATE_SUFFIXES = {
+	'*': 'NOT_RESPONDING',
+	'~': 'POWERED_DOWN',
+	'#': 'POWERING_UP',
+	'%': 'POWERING_DOWN',
+	'$': 'MAINTENANCE',
+	'@': 'REBOOT_REQUESTED',
+	'!': 'PENDING_POWER_DOWN',
+}
+
+def _int(s):
+	if s in NULLS:
+		return None
+	return int(s)
+
+def _float(s):
+	if s in NULLS:
+		return None
+	return float(s)
+
+def _str(s):
+	if s in NULLS:
+		return None
+	return intern(s)
+
+#commas that aren't inside parentheses, e.g. not the one in gpu:2(IDX:0,2)
+_list_comma_re = re.compile(r',(?![^(]*\))')
+
+def _list(s):
+	if s in NULLS:
+		return ()
+	return tuple(intern(v) for v in _list_comma_re.split(s))
+
+def _timestamp(s):
+	if s in NULLS:
+		return None
+	return timestamp(s)
+
+def _state(s):
+	"""Split a State, e.g. MIXED+DRAIN or IDLE*, into the base state and the
+	tuple of flags."""
+	flags = []
+	while s and s[-1] in STATE_SUFFIXES:
+		flags.append(STATE_SUFFIXES[s[-1]])
+		s = s[:-1]
+	parts = s.split('+')
+	return intern(parts[0]), tuple(intern(f) for f in parts[1:] + flags)
+
+
+#types of the common fields; memory is in MB, as scontrol reports it
+FIELD_TYPES = (
+	('NodeName'        , _str),
+	('Arch'            , _str),
+	('CoresPerSocket'  , _int),
+	('CPUAlloc'        , _int),
+	('CPUErr'          , _int),
+	('CPUTot'          , _int),
+	('CPULoad'         , _float),
+	('AvailableFeatures', _list),
+	('ActiveFeatures'  , _list),
+	('Features'        , _list),
+	('Gres'            , _list),
+	('GresDrain'       , _list),
+	('GresUsed'        , _list),
+	('NodeAddr'        , _str),
+	('NodeHostName'    , _str),
+	('OS'              , _str),
+	('RealMemory'      , _int),
+	('AllocMem'        , _int),
+	('FreeMem'         , _int),
+	('Sockets'         , _int),
+	('Boards'          , _int),
+	('ThreadsPerCore'  , _int),
+	('TmpDisk'         , _int),
+	('Weight'          , _int),
+	('Owner'           , _str),
+	('Partitions'      , _list),
+	('BootTime'        , _timestamp),
+	('SlurmdStartTime' , _timestamp),
+	('LastBusyTime'    , _timestamp),
+	('CfgTRES'         , _str),
+	('AllocTRES'       , _str),
+	('CurrentWatts'    , _int),
+	('LowestJoules'    , _int),
+	('ConsumedJoules'  , _int),
+	('Reason'          , _str),
+)
+
+#the NodeRecord attributes: the common fields, and State split in two
+FIELDS = tuple(name for name, conversion in FIELD_TYPES) + ('State', 'StateFlags')
+
+#each distinct value of a field is only converted once
+_conversions = dict((name, Memo(conversion)) for name, conversion in FIELD_TYPES)
+_conversions['State'] = Memo(_state)
+
+
+class NodeRecord(object):
+	"""One node of scontrol show node output.
+
+	Each of FIELDS is an attribute, None if scontrol didn't report it (or
+	reported it as null), and extra is a dict of any other fields, as strs.
+	"""
+	__slots__ = FIELDS + ('extra',)
+
+	def __init__(self):
+		for name in FIELDS:
+			setattr(self, name, None)
+		self.StateFlags = ()
+		self.extra = {}
+
+	def get(self, key, default=None):
+		"""The value of a field, whether common or extra."""
+		if key in self.__slots__:
+			return getattr(self, key)
+		return self.extra.get(key, default)
+
+	def as_dict(self):
+		d = dict(self.extra)
+		for name in FIELDS:
+			d[name] = getattr(self, name)
+		return d
+
+	def __repr__(self):
+		return 'NodeRecord(NodeName=%r, State=%r)' % (self.NodeName, self.State)
+
+	def __getstate__(self):
+		return [getattr(self, name) for name in self.__slots__]
+
+	def __setstate__(self, state):
+		for name, value in zip(self.__slots__, state):
+			setattr(self, name, value)
+
+
+def parse_node(line):
+	"""Parse a scontrol --oneliner line into a NodeRecord."""
+	record = NodeRecord()
+	conversions = _conversions
+	try:
+		for key, value in tokenize(line):
+			if key=='State':
+				record.State, record.StateFlags = conversions['State'][value]
+			elif key in conversions:
+				setattr(record, key, conversions[key][value])
+			else:
+				record.extra[intern(key)] = value
+	except (ValueError, TypeError), e:
+		raise Exception("unable to parse scontrol node text [%r]: %r\n" % (line, e))
+	return record
+
+
+#--- retrieval
+
+def get_node_records(NodeName=None):
+	"""Yield a NodeRecord for each node, or just the named node(s)."""
+	shv = ['scontrol', 'show', 'node', '--oneliner']
+	if NodeName is not None:
+		shv.append(NodeName)
+	for line in util.runsh_i(shv):
+		if line.strip()!='':
+			yield parse_node(line)
+
+def snapshot():
+	"""Return a dict of NodeName to NodeRecord for the whole cluster."""
+	return dict((record.NodeName, record) for record in get_node_records())
@@ -6,7 +6,7 @@ Created on May 7, 2014
 from __future__ import print_function
 import unittest
 import os, sys
-from slyme import JobReport, Slurm
+from slyme import JobReport, JobStep, Slurm
 
 
 
@@ -166,6 +166,68 @@ class Test(unittest.TestCase):
         #for jobreport in jobreports:
             #print("JobID is %s" % jobreport["JobID"])
 
+    def test_ValueCaching(self):
+        """
+        Aggregates are computed once, and again when the jobsteps change
+        """
+        text="""
+10812627|akitzmiller|dusagetest.sbatch|COMPLETED|general|8|1|00:17:36|00:55.225|00:47.644|00:07.580|200Mc||2014-05-16T13:36:40|2014-05-16T13:38:52|holy2a09303|00:24:32||
+10812627.batch||batch|COMPLETED||1|1|00:02:12|00:55.225|00:47.644|00:07.580|200Mc|64100K|2014-05-16T13:36:40|2014-05-16T13:38:52|holy2a09303|00:24:32|1000K|1000K
+10812628.batch||batch|COMPLETED||1|1|00:02:12|00:55.225|00:47.644|00:07.580|200Mc|128200K|2014-05-16T13:36:40|2014-05-16T13:38:52|holy2a09303|00:24:32|1000K|1000K
+"""
+        jr, other = Slurm.getJobReports(execfunc = FakeRunSh(text).runsh_i)
+        
+        scans = []
+        summarize = jr._summarize
+        def counting_summarize():
+            scans.append(len(jr.jobsteps))
+            return summarize()
+        jr._summarize = counting_summarize
+        
+        for i in range(3):
+            self.assertEqual(jr.MaxRSS_kB, 64100)
+            self.assertEqual(jr.Mem_Wasted, 2500)
+        self.assertEqual(scans, [2])
+        
+        # Adding a step invalidates the cache
+        jr.jobsteps.append(other.jobsteps[0])
+        self.assertEqual(jr.MaxRSS_kB, 128200)
+        
+        # As does replacing them
+        jr.jobsteps = jr.jobsteps[:1]
+        self.assertEqual(jr.MaxRSS_kB, 0)
+        self.assertEqual(scans, [2, 3, 1])
+
+    def test_DropSteps(self):
+        """
+        The keys are the same after the steps are dropped
+        """
+        text="""
+10048462|akitzmiller|bash|CANCELLED by 0|interact|1|1|02:08:33|08:01.433|06:47.955|01:13.477|2.001Gn|2409232K|2014-05-01T11:43:26|2014-05-01T13:51:59|holy2a18206|00:24:32|305276K|110396K
+10101624|akitzmiller|agalmatest.sbatch|FAILED|bigmem|8|1|00:30:08|03:37.192|02:57.685|00:39.506|300000Mn||2014-05-04T10:34:55|2014-05-04T10:38:41|holybigmem08|00:24:32||
+10101624.batch||batch|FAILED||1|1|00:03:46|03:37.192|02:57.685|00:39.506|300000Mn|2407896K|2014-05-04T10:34:55|2014-05-04T10:38:41|holybigmem08|00:24:32|1000K|1000K
+"""
+        for jr in Slurm.getJobReports(execfunc = FakeRunSh(text).runsh_i):
+            expected = dict((key, jr.get_value_for_index(key)) for key in JobReport.keys)
+            compact = JobReport(jr.jobsteps, keep_steps=False)
+            self.assertEqual(compact.jobsteps, None)
+            for key in JobReport.keys:
+                self.assertEqual(compact[key], expected[key], key)
+
+
+    def test_MaxFloors(self):
+        """
+        The max keys are their floor when no step has a value, and None 
+        when there are no steps
+        """
+        js = JobStep()
+        js.JobID = '10048463'
+        jr = JobReport([js])
+        for key, floor in JobReport.max_keys:
+            self.assertEqual(jr[key], floor, key)
+        empty = JobReport([])
+        for key, floor in JobReport.max_keys:
+            self.assertEqual(empty[key], None, key)
 
 
 if __name__ == "__main__":
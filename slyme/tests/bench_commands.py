@@ -0,0 +1,67 @@
+# Copyright (c) 2013-2014
+# Harvard FAS Research Computing
+# All rights reserved.
+
+"""benchmark of per-call Slurm command setup
+
+usage: python bench_commands.py [N]
+
+This reports how many sbatch commands per second can be prepared (copied
+from the template and given a job's parameters) with the copy.deepcopy the
+Slurm methods used to do and with Slurm.newCommand, then how many
+Slurm.submitJob calls per second go through against a fake sbatch that
+just prints a job id.
+"""
+
+import sys, os, copy, time, tempfile, shutil
+
+from slyme import Slurm
+
+
+FAKE_SBATCH = """#!/bin/sh
+echo "Submitted batch job 1"
+"""
+
+def prepare_deepcopy(i):
+	sbatch = copy.deepcopy(Slurm.sbatch)
+	sbatch.command = "echo %d" % i
+	sbatch.setArgValue('partition', 'general')
+	sbatch.setArgValue('mem', '100')
+	return sbatch
+
+def prepare_newCommand(i):
+	sbatch = Slurm.newCommand('sbatch')
+	sbatch.command = "echo %d" % i
+	sbatch.setArgValue('partition', 'general')
+	sbatch.setArgValue('mem', '100')
+	return sbatch
+
+def bench(name, f, n):
+	t = time.time()
+	for i in xrange(n):
+		f(i)
+	t = time.time() - t
+	print "%-12s %7d in %6.2fs: %9.0f/sec" % (name, n, t, n/t)
+	return n/t
+
+
+if __name__=='__main__':
+	n = 10000
+	if len(sys.argv) > 1:
+		n = int(sys.argv[1])
+
+	Slurm.initcmds()
+	before = bench('deepcopy', prepare_deepcopy, n)
+	after = bench('newCommand', prepare_newCommand, n)
+	print "speedup: %.1fx" % (after/before)
+
+	tmpdir = tempfile.mkdtemp()
+	try:
+		path = os.path.join(tmpdir, 'sbatch')
+		with open(path, 'w') as f:
+			f.write(FAKE_SBATCH)
+		os.chmod(path, 0755)
+		os.environ['PATH'] = tmpdir + os.pathsep + os.environ['PATH']
+		bench('submitJob', lambda i: Slurm.submitJob("echo %d" % i, scriptpath=tmpdir, partition='general'), max(n/100, 1))
+	finally:
+		shutil.rmtree(tmpdir)
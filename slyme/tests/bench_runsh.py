@@ -0,0 +1,102 @@
+# Copyright (c) 2013-2014
+# Harvard FAS Research Computing
+# All rights reserved.
+
+"""benchmark of reading sacct output from a subprocess
+
+usage: python bench_runsh.py [NROWS]
+
+This writes a synthetic sacct --parsable2 dump of NROWS rows (default one
+million, see bench_sacctparser.write_dump), then pipes it through cat and
+reports MB/sec for the original runsh_i line splitting and job block
+assembly (reproduced below as legacy_runsh_i and legacy_blocks) and for the
+current runsh_i and Slurm._yield_raw_sacct_job_text_blocks.
+"""
+
+import sys, os, select, subprocess, time, tempfile
+
+from slyme import Slurm
+from slyme.util import runsh_i, sherrcheck
+
+from bench_sacctparser import write_dump
+
+
+def legacy_runsh_i(sh):
+	"""runsh_i as it was, with 4 kB reads and per-line concatenation."""
+	BLOCK_SIZE = 4096
+	p = subprocess.Popen(sh, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+	stdout = ''
+	stderr = ''
+	stdoutDone, stderrDone = False, False
+	while not (stdoutDone and stderrDone):
+		rfds, ignored, ignored2 = select.select([p.stdout.fileno(), p.stderr.fileno()], [], [])
+		if p.stdout.fileno() in rfds:
+			s = os.read(p.stdout.fileno(), BLOCK_SIZE)
+			if s=='':
+				stdoutDone = True
+			else:
+				i = 0
+				j = s.find('\n')
+				while j!=-1:
+					yield stdout + s[i:j+1]
+					stdout = ''
+					i = j+1
+					j = s.find('\n',i)
+				stdout += s[i:]
+		if p.stderr.fileno() in rfds:
+			s = os.read(p.stderr.fileno(), BLOCK_SIZE)
+			if s=='':
+				stderrDone = True
+			else:
+				stderr += s
+	if stdout!='':
+		yield stdout
+	sherrcheck(sh, stderr, p.wait())
+
+
+def legacy_blocks(lines):
+	"""_yield_raw_sacct_job_text_blocks as it was, concatenating each line."""
+	text = ''
+	for line in lines:
+		if line.startswith('|'):
+			text += line
+		else:
+			if text!='': yield text
+			text = line
+	if text!='':
+		yield text
+
+
+def bench(name, iterable, nbytes):
+	t = time.time()
+	n = 0
+	for x in iterable:
+		n += 1
+	t = time.time() - t
+	print "%-8s %9d items in %6.2fs: %7.1f MB/sec" % (name, n, t, nbytes/t/1024**2)
+	return nbytes/t
+
+
+if __name__=='__main__':
+	nrows = 1000000
+	if len(sys.argv) > 1:
+		nrows = int(sys.argv[1])
+
+	fd, filename = tempfile.mkstemp(suffix='.sacct')
+	try:
+		with os.fdopen(fd, 'w') as f:
+			nrows = write_dump(f, nrows)
+		nbytes = os.path.getsize(filename)
+		cat = ['cat', filename]
+
+		print "lines:"
+		before = bench('legacy', legacy_runsh_i(cat), nbytes)
+		after = bench('runsh_i', runsh_i(cat), nbytes)
+		print "speedup: %.1fx" % (after/before)
+
+		print "job blocks:"
+		before = bench('legacy', legacy_blocks(legacy_runsh_i(cat)), nbytes)
+		after = bench('current', Slurm._yield_raw_sacct_job_text_blocks(execfunc=lambda shv: runsh_i(cat)), nbytes)
+		print "speedup: %.1fx" % (after/before)
+	finally:
+		os.remove(filename)
@@ -0,0 +1,199 @@
+# Copyright (c) 2013-2014
+# Harvard FAS Research Computing
+# All rights reserved.
+
+"""benchmark of sacct parsing throughput
+
+usage: python bench_sacctparser.py [NROWS]
+
+This writes a synthetic sacct --parsable2 dump of NROWS rows (default one
+million), then reports rows/sec for the original inline getJobReports parsing
+code (reproduced below as legacy_parse) and for SacctParser, then for
+building a JobStepTable a row at a time from SacctParser and a column at a
+time with kernels.parse_table, and last for Slurm.getJobReports in object and
+columnar mode.
+"""
+
+import sys, os, re, time, random, tempfile, logging
+from datetime import datetime, timedelta
+
+from slyme import Slurm, JobStep
+from slyme.sacctparser import SacctParser, DEFAULT_FIELDS
+from slyme import kernels
+from slyme.columnar import JobStepTable
+
+
+logger = logging.getLogger('slyme')
+
+
+def write_dump(f, nrows):
+	"""Write about nrows of plausible sacct output, two or three rows per job.
+
+	Returns the number of rows actually written.
+	"""
+	r = random.Random(0)
+	users = ['user%03d' % i for i in range(200)]
+	partitions = ['general', 'serial_requeue', 'interact', 'bigmem', 'unrestricted']
+	reqmems = ['100Mc', '1000Mn', '4000Mc', '2.001Gn', '32Gn', '250Mc']
+	states = ['COMPLETED', 'COMPLETED', 'COMPLETED', 'FAILED', 'TIMEOUT', 'CANCELLED by 0']
+	t0 = datetime(2014, 5, 1)
+	JobID = 10000000
+	i = 0
+	while i < nrows:
+		JobID += 1
+		start = t0 + timedelta(seconds=r.randint(0, 30*86400))
+		end = start + timedelta(seconds=r.randint(0, 86400))
+		s = start.strftime('%Y-%m-%dT%H:%M:%S')
+		e = end.strftime('%Y-%m-%dT%H:%M:%S')
+		ncpus = r.choice([1, 1, 2, 4, 8, 16, 64])
+		elapsed = '%02d:%02d:%02d' % ((end-start).seconds/3600, (end-start).seconds/60%60, (end-start).seconds%60)
+		node = 'holy2a%02d%03d' % (r.randint(1,18), r.randint(100,408))
+		state = r.choice(states)
+		reqmem = r.choice(reqmems)
+		f.write('%d|%s|job%d.sbatch|%s|%s|%d|1|%s|%s|%s|00:07.580|%s||%s|%s|%s|%s||\n' % (
+			JobID, r.choice(users), r.randint(0,50), state, r.choice(partitions), ncpus,
+			elapsed, elapsed, elapsed, reqmem, s, e, node, elapsed))
+		f.write('%d.batch||batch|%s||1|1|%s|%s|%s|00:07.580|%s|%dK|%s|%s|%s|%s|%dK|%dK\n' % (
+			JobID, state, elapsed, elapsed, elapsed, reqmem, r.randint(1000,9000000), s, e, node, elapsed,
+			r.randint(1000,9000000), r.randint(1000,9000000)))
+		i += 2
+		if ncpus > 8 and i < nrows:
+			f.write('%d.0||hostname|%s||%d|1|%s|%s|%s|00:07.580|%s|%dK|%s|%s|%s|%s|%dK|%dK\n' % (
+				JobID, state, ncpus, elapsed, elapsed, elapsed, reqmem, r.randint(1000,9000000), s, e, node, elapsed,
+				r.randint(1000,9000000), r.randint(1000,9000000)))
+			i += 1
+	return i
+
+
+def legacy_parse(lines):
+	"""The per-row parsing getJobReports did before SacctParser."""
+	cancelledbyre = re.compile(r'CANCELLED by (\d+)')
+	for line in lines:
+		line = line.strip()
+		if line=='':
+			continue
+		JobID,User,JobName,State,Partition,NCPUS,NNodes,CPUTime,\
+			TotalCPU,UserCPU,SystemCPU,ReqMem,MaxRSS,Start,End,\
+			NodeList,Elapsed,MaxVMSize,AveVMSize = line.split("|")
+		logger.debug("User %s, JobID %s" % (User,JobID))
+
+		JobStepName = ''
+		if '.' in JobID:
+			JobID, JobStepName = JobID.split('.')
+
+		j = JobStep()
+		j.JobID         = JobID
+		j.JobStepName   = JobStepName
+		j.User          = User
+		j.JobName       = JobName
+		m1 = cancelledbyre.match(State)
+		CancelledBy = None
+		if m1 is not None:
+			CancelledBy = m1.group(1)
+			State = 'CANCELLED'
+		j.State         = State
+		j.CancelledBy   = CancelledBy
+		j.Partition     = Partition
+		j.NCPUS         = int(NCPUS)
+		j.NNodes        = int(NNodes)
+		j.CPUTime       = Slurm.slurmtime_to_seconds(CPUTime)
+		j.TotalCPU      = Slurm.slurmtime_to_seconds(TotalCPU)
+		j.UserCPU       = Slurm.slurmtime_to_seconds(UserCPU)
+		j.SystemCPU     = Slurm.slurmtime_to_seconds(SystemCPU)
+		j.Elapsed       = Slurm.slurmtime_to_seconds(Elapsed)
+		j.Start = None
+		if Start and Start != 'Unknown':
+			j.Start = datetime.strptime(Start,"%Y-%m-%dT%H:%M:%S")
+		j.End = None
+		if End and End != 'Unknown':
+			j.End = datetime.strptime(End,"%Y-%m-%dT%H:%M:%S")
+		j.NodeList      = NodeList
+		j.ReqMem_bytes = 0
+		if ReqMem.endswith('Mn'):
+			j.ReqMem_bytes_per_node = j.ReqMem_bytes = int(ReqMem[:-2])*1024**2
+			j.ReqMem_bytes_per_core = None
+			j.ReqMem_MB_total       = int(ReqMem[:-2])
+		elif ReqMem.endswith('Mc'):
+			j.ReqMem_bytes_per_node = None
+			j.ReqMem_bytes_per_core = j.ReqMem_bytes = int(ReqMem[:-2])*1024**2
+			j.ReqMem_MB_total       = int(ReqMem[:-2]) * int(NCPUS)
+		elif ReqMem.endswith('Gn'):
+			j.ReqMem_bytes_per_node = j.ReqMem_bytes = int(round(float(ReqMem[:-2])*1024**3))
+			j.ReqMem_bytes_per_core = None
+			j.ReqMem_MB_total       = int(round(float(ReqMem[:-2]) * int(NCPUS)))
+		elif ReqMem.endswith('Gc'):
+			j.ReqMem_bytes_per_node = None
+			j.ReqMem_bytes_per_core = j.ReqMem_bytes = int(round(float(ReqMem[:-2])*1024**3))
+			j.ReqMem_MB_total       = int(round(float(ReqMem[:-2]) * int(NCPUS)))
+		j.MaxRSS_kB = 0
+		j.MaxRSS_MB = 0
+		if MaxRSS:
+			j.MaxRSS_kB = Slurm.MaxRSS_to_kB(MaxRSS)
+			j.MaxRSS_MB = j.MaxRSS_kB / 1024
+		j.MaxVMSize_MB = 0
+		if MaxVMSize:
+			j.MaxVMSize_MB = Slurm.MaxRSS_to_kB(MaxVMSize) / 1024
+		j.AveVMSize_MB = 0
+		if AveVMSize:
+			j.AveVMSize_MB = Slurm.MaxRSS_to_kB(AveVMSize) / 1024
+		yield j
+
+
+def table_parse(lines):
+	"""SacctParser JobSteps appended to a JobStepTable a row at a time."""
+	parser = SacctParser(DEFAULT_FIELDS)
+	table = JobStepTable(parser.attributes)
+	for j in parser.parse(lines):
+		table.append(j)
+	return xrange(len(table))
+
+
+def kernels_parse(lines):
+	"""kernels.parse_table, as an iterable of one item per row."""
+	return xrange(len(kernels.parse_table(lines, SacctParser(DEFAULT_FIELDS))))
+
+
+def report_rows(columnar):
+	"""Slurm.getJobReports over the lines, as an iterable of one item per row."""
+	def parse(lines):
+		for jr in Slurm.getJobReports(columnar=columnar, execfunc=lambda shv: lines):
+			for i in xrange(len(jr.jobsteps)):
+				yield i
+	return parse
+
+
+def bench(name, parse, filename, nrows):
+	with open(filename) as f:
+		t = time.time()
+		n = 0
+		for j in parse(f):
+			n += 1
+		t = time.time() - t
+	assert n == nrows, "%s parsed %d rows, not %d" % (name, n, nrows)
+	print "%-12s %9d rows in %6.2fs: %9.0f rows/sec" % (name, n, t, n/t)
+	return n/t
+
+
+if __name__=='__main__':
+	nrows = 1000000
+	if len(sys.argv) > 1:
+		nrows = int(sys.argv[1])
+
+	fd, filename = tempfile.mkstemp(suffix='.sacct')
+	try:
+		with os.fdopen(fd, 'w') as f:
+			nrows = write_dump(f, nrows)
+
+		before = bench('legacy', legacy_parse, filename, nrows)
+		after = bench('SacctParser', SacctParser(DEFAULT_FIELDS).parse, filename, nrows)
+		print "speedup: %.1fx" % (after/before)
+
+		rows = bench('table', table_parse, filename, nrows)
+		columns = bench('kernels', kernels_parse, filename, nrows)
+		print "speedup: %.1fx (numpy %s)" % (columns/rows, 'available' if kernels.numpy is not None else 'not available')
+
+		objects = bench('objects', report_rows(False), filename, nrows)
+		columnar = bench('columnar', report_rows(True), filename, nrows)
+		print "speedup: %.1fx" % (columnar/objects)
+	finally:
+		os.remove(filename)
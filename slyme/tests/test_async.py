@@ -0,0 +1,90 @@
+# Copyright (c) 2013-2014
+# Harvard FAS Research Computing
+# All rights reserved.
+
+"""unit tests"""
+
+import sys, os, time, tempfile, shutil
+import unittest
+
+from slyme import Slurm, ShMultiplexer
+from slyme import nodes
+
+import settings
+from test_columnar import SACCT_TEXT
+
+
+SCRIPTS = {
+	#sacct --format State for the status lookup, otherwise the report text
+	'sacct': """#!/bin/sh
+case "$*" in
+	*"--format State"*) echo COMPLETED ;;
+	*) sleep 0.5; cat "$(dirname "$0")/sacct.txt" ;;
+esac
+""",
+	#job 1 is running, the rest are no longer in the queue
+	'squeue': """#!/bin/sh
+sleep 0.5
+case "$*" in
+	*"--jobs 1 "*) echo RUNNING ;;
+	*) echo "slurm_load_jobs error: Invalid job id specified" >&2; exit 1 ;;
+esac
+""",
+	'scontrol': """#!/bin/sh
+sleep 0.5
+echo "NodeName=holy2a01101 Arch=x86_64 CoresPerSocket=8 CPUAlloc=12 CPUErr=0 CPUTot=16 CPULoad=11.50 Features=intel"
+echo "NodeName=holy2a01102 Arch=x86_64 CoresPerSocket=8 CPUAlloc=0 CPUErr=0 CPUTot=16 CPULoad=0.01 Features=intel"
+""",
+}
+
+
+class AsyncTestCase(unittest.TestCase):
+	def setUp(self):
+		self.tmpdir = tempfile.mkdtemp()
+		for name, text in SCRIPTS.items():
+			path = os.path.join(self.tmpdir, name)
+			with open(path, 'w') as f:
+				f.write(text)
+			os.chmod(path, 0755)
+		with open(os.path.join(self.tmpdir, 'sacct.txt'), 'w') as f:
+			f.write(SACCT_TEXT)
+		self.path = os.environ['PATH']
+		os.environ['PATH'] = self.tmpdir + os.pathsep + self.path
+
+	def tearDown(self):
+		os.environ['PATH'] = self.path
+		shutil.rmtree(self.tmpdir)
+
+	def test_queries_share_one_loop(self):
+		mux = ShMultiplexer()
+		reports = []
+		statuses = {}
+		nodelist = []
+		done = []
+		Slurm.getJobReportsAsync(mux, reports.append, ondone=done.append, starttime='2014-05-01')
+		for jobid in (1, 2):
+			Slurm.getJobStatusAsync(mux, jobid, lambda status, jobid=jobid: statuses.__setitem__(jobid, status.strip()))
+		nodes.get_nodes_async(mux, nodelist.append, filter=lambda n: n['CPUAlloc'] > 0)
+		t = time.time()
+		mux.run()
+		#four half second commands, and one more after squeue for job 2
+		self.assertTrue(time.time() - t < 1.9)
+
+		self.assertEqual(done, [None])
+		self.assertEqual([jr.JobID for jr in reports], ['10048462', '10058675', '10101624', '10812627', '10897512'])
+		self.assertEqual(reports[2].MaxRSS_kB, 2407896)
+		self.assertEqual(statuses, {1: 'RUNNING', 2: 'COMPLETED'})
+		self.assertEqual([n['NodeName'] for n in nodelist], ['holy2a01101'])
+
+	def test_compact(self):
+		mux = ShMultiplexer()
+		reports = []
+		Slurm.getJobReportsAsync(mux, reports.append, compact=True)
+		mux.run()
+		self.assertEqual(len(reports), 5)
+		self.assertEqual(reports[2].jobsteps, None)
+		self.assertEqual(reports[2].MaxRSS_kB, 2407896)
+
+
+if __name__=='__main__':
+	unittest.main()
@@ -0,0 +1,90 @@
+# Copyright (c) 2013-2014
+# Harvard FAS Research Computing
+# All rights reserved.
+
+"""unit tests"""
+
+import sys, os
+import unittest
+
+from slyme import Slurm, JobReport, JobStepTable, JobReportView
+
+import settings
+
+
+SACCT_TEXT = """\
+10048462|akitzmiller|bash|CANCELLED by 0|interact|1|1|02:08:33|08:01.433|06:47.955|01:13.477|2.001Gn|2409232K|2014-05-01T11:43:26|2014-05-01T13:51:59|holy2a18206|00:24:32|305276K|110396K
+10058675|akitzmiller|bash|CANCELLED by 100278|bigmem|0|2|00:00:00|00:00:00|00:00:00|00:00:00|300000Mn||2014-05-01T17:26:17|2014-05-01T17:26:17|None assigned|00:24:32|5682012K|5682012K
+10101624|akitzmiller|agalmatest.sbatch|FAILED|bigmem|8|1|00:30:08|03:37.192|02:57.685|00:39.506|300000Mn||2014-05-04T10:34:55|2014-05-04T10:38:41|holybigmem08|00:24:32||
+10101624.batch||batch|FAILED||1|1|00:03:46|03:37.192|02:57.685|00:39.506|300000Mn|2407896K|2014-05-04T10:34:55|2014-05-04T10:38:41|holybigmem08|00:24:32|1000K|1000K
+10812627|akitzmiller|dusagetest.sbatch|COMPLETED|general|8|1|00:17:36|00:55.225|00:47.644|00:07.580|200Mc||2014-05-16T13:36:40|2014-05-16T13:38:52|holy2a09303|00:24:32||
+10812627.batch||batch|COMPLETED||1|1|00:02:12|00:55.225|00:47.644|00:07.580|200Mc|64100K|2014-05-16T13:36:40|2014-05-16T13:38:52|holy2a09303|00:24:32|1000K|1000K
+10897512|akitzmiller|bash|RUNNING|interact|1|1|02:04:34|00:00:00|00:00:00|00:00:00|1000Mn|0|2014-05-20T09:24:43|Unknown|holy2a18208|00:24:32|1000K|1000K
+"""
+
+def fake_runsh_i(sh):
+	for line in SACCT_TEXT.splitlines(True):
+		yield line
+
+
+class ColumnarTestCase(unittest.TestCase):
+	def test_columnar_matches_objects(self):
+		"""That every JobReport key is the same in columnar and object mode."""
+		objects = list(Slurm.getJobReports(execfunc=fake_runsh_i))
+		views = list(Slurm.getJobReports(execfunc=fake_runsh_i, columnar=True))
+
+		self.assertEqual(len(views), len(objects))
+		for jr, jv in zip(objects, views):
+			self.assertTrue(isinstance(jv, JobReportView))
+			self.assertEqual(len(jv.jobsteps), len(jr.jobsteps))
+			for key in JobReport.keys:
+				self.assertEqual(jv[key], jr[key],
+					"%s differs for JobID %s: %r != %r" % (key, jr.JobID, jv[key], jr[key])
+				)
+
+	def test_views_share_one_table(self):
+		views = list(Slurm.getJobReports(execfunc=fake_runsh_i, columnar=True))
+		table = views[0].table
+		self.assertEqual(len(table), 7)
+		for jv in views:
+			self.assertTrue(jv.table is table)
+		#contiguous, non-overlapping row ranges
+		self.assertEqual([ (jv.start, jv.end) for jv in views ], [ (0,1), (1,2), (2,4), (4,6), (6,7) ])
+
+	def test_jobstep_round_trip(self):
+		views = list(Slurm.getJobReports(execfunc=fake_runsh_i, columnar=True))
+		steps = views[2].jobsteps
+		self.assertEqual(steps[1].JobStepName, 'batch')
+		self.assertEqual(steps[1].MaxRSS_kB, 2407896)
+		self.assertEqual(steps[-1].End.minute, 38)
+		self.assertEqual(steps[0].ReqMem_bytes_per_core, None)
+		self.assertEqual(views[4].jobsteps[0].End, None)
+
+	def test_string_interning(self):
+		views = list(Slurm.getJobReports(execfunc=fake_runsh_i, columnar=True))
+		table = views[0].table
+		#'akitzmiller', 'bash', etc. are stored once
+		self.assertEqual(len(table.strings), len(set(table.strings)))
+		self.assertEqual(list(table.column('User')).count(table.column('User')[0]), 5)
+
+
+class CompactTestCase(unittest.TestCase):
+	def test_compact_matches_objects(self):
+		objects = list(Slurm.getJobReports(execfunc=fake_runsh_i))
+		for columnar in (False, True):
+			compact = list(Slurm.getJobReports(execfunc=fake_runsh_i, compact=True, columnar=columnar))
+			self.assertEqual(len(compact), len(objects))
+			for jr, jc in zip(objects, compact):
+				self.assertEqual(jc.jobsteps, None)
+				for key in JobReport.keys:
+					self.assertEqual(jc[key], jr[key], "%s differs for JobID %s" % (key, jr.JobID))
+
+	def test_compact_sliced(self):
+		reports = list(Slurm.getJobReports(execfunc=fake_runsh_i, compact=True, slices=2, processes=1,
+			starttime='2014-05-01T00:00:00', endtime='2014-05-21T00:00:00'))
+		self.assertEqual([jr.JobID for jr in reports], ['10048462', '10058675', '10101624', '10812627', '10897512'])
+		self.assertEqual(reports[2].MaxRSS_kB, 2407896)
+
+
+if __name__=='__main__':
+	unittest.main()
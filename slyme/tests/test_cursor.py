@@ -0,0 +1,70 @@
+# Copyright (c) 2013-2014
+# Harvard FAS Research Computing
+# All rights reserved.
+
+"""unit tests"""
+
+import sys, os, datetime, tempfile, shutil
+import unittest
+
+from slyme import Slurm
+from slyme.cursor import SacctCursor
+
+import settings
+from test_jobcache import FakeSacct
+
+
+class SacctCursorTestCase(unittest.TestCase):
+	def setUp(self):
+		self.tmpdir = tempfile.mkdtemp()
+		t = datetime.datetime(2014, 5, 1)
+		h = datetime.timedelta(hours=1)
+		self.sacct = FakeSacct({
+			'100': ['COMPLETED', t+1*h, t+2*h],
+			'101': ['FAILED',    t+3*h, t+5*h],
+			'102': ['RUNNING',   t+4*h, None],
+		})
+
+	def tearDown(self):
+		shutil.rmtree(self.tmpdir)
+
+	def run_report(self, fail=False, **kwargs):
+		jobids = []
+		try:
+			with SacctCursor('report', path=self.tmpdir) as cursor:
+				for jr in Slurm.getJobReports(cursor=cursor, execfunc=self.sacct, **kwargs):
+					jobids.append(jr.JobID)
+				if fail:
+					raise RuntimeError("report failed")
+		except RuntimeError:
+			pass
+		return sorted(jobids)
+
+	def test_only_new_jobs(self):
+		self.assertEqual(self.run_report(starttime='2014-05-01T00:00:00'), ['100', '101'])
+		self.assertEqual(self.run_report(), [])
+
+		#the running job finishes and a new one shows up
+		self.sacct.jobs['102'] = ['COMPLETED', datetime.datetime(2014, 5, 1, 4), datetime.datetime(2014, 5, 1, 8)]
+		self.sacct.jobs['103'] = ['COMPLETED', datetime.datetime(2014, 5, 1, 6), datetime.datetime(2014, 5, 1, 9)]
+		self.assertEqual(self.run_report(), ['102', '103'])
+
+	def test_query_starts_at_cursor(self):
+		self.run_report(starttime='2014-05-01T00:00:00')
+		self.run_report()
+		shv = self.sacct.calls[-1]
+		args = dict(zip(shv, shv[1:]))
+		#latest End, less the overlap
+		self.assertEqual(args['--starttime'], '2014-05-01T04:55:00')
+
+	def test_not_committed_on_failure(self):
+		self.assertEqual(self.run_report(fail=True, starttime='2014-05-01T00:00:00'), ['100', '101'])
+		self.assertEqual(SacctCursor('report', path=self.tmpdir).mark, None)
+		self.assertEqual(self.run_report(starttime='2014-05-01T00:00:00'), ['100', '101'])
+
+	def test_bad_name(self):
+		self.assertRaises(ValueError, SacctCursor, '../report', path=self.tmpdir)
+
+
+if __name__=='__main__':
+	unittest.main()
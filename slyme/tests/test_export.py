@@ -0,0 +1,62 @@
+# Copyright (c) 2013-2014
+# Harvard FAS Research Computing
+# All rights reserved.
+
+"""unit tests"""
+
+import sys, os, tempfile, shutil
+import unittest
+
+from slyme import Slurm
+from slyme import export
+from slyme.columnar import datetime_to_epoch
+
+import settings
+from test_columnar import fake_runsh_i
+
+
+class ExportTestCase(unittest.TestCase):
+	def setUp(self):
+		self.tmpdir = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.tmpdir)
+
+	def test_jsonl_batches(self):
+		"""That every job step comes out once, in batches of batch_rows."""
+		path = os.path.join(self.tmpdir, 'steps.jsonl')
+		self.assertEqual(export.export_job_steps(path, format='jsonl', batch_rows=3, execfunc=fake_runsh_i), 7)
+
+		batches = list(export.read_jsonl_batches(path))
+		self.assertEqual([len(b['JobID']) for b in batches], [3, 3, 1])
+
+		steps = [j for jr in Slurm.getJobReports(execfunc=fake_runsh_i) for j in jr.jobsteps]
+		rows = [dict((k, b[k][i]) for k in b) for b in batches for i in range(len(b['JobID']))]
+		for j, row in zip(steps, rows):
+			self.assertEqual(row['JobID'], j.JobID)
+			self.assertEqual(row['CancelledBy'], j.CancelledBy)
+			self.assertEqual(row['TotalCPU'], j.TotalCPU)
+			self.assertEqual(row['MaxRSS_kB'], j.MaxRSS_kB)
+			self.assertEqual(row['ReqMem_MB_total'], j.ReqMem_MB_total)
+			self.assertEqual(row['End'], None if j.End is None else datetime_to_epoch(j.End))
+
+	def test_fields(self):
+		path = os.path.join(self.tmpdir, 'steps.jsonl')
+		export.export_job_steps(path, format='jsonl', fields=['User', 'ReqMem_MB_total'], execfunc=lambda shv: iter(['1234|jdoe|4|100Mc\n']))
+		batch, = export.read_jsonl_batches(path)
+		self.assertEqual(sorted(batch.keys()), ['JobID', 'JobStepName', 'NCPUS', 'ReqMem_MB_total', 'ReqMem_bytes', 'ReqMem_bytes_per_core', 'ReqMem_bytes_per_node', 'User'])
+		self.assertEqual(batch['ReqMem_MB_total'], [400])
+
+	def test_bad_format(self):
+		self.assertRaises(Exception, export.export_job_steps, os.path.join(self.tmpdir, 'x'), format='csv', execfunc=fake_runsh_i)
+
+	@unittest.skipIf(export.pyarrow is None, "pyarrow is not installed")
+	def test_parquet(self):
+		path = os.path.join(self.tmpdir, 'steps.parquet')
+		export.export_job_steps(path, format='parquet', batch_rows=3, execfunc=fake_runsh_i)
+		table = export.pyarrow.parquet.read_table(path)
+		self.assertEqual(table.num_rows, 7)
+
+
+if __name__=='__main__':
+	unittest.main()
@@ -0,0 +1,67 @@
+# Copyright (c) 2013-2014
+# Harvard FAS Research Computing
+# All rights reserved.
+
+"""unit tests"""
+
+import sys, os
+import unittest
+
+from slyme import Slurm
+from slyme import hostlist
+from slyme.hostlist import NodeIndex
+
+import settings
+from test_columnar import fake_runsh_i
+
+
+class HostlistTestCase(unittest.TestCase):
+	def test_expand(self):
+		self.assertEqual(hostlist.expand('holy2a[01-03,07],holybigmem08'), ['holy2a01', 'holy2a02', 'holy2a03', 'holy2a07', 'holybigmem08'])
+		self.assertEqual(hostlist.expand('rack[1-2]n[08-09]'), ['rack1n08', 'rack1n09', 'rack2n08', 'rack2n09'])
+		self.assertEqual(hostlist.expand('None assigned'), [])
+		self.assertRaises(ValueError, hostlist.expand, 'holy2a[01-')
+
+	def test_compress(self):
+		names = ['holy2a07', 'holy2a01', 'holybigmem08', 'holy2a02', 'holy2a03', 'login', 'holy2a02']
+		self.assertEqual(hostlist.compress(names), 'holy2a[01-03,07],holybigmem08,login')
+		self.assertEqual(hostlist.compress(['n9', 'n10', 'n010']), 'n[9-10,010]')
+		self.assertEqual(hostlist.compress(['node10', 'node08', 'node09']), 'node[08-10]')
+		self.assertEqual(hostlist.compress(['n9', 'n09', 'n8', 'n08']), 'n[8-9,08-09]')
+
+	def test_compress_round_trip(self):
+		"""That compress(expand(x)) == x for hostlists written in compress's order."""
+		for expression in (
+			'holy2a[01-04,07],holy2b[09108-09110]',
+			'node[08-10]',
+			'node[098-100,105]',
+			'n[9-10,010]',
+			'n[0-12]',
+			'rack1n[08-09],rack2n[08-09]',
+			'holybigmem08',
+			'holy2a[01-02],login,holy2b07',
+		):
+			self.assertEqual(hostlist.compress(hostlist.expand(expression)), expression)
+
+	def test_node_set_shared(self):
+		s = hostlist.node_set('holy2a[01-04]')
+		self.assertTrue(s is hostlist.node_set('holy2a[01-04]'))
+		self.assertTrue('holy2a03' in s)
+
+	def test_bitmap(self):
+		index = NodeIndex()
+		a = index.hostlist_bitmap('n[1-4]')
+		b = index.hostlist_bitmap('n[3-6]')
+		self.assertEqual(index.nodes(a & b), ['n3', 'n4'])
+		self.assertEqual(len(index), 6)
+
+	def test_jobreport_nodes(self):
+		reports = list(Slurm.getJobReports(execfunc=fake_runsh_i))
+		self.assertEqual([jr for jr in reports if 'holybigmem08' in jr.nodes][0].JobID, '10101624')
+		self.assertEqual(reports[1].nodes, frozenset())
+		index = NodeIndex()
+		self.assertEqual(index.nodes(reports[0].node_bitmap(index) | reports[4].node_bitmap(index)), ['holy2a18206', 'holy2a18208'])
+
+
+if __name__=='__main__':
+	unittest.main()
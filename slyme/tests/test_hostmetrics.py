@@ -0,0 +1,145 @@
+# Copyright (c) 2013-2014
+# Harvard FAS Research Computing
+# All rights reserved.
+
+"""unit tests"""
+
+import sys, os, time, shutil, tempfile
+import unittest
+
+from slyme import hostmetrics, util
+
+import settings
+
+
+MEMINFO_TEXT = """MemTotal:       65931224 kB
+MemFree:        40000000 kB
+MemAvailable:   50000000 kB
+Buffers:          500000 kB
+Cached:          5000000 kB
+SwapCached:       100000 kB
+Active:         10000000 kB
+"""
+
+STAT_TEXT = """cpu  100 10 50 800 40 5 5 0 20 0
+cpu0 50 5 25 400 20 3 2 0 10 0
+intr 12345
+"""
+
+STAT_TEXT_LATER = """cpu  160 10 70 900 40 5 15 0 20 0
+cpu0 80 5 35 450 20 3 7 0 10 0
+intr 12399
+"""
+
+
+def write(path, text):
+	if not os.path.isdir(os.path.dirname(path)):
+		os.makedirs(os.path.dirname(path))
+	with open(path, 'w') as f:
+		f.write(text)
+
+
+class HostMetricsTestCase(unittest.TestCase):
+	def setUp(self):
+		self.tmpdir = tempfile.mkdtemp()
+		self.proc = os.path.join(self.tmpdir, 'proc')
+		write(os.path.join(self.proc, 'meminfo'), MEMINFO_TEXT)
+		write(os.path.join(self.proc, 'loadavg'), '12.50 11.90 11.20 13/2016 54847\n')
+		write(os.path.join(self.proc, 'stat'), STAT_TEXT)
+		self.cgroup = os.path.join(self.tmpdir, 'cgroup')
+		self.host = hostmetrics.HostMetrics(
+			proc=self.proc,
+			cgroup_v1_cpu=os.path.join(self.cgroup, 'cpuacct', 'slurm'),
+			cgroup_v1_memory=os.path.join(self.cgroup, 'memory', 'slurm'),
+			cgroup_v2=os.path.join(self.cgroup, 'system.slice', 'slurmstepd.scope'),
+		)
+
+	def tearDown(self):
+		self.host.close()
+		shutil.rmtree(self.tmpdir)
+
+	def test_parse(self):
+		self.assertEqual(hostmetrics.parse_meminfo(MEMINFO_TEXT), (65931224, 65931224 - 45600000))
+		self.assertEqual(hostmetrics.parse_loadavg('0.00 0.01 0.05 1/200 123'), 0)
+		self.assertEqual(hostmetrics.parse_stat(STAT_TEXT), (170, 1010))
+		self.assertEqual(hostmetrics.parse_cpu_list('0-3,8,10-11\n'), 7)
+
+	def test_readings(self):
+		self.assertEqual(self.host.running_tasks(), 12)
+		self.assertEqual(self.host.memory(), (65931224, 65931224 - 45600000))
+
+		#the same descriptor is re-read, and sees the new contents
+		write(os.path.join(self.proc, 'loadavg'), '1.00 1.00 1.00 3/2016 54847\n')
+		fd = self.host._files['loadavg'].fd
+		self.assertEqual(self.host.running_tasks(), 2)
+		self.assertEqual(self.host._files['loadavg'].fd, fd)
+
+	def test_fork(self):
+		"""That a forked child opens its own files instead of sharing the parent's."""
+		self.assertEqual(self.host.running_tasks(), 12)
+		r, w = os.pipe()
+		pid = os.fork()
+		if pid==0:
+			try:
+				os.close(r)
+				inherited = self.host._files['loadavg']
+				ok = self.host.running_tasks()==12 and self.host._files['loadavg'] is not inherited
+				os.write(w, ok and 'ok' or 'bad')
+			finally:
+				os._exit(0)
+		os.close(w)
+		result = os.read(r, 16)
+		os.close(r)
+		os.waitpid(pid, 0)
+		self.assertEqual(result, 'ok')
+		#the parent's descriptor is still open and readable
+		self.assertEqual(self.host.running_tasks(), 12)
+
+	def test_cpu_utilization(self):
+		self.assertAlmostEqual(self.host.cpu_utilization(), 170.0/1010)
+		write(os.path.join(self.proc, 'stat'), STAT_TEXT_LATER)
+		#90 busy out of 190
+		self.assertAlmostEqual(self.host.cpu_utilization(), 90.0/190)
+		self.assertEqual(self.host.cpu_utilization(), 0.0)
+
+	def test_cgroup_v1(self):
+		cpu = os.path.join(self.cgroup, 'cpuacct', 'slurm', 'uid_500', 'job_1234')
+		memory = os.path.join(self.cgroup, 'memory', 'slurm', 'uid_500', 'job_1234')
+		write(os.path.join(cpu, 'cpuacct.usage'), '5000000000\n')
+		write(os.path.join(memory, 'memory.usage_in_bytes'), '1048576\n')
+		self.assertEqual(self.host.job_usage(), {'1234': (5.0, None, 1048576)})
+
+		write(os.path.join(cpu, 'cpuacct.usage'), '6000000000\n')
+		cpu_seconds, cores, memory_bytes = self.host.job_usage()['1234']
+		self.assertEqual(cpu_seconds, 6.0)
+		self.assertTrue(cores > 0)
+
+	def test_cgroup_v2(self):
+		job = os.path.join(self.cgroup, 'system.slice', 'slurmstepd.scope', 'job_99')
+		write(os.path.join(job, 'cpu.stat'), 'usage_usec 2500000\nuser_usec 2000000\nsystem_usec 500000\n')
+		write(os.path.join(job, 'memory.current'), '4096\n')
+		os.makedirs(os.path.join(self.cgroup, 'system.slice', 'slurmstepd.scope', 'system'))
+		self.assertEqual(self.host.job_usage(), {'99': (2.5, None, 4096)})
+
+	def test_no_cgroups(self):
+		self.assertEqual(self.host.job_usage(), {})
+
+	def test_this_host(self):
+		"""That the readings work here, and util uses them."""
+		host = hostmetrics.HostMetrics()
+		try:
+			self.assertTrue(host.cores() > 0)
+			self.assertTrue(0 < host.cores_allowed() <= host.cores())
+			total, used = host.memory()
+			self.assertTrue(0 < used < total)
+			self.assertTrue(0.0 <= host.cpu_utilization() <= 1.0)
+			time.sleep(0.05)
+			self.assertTrue(0.0 <= host.cpu_utilization() <= 1.0)
+		finally:
+			host.close()
+		self.assertEqual(util.get_cpu()[0], host.cores())
+		self.assertEqual(util.get_mem()[0], total)
+
+
+if __name__=='__main__':
+	unittest.main()
@@ -4,9 +4,10 @@
 
 """unit tests"""
 
-import sys, os, datetime
+import sys, os, datetime, json
 import unittest
 
+import slyme
 from slyme import Slurm
 
 import settings
@@ -35,6 +36,28 @@ class TestCase(unittest.TestCase):
 			"%s != %s, instead got %s" % (td, tstr, tstr2)
 		)
 
+	def test_command_definitions(self):
+		"""That the four command definitions initcmds loads parse, and load."""
+		conf = os.path.join(os.path.dirname(slyme.__file__), 'conf', '14.03.8')
+		for name in ('sacct', 'squeue', 'sbatch', 'scancel'):
+			with open(os.path.join(conf, name + '.json')) as f:
+				definition = json.load(f)
+			self.assertEqual(definition['name'], name)
+			self.assertTrue(len(definition['parameterdefs']) > 0)
+		Slurm.initcmds()
+		for name in ('sacct', 'squeue', 'sbatch', 'scancel'):
+			self.assertTrue(getattr(Slurm, name) is not None, name)
+			self.assertTrue(Slurm.newCommand(name) is not getattr(Slurm, name), name)
+
+	def test_newCommand(self):
+		"""That command instances share definitions but not values."""
+		squeue = Slurm.newCommand('squeue')
+		self.assertTrue(squeue is not Slurm.squeue)
+		self.assertTrue(squeue.parameterdefs is Slurm.squeue.parameterdefs)
+		squeue.jobs = '1'
+		self.assertEqual(squeue.jobs, '1')
+		self.assertNotEqual(getattr(Slurm.squeue, 'jobs', None), '1')
+		self.assertNotEqual(getattr(Slurm.newCommand('squeue'), 'jobs', None), '1')
 
 if __name__=='__main__':
 	unittest.main()
@@ -0,0 +1,134 @@
+# Copyright (c) 2013-2014
+# Harvard FAS Research Computing
+# All rights reserved.
+
+"""unit tests"""
+
+import sys, os, datetime
+import unittest
+
+from slyme import Slurm
+
+import settings
+
+
+#(JobID, Start, End) of some fake jobs, in submission order
+JOBS = []
+for i in range(40):
+	start = datetime.datetime(2014, 5, 1) + datetime.timedelta(hours=7*i)
+	#every fifth job runs for days, so it spans several slices
+	if i % 5 == 0:
+		end = start + datetime.timedelta(days=3)
+	else:
+		end = start + datetime.timedelta(hours=2)
+	JOBS.append((str(10000000+i), start, end))
+
+#one that was pending for a long time, so its JobID is out of time order
+JOBS.append(('9999999', datetime.datetime(2014, 5, 6, 12), datetime.datetime(2014, 5, 6, 13)))
+
+def fake_sacct(shv):
+	"""Imitation runsh_i for sacct, which honors --starttime and --endtime."""
+	args = dict(zip(shv, shv[1:]))
+	starttime = Slurm.parse_slurm_timestamp(args['--starttime'])
+	endtime = Slurm.parse_slurm_timestamp(args['--endtime'])
+	for JobID, start, end in JOBS:
+		if start <= endtime and end >= starttime:
+			s = Slurm.datetime_to_slurm_timestamp(start)
+			e = Slurm.datetime_to_slurm_timestamp(end)
+			yield '%s|jdoe|job%s|COMPLETED|general|1|1|02:00:00|01:00:00|00:50:00|00:10:00|1000Mn||%s|%s|holy2a01101|02:00:00||\n' % (JobID, JobID, s, e)
+			yield '%s.batch||batch|COMPLETED||1|1|02:00:00|01:00:00|00:50:00|00:10:00|1000Mn|1000K|%s|%s|holy2a01101|02:00:00|1000K|1000K\n' % (JobID, s, e)
+
+
+class SlicedTestCase(unittest.TestCase):
+	def setUp(self):
+		self.kwargs = dict(
+			execfunc=fake_sacct,
+			starttime='2014-05-02T00:00:00',
+			endtime='2014-05-10T00:00:00',
+		)
+		self.expected = sorted(set(jr.JobID for jr in Slurm.getJobReports(**self.kwargs)), key=int)
+
+	def test_split_time_window(self):
+		start = datetime.datetime(2014, 5, 1)
+		end = datetime.datetime(2014, 5, 2)
+		intervals = Slurm.split_time_window(start, end, 4)
+		self.assertEqual(len(intervals), 4)
+		self.assertEqual(intervals[0][0], start)
+		self.assertEqual(intervals[-1][1], end)
+		for (s1, e1), (s2, e2) in zip(intervals, intervals[1:]):
+			self.assertEqual(e1, s2)
+		self.assertEqual(intervals[1][0], datetime.datetime(2014, 5, 1, 6))
+
+	def test_sliced_matches_single_query(self):
+		jobids = [jr.JobID for jr in Slurm.getJobReports(slices=5, processes=1, **self.kwargs)]
+		self.assertEqual(jobids, self.expected)
+
+	def test_sliced_process_pool(self):
+		reports = list(Slurm.getJobReports(slices=4, processes=2, **self.kwargs))
+		self.assertEqual([jr.JobID for jr in reports], self.expected)
+		#the reports survive the trip back from the pool intact
+		self.assertEqual(reports[0].MaxRSS_kB, 1000)
+		self.assertEqual(len(reports[0].jobsteps), 2)
+
+	def test_sliced_columnar(self):
+		reports = list(Slurm.getJobReports(slices=3, processes=2, columnar=True, **self.kwargs))
+		self.assertEqual([jr.JobID for jr in reports], self.expected)
+		self.assertEqual(reports[-1].CPUTime, 7200)
+
+	def test_parse_slurm_timestamp(self):
+		"""That sacct's time formats are understood, relative to now."""
+		now = datetime.datetime(2014, 5, 10, 15, 30, 20, 123)
+		for ts, expected in (
+			('2014-05-01T10:34:55', datetime.datetime(2014, 5, 1, 10, 34, 55)),
+			('2014-05-01T10:34', datetime.datetime(2014, 5, 1, 10, 34)),
+			('2014-05-01', datetime.datetime(2014, 5, 1)),
+			('05/01', datetime.datetime(2014, 5, 1)),
+			('05/01/13', datetime.datetime(2013, 5, 1)),
+			('05/01/13-08:00', datetime.datetime(2013, 5, 1, 8)),
+			('05.01.13', datetime.datetime(2013, 5, 1)),
+			('050113', datetime.datetime(2013, 5, 1)),
+			('0501', datetime.datetime(2014, 5, 1)),
+			('08:15', datetime.datetime(2014, 5, 10, 8, 15)),
+			('8:15:30pm', datetime.datetime(2014, 5, 10, 20, 15, 30)),
+			('now', datetime.datetime(2014, 5, 10, 15, 30, 20)),
+			('now-1days', datetime.datetime(2014, 5, 9, 15, 30, 20)),
+			('now-2hours', datetime.datetime(2014, 5, 10, 13, 30, 20)),
+			('now+90', datetime.datetime(2014, 5, 10, 15, 31, 50)),
+			('now-1week', datetime.datetime(2014, 5, 3, 15, 30, 20)),
+			('midnight', datetime.datetime(2014, 5, 10)),
+			('today', datetime.datetime(2014, 5, 10)),
+			('noon', datetime.datetime(2014, 5, 10, 12)),
+			('teatime', datetime.datetime(2014, 5, 10, 16)),
+			('tomorrow', datetime.datetime(2014, 5, 11)),
+		):
+			self.assertEqual(Slurm.parse_slurm_timestamp(ts, now), expected, ts)
+		for ts in ('yesterday-ish', 'now-1fortnight', '13:00pm', '2014-05-01T25:00', ''):
+			self.assertRaises(ValueError, Slurm.parse_slurm_timestamp, ts, now)
+
+	def test_sliced_sacct_times(self):
+		"""That slices work from sacct's other time formats, and are sent as absolute timestamps."""
+		kwargs = dict(self.kwargs, starttime='05/02/14', endtime='05/10/14-00:00')
+		jobids = [jr.JobID for jr in Slurm.getJobReports(slices=3, processes=1, **kwargs)]
+		self.assertEqual(jobids, self.expected)
+
+		calls = []
+		def sacct(shv):
+			calls.append(dict(zip(shv, shv[1:])))
+			return iter([])
+		self.assertEqual(list(Slurm.getJobReports(slices=2, processes=1, execfunc=sacct, starttime='now-2days')), [])
+		self.assertEqual(len(calls), 2)
+		self.assertEqual(calls[0]['--endtime'], calls[1]['--starttime'])
+		for args in calls:
+			for name in ('--starttime', '--endtime'):
+				datetime.datetime.strptime(args[name], '%Y-%m-%dT%H:%M:%S')
+
+	def test_bad_time(self):
+		"""That an unknown time format is rejected before sacct runs."""
+		self.assertRaises(ValueError, list, Slurm.getJobReports(slices=2, execfunc=fake_sacct, starttime='last tuesday'))
+
+	def test_starttime_required(self):
+		self.assertRaises(Exception, list, Slurm.getJobReports(slices=2, execfunc=fake_sacct))
+
+
+if __name__=='__main__':
+	unittest.main()
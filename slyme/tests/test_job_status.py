@@ -0,0 +1,103 @@
+# Copyright (c) 2013-2014
+# Harvard FAS Research Computing
+# All rights reserved.
+
+"""unit tests"""
+
+import sys, os, tempfile, shutil
+import unittest
+
+from slyme import Slurm
+from slyme import cmd
+
+import settings
+
+
+SCRIPTS = {
+	#jobs 1 and 3 are in the queue
+	'squeue': """#!/bin/sh
+echo "squeue $*" >> "$(dirname "$0")/calls"
+for id in $(echo "$2" | tr , ' '); do
+	case $id in
+		1) echo "1 RUNNING" ;;
+		3) echo "3 PENDING" ;;
+	esac
+done
+echo "slurm_load_jobs error: Invalid job id specified" >&2
+""",
+	#job 4 failed, and sacct knows nothing about 5
+	'sacct': """#!/bin/sh
+echo "sacct $*" >> "$(dirname "$0")/calls"
+for id in $(echo "$2" | tr , ' '); do
+	case $id in
+		4.batch) echo "4.batch|FAILED" ;;
+		5.batch) ;;
+		*) echo "$id|COMPLETED" ;;
+	esac
+done
+""",
+}
+
+
+class JobStatusesTestCase(unittest.TestCase):
+	def setUp(self):
+		self.tmpdir = tempfile.mkdtemp()
+		for name, text in SCRIPTS.items():
+			path = os.path.join(self.tmpdir, name)
+			with open(path, 'w') as f:
+				f.write(text)
+			os.chmod(path, 0755)
+		self.path = os.environ['PATH']
+		os.environ['PATH'] = self.tmpdir + os.pathsep + self.path
+		self.jobs_per_query = Slurm.JOBS_PER_QUERY
+
+	def tearDown(self):
+		Slurm.JOBS_PER_QUERY = self.jobs_per_query
+		os.environ['PATH'] = self.path
+		shutil.rmtree(self.tmpdir)
+
+	def calls(self):
+		with open(os.path.join(self.tmpdir, 'calls')) as f:
+			return [line.split()[0] for line in f]
+
+	def test_getJobStatuses(self):
+		statuses = Slurm.getJobStatuses([1, 2, 3, 4, 5])
+		self.assertEqual(statuses, {'1': 'RUNNING', '2': 'COMPLETED', '3': 'PENDING', '4': 'FAILED', '5': None})
+		self.assertEqual(self.calls(), ['squeue', 'sacct'])
+
+	def test_chunks(self):
+		Slurm.JOBS_PER_QUERY = 2
+		statuses = Slurm.getJobStatuses(range(1, 8))
+		self.assertEqual(statuses['1'], 'RUNNING')
+		self.assertEqual(statuses['7'], 'COMPLETED')
+		#7 jobs in squeues of 2, then the 5 not in the queue in saccts of 2
+		self.assertEqual(self.calls(), ['squeue'] * 4 + ['sacct'] * 3)
+
+	def test_getJobStatus(self):
+		"""That getJobStatus runs the same squeue and sacct as getJobStatuses."""
+		self.assertEqual(Slurm.getJobStatus(1), 'RUNNING\n')
+		self.assertEqual(Slurm.getJobStatus(4), 'FAILED\n')
+		self.assertEqual(Slurm.getJobStatus(5), '')
+		self.assertEqual(self.calls(), ['squeue', 'squeue', 'sacct', 'squeue', 'sacct'])
+
+	def test_checkStatus(self):
+		"""That a SlurmRunner's checkStatus calls share one bulk lookup."""
+		runner = cmd.SlurmRunner()
+		runlogs = [{'jobid': str(i), 'cmdstring': 'sbatch job%d.sbatch' % i} for i in range(1, 6)]
+		runner.checkStatuses(runlogs[:1])
+		self.assertEqual(self.calls(), ['squeue'])
+		#the rest aren't in the last lookup, so they're all looked up together
+		runner.jobids.update(runlog['jobid'] for runlog in runlogs)
+		self.assertEqual([runner.checkStatus(runlog) for runlog in runlogs], [None, 'COMPLETED', None, 'FAILED', None])
+		self.assertEqual(self.calls(), ['squeue', 'squeue', 'sacct'])
+		self.assertEqual(runner.jobids, set(['1', '3', '5']))
+
+		self.assertEqual(runner.checkStatuses(runlogs), [None, 'COMPLETED', None, 'FAILED', None])
+		self.assertEqual(self.calls(), ['squeue', 'squeue', 'sacct', 'squeue', 'sacct'])
+
+	def test_empty(self):
+		self.assertEqual(Slurm.getJobStatuses([]), {})
+
+
+if __name__=='__main__':
+	unittest.main()
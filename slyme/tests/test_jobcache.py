@@ -0,0 +1,151 @@
+# Copyright (c) 2013-2014
+# Harvard FAS Research Computing
+# All rights reserved.
+
+"""unit tests"""
+
+import sys, os, datetime, tempfile, shutil
+import unittest
+
+from slyme import Slurm
+from slyme.jobcache import JobCache
+
+import settings
+
+
+class FakeSacct(object):
+	"""Imitation runsh_i for sacct, which honors --starttime, --endtime, --jobs and --format.
+
+	jobs is a dict of JobID -> [State, Start, End], which tests can change
+	between calls.  Every argv it is called with is recorded in calls.
+	"""
+	def __init__(self, jobs):
+		self.jobs = jobs
+		self.calls = []
+
+	def __call__(self, shv):
+		self.calls.append(shv)
+		args = dict(zip(shv, shv[1:]))
+		for JobID in sorted(self.jobs):
+			State, start, end = self.jobs[JobID]
+			if '--jobs' in args:
+				if JobID not in args['--jobs'].split(','):
+					continue
+			else:
+				starttime = Slurm.parse_slurm_timestamp(args['--starttime'])
+				endtime = Slurm.parse_slurm_timestamp(args['--endtime'])
+				if start > endtime or (end is not None and end < starttime):
+					continue
+			s = Slurm.datetime_to_slurm_timestamp(start)
+			e = end is not None and Slurm.datetime_to_slurm_timestamp(end) or 'Unknown'
+			for line in (
+				'%s|jdoe|job%s|%s|general|1|1|02:00:00|01:00:00|00:50:00|00:10:00|1000Mn||%s|%s|holy2a01101|02:00:00||' % (JobID, JobID, State, s, e),
+				'%s.batch||batch|%s||1|1|02:00:00|01:00:00|00:50:00|00:10:00|1000Mn|1000K|%s|%s|holy2a01101|02:00:00|1000K|1000K' % (JobID, State, s, e),
+			):
+				#only the --format columns
+				row = dict(zip(Slurm._sacct_format_parsable.split(','), line.split('|')))
+				yield '|'.join(row[f] for f in args['--format'].split(',')) + '\n'
+
+	def time_queries(self):
+		return [ shv for shv in self.calls if '--starttime' in shv ]
+
+
+class JobCacheTestCase(unittest.TestCase):
+	def setUp(self):
+		self.tmpdir = tempfile.mkdtemp()
+		self.path = os.path.join(self.tmpdir, 'jobs.sqlite')
+		t = datetime.datetime(2014, 5, 1)
+		h = datetime.timedelta(hours=1)
+		self.sacct = FakeSacct({
+			'100': ['COMPLETED', t+1*h, t+2*h],
+			'101': ['FAILED',    t+3*h, t+5*h],
+			'102': ['RUNNING',   t+4*h, None],
+			'103': ['CANCELLED by 0', t+6*h, t+6*h],
+		})
+		self.kwargs = dict(
+			execfunc=self.sacct,
+			starttime='2014-05-01T00:00:00',
+			endtime='2014-05-01T12:00:00',
+		)
+
+	def tearDown(self):
+		shutil.rmtree(self.tmpdir)
+
+	def jobids(self, **kwargs):
+		args = dict(self.kwargs)
+		args.update(kwargs)
+		return sorted(jr.JobID for jr in Slurm.getJobReports(cache=self.path, **args))
+
+	def test_coverage(self):
+		cache = JobCache(self.path)
+		cache.add_coverage('q', 10, 20)
+		cache.add_coverage('q', 30, 40)
+		self.assertEqual(cache.uncovered('q', 0, 50), [(0,10), (20,30), (40,50)])
+		self.assertEqual(cache.uncovered('q', 12, 18), [])
+		cache.add_coverage('q', 15, 35)
+		self.assertEqual(cache.coverage('q'), [(10,40)])
+		self.assertEqual(cache.uncovered('other', 0, 5), [(0,5)])
+		cache.close()
+
+	def test_second_query_uses_cache(self):
+		self.assertEqual(self.jobids(), ['100', '101', '102', '103'])
+		self.assertEqual(len(self.sacct.time_queries()), 1)
+
+		self.assertEqual(self.jobids(), ['100', '101', '102', '103'])
+		#no time range was re-queried, only the running job
+		self.assertEqual(len(self.sacct.time_queries()), 1)
+		self.assertEqual(self.sacct.calls[-1][-2:], ['--jobs', '102'])
+
+	def test_cached_reports_are_complete(self):
+		first = dict((jr.JobID, jr) for jr in Slurm.getJobReports(cache=self.path, **self.kwargs))
+		second = dict((jr.JobID, jr) for jr in Slurm.getJobReports(cache=self.path, **self.kwargs))
+		self.assertEqual(second['101'].MaxRSS_kB, first['101'].MaxRSS_kB)
+		self.assertEqual(len(second['101'].jobsteps), 2)
+		self.assertEqual(second['103'].CancelledBy, '0')
+
+	def test_pending_job_finishes(self):
+		self.jobids()
+		self.sacct.jobs['102'][0] = 'COMPLETED'
+		self.sacct.jobs['102'][2] = datetime.datetime(2014, 5, 1, 7)
+		self.jobids()
+		ncalls = len(self.sacct.calls)
+		#now that it's finished, sacct isn't needed at all
+		self.assertEqual(self.jobids(), ['100', '101', '102', '103'])
+		self.assertEqual(len(self.sacct.calls), ncalls)
+
+	def test_partial_overlap(self):
+		self.jobids(endtime='2014-05-01T03:30:00')
+		self.assertEqual(self.jobids(), ['100', '101', '102', '103'])
+		#only the uncovered part of the window was fetched the second time
+		shv = self.sacct.time_queries()[-1]
+		args = dict(zip(shv, shv[1:]))
+		self.assertEqual(args['--starttime'], '2014-05-01T03:30:00')
+		self.assertEqual(args['--endtime'], '2014-05-01T12:00:00')
+
+	def test_window_filtering(self):
+		self.jobids()
+		self.assertEqual(self.jobids(starttime='2014-05-01T05:30:00'), ['102', '103'])
+
+	def test_sacct_times(self):
+		"""That the cache takes sacct's other time formats, and relative ones."""
+		self.assertEqual(self.jobids(starttime='05/01/14', endtime='05/01/14-12:00'), ['100', '101', '102', '103'])
+		self.assertEqual(len(self.sacct.time_queries()), 1)
+		#the same window, written the usual way, is already covered
+		self.assertEqual(self.jobids(), ['100', '101', '102', '103'])
+		self.assertEqual(len(self.sacct.time_queries()), 1)
+
+		#102 is still running
+		self.assertEqual(self.jobids(starttime='now-1hours', endtime=None), ['102'])
+		shv = self.sacct.time_queries()[-1]
+		args = dict(zip(shv, shv[1:]))
+		datetime.datetime.strptime(args['--starttime'], '%Y-%m-%dT%H:%M:%S')
+		self.assertRaises(ValueError, self.jobids, starttime='last tuesday')
+
+	def test_other_arguments_not_shared(self):
+		self.jobids()
+		self.jobids(user='jdoe')
+		self.assertEqual(len(self.sacct.time_queries()), 2)
+
+
+if __name__=='__main__':
+	unittest.main()
@@ -0,0 +1,86 @@
+# Copyright (c) 2013-2014
+# Harvard FAS Research Computing
+# All rights reserved.
+
+"""unit tests"""
+
+import sys, os, datetime, tempfile, shutil
+import unittest
+
+from slyme import Slurm
+from slyme.jobindex import JobIndex
+
+import settings
+from test_columnar import fake_runsh_i
+from test_jobcache import FakeSacct
+
+
+def t(day, hour=0):
+	return datetime.datetime(2014, 5, day, hour)
+
+
+class JobIndexTestCase(unittest.TestCase):
+	def setUp(self):
+		self.tmpdir = tempfile.mkdtemp()
+		self.path = os.path.join(self.tmpdir, 'index.sqlite')
+		self.index = JobIndex(self.path)
+		self.index.add_all(Slurm.getJobReports(execfunc=fake_runsh_i))
+
+	def tearDown(self):
+		self.index.close()
+		shutil.rmtree(self.tmpdir)
+
+	def test_node(self):
+		self.assertEqual(self.index.jobs(node='holy2a18206'), ['10048462'])
+		self.assertEqual(self.index.jobs(node='holy2a[18206,18208],holybigmem08'), ['10048462', '10101624', '10897512'])
+		self.assertEqual(self.index.nodes('10101624'), set(['holybigmem08']))
+
+	def test_many_nodes(self):
+		"""That a hostlist of more nodes than SQLite allows variables still works."""
+		self.assertEqual(self.index.jobs(node='holy2a[10000-19999]'), ['10048462', '10897512'])
+		self.assertEqual(self.index.jobs(node='holy2a[10000-19999],holybigmem[00-99]', user='akitzmiller'), ['10048462', '10101624', '10897512'])
+		self.assertEqual(self.index.jobs(node='None assigned'), [])
+
+	def test_user_partition(self):
+		self.assertEqual(self.index.jobs(partition='bigmem'), ['10058675', '10101624'])
+		self.assertEqual(self.index.jobs(user='akitzmiller', partition='interact'), ['10048462', '10897512'])
+		self.assertEqual(self.index.jobs(user='nobody'), [])
+
+	def test_time(self):
+		#10048462 ran 11:43-13:51 on 5/1
+		self.assertEqual(self.index.jobs(start=t(1, 12), end=t(1, 13)), ['10048462'])
+		self.assertEqual(self.index.jobs(start=t(1, 14), end=t(1, 15)), [])
+		#10897512 is still running
+		self.assertEqual(self.index.jobs(start=t(25)), ['10897512'])
+		self.assertEqual(self.index.jobs(end=t(3)), ['10048462', '10058675'])
+		self.assertEqual(self.index.jobs(node='holybigmem08', start=t(4), end=t(5)), ['10101624'])
+
+	def test_persistent(self):
+		self.index.close()
+		self.index = JobIndex(self.path)
+		self.assertEqual(len(self.index), 5)
+		self.assertEqual(self.index.job('10101624')['End'], datetime.datetime(2014, 5, 4, 10, 38, 41))
+		self.assertEqual(self.index.mark(), datetime.datetime(2014, 5, 16, 13, 38, 52))
+
+	def test_update(self):
+		h = datetime.timedelta(hours=1)
+		sacct = FakeSacct({
+			'100': ['COMPLETED', t(1, 1), t(1, 2)],
+			'102': ['RUNNING',   t(1, 4), None],
+		})
+		index = JobIndex(os.path.join(self.tmpdir, 'update.sqlite'))
+		index.update(starttime='2014-05-01T00:00:00', endtime='2014-05-02T00:00:00', execfunc=sacct)
+		self.assertEqual(index.jobs(start=t(1, 5), end=t(1, 6)), ['102'])
+
+		sacct.jobs['102'] = ['COMPLETED', t(1, 4), t(1, 5)]
+		sacct.jobs['103'] = ['COMPLETED', t(1, 6), t(1, 7)]
+		index.update(endtime='2014-05-02T00:00:00', execfunc=sacct)
+		#starts at the last End less the overlap, and refreshes the running job
+		self.assertEqual(dict(zip(sacct.calls[1], sacct.calls[1][1:]))['--starttime'], '2014-05-01T01:55:00')
+		self.assertEqual(index.jobs(start=t(1, 5, ), end=t(1, 6)), ['102', '103'])
+		self.assertEqual(index.jobs(start=t(1, 5, ) + h/2, end=t(1, 6) - h/2), [])
+		index.close()
+
+
+if __name__=='__main__':
+	unittest.main()
@@ -0,0 +1,92 @@
+# Copyright (c) 2013-2014
+# Harvard FAS Research Computing
+# All rights reserved.
+
+"""unit tests"""
+
+import sys, os
+import unittest
+
+from slyme import Slurm, JobStepTable
+from slyme import kernels
+from slyme.columnar import NULL_INT
+from slyme.sacctparser import SacctParser
+
+import settings
+from test_columnar import SACCT_TEXT
+
+
+class KernelsTestCase(unittest.TestCase):
+	def test_conversions_match_scalar(self):
+		tstrs = ['4-18:29:01', '05:03:43', '01:09.666', '05:03:43', '']
+		self.assertEqual(list(kernels.slurmtime_to_seconds(tstrs)), [Slurm.slurmtime_to_seconds(t) for t in tstrs])
+		self.assertEqual(list(kernels.slurm_time_interval_to_seconds(tstrs[:-1])), [Slurm.slurm_time_interval_to_seconds(t) for t in tstrs[:-1]])
+		mems = ['2409232K', '1.5M', '2G', '0', '16?', '2G']
+		self.assertEqual(list(kernels.MaxRSS_to_kB(mems)), [Slurm.MaxRSS_to_kB(m) for m in mems])
+		self.assertEqual(list(kernels.slurmmemory_to_kB(mems[:4])), [Slurm.slurmmemory_to_kB(m) for m in mems[:4]])
+		self.assertEqual(list(kernels.timestamp_to_epoch(['Unknown', '1970-01-01T00:01:00'])), [NULL_INT, 60])
+
+	def test_bad_value(self):
+		self.assertRaises(Exception, kernels.MaxRSS_to_kB, ['1K', '1024'])
+
+	def test_reqmem(self):
+		columns = kernels.ReqMem_to_bytes(['200Mc', '20000Mn', '0n', '200Mc'], [8, '8', 1, 2])
+		self.assertEqual([list(c) for c in columns], [
+			[200*1024**2, 20000*1024**2, 0, 200*1024**2],
+			[NULL_INT, 20000*1024**2, NULL_INT, NULL_INT],
+			[200*1024**2, NULL_INT, NULL_INT, 200*1024**2],
+			[1600, 20000, NULL_INT, 400],
+		])
+
+	def test_parse_table_matches_rows(self):
+		lines = SACCT_TEXT.splitlines() + ['', '10897513|jdoe|a|b|RUNNING|interact|1|1|02:04:34|00:00:00|00:00:00|00:00:00|1000Mn|0|2014-05-20T09:24:43|Unknown|holy2a18208|00:24:32|1000K|1000K']
+		parser = SacctParser(Slurm._sacct_format_parsable.split(','))
+		table = kernels.parse_table(lines, parser)
+		expected = JobStepTable(parser.attributes)
+		for j in SacctParser(parser.fields).parse(lines):
+			expected.append(j)
+
+		self.assertEqual(len(table), 8)
+		self.assertEqual(parser.slow_rows, 1)
+		for name in expected.columns:
+			self.assertEqual(list(table.values(name)), list(expected.values(name)), name)
+
+	def test_parse_table_empty(self):
+		self.assertEqual(len(kernels.parse_table(['', '\n'])), 0)
+
+	@unittest.skipIf(kernels.numpy is None, "numpy is not installed")
+	def test_numpy_matches_pure_python(self):
+		"""That the NumPy branch gives the same columns as the pure Python one."""
+		lines = (SACCT_TEXT.splitlines() * 3) + ['10897513|jdoe|a|b|RUNNING|interact|1|1|02:04:34|00:00:00|00:00:00|00:00:00|1000Mn|0|2014-05-20T09:24:43|Unknown|holy2a18208|00:24:32|1000K|1000K']
+		rows = [line.split('|') for line in SACCT_TEXT.splitlines()]
+		def convert():
+			columns = {
+				'slurmtime_to_seconds'  : kernels.slurmtime_to_seconds([r[7] for r in rows]),
+				'MaxRSS_to_kB'          : kernels.MaxRSS_to_kB([r[12] or '0' for r in rows]),
+				'slurmmemory_to_kB'     : kernels.slurmmemory_to_kB([r[17] or '0' for r in rows]),
+				'timestamp_to_epoch'    : kernels.timestamp_to_epoch([r[14] for r in rows]),
+			}
+			for i, column in enumerate(kernels.ReqMem_to_bytes([r[11] for r in rows], [r[5] for r in rows])):
+				columns['ReqMem_to_bytes %d' % i] = column
+			for name, column in columns.items():
+				columns[name] = column.tolist()
+			table = kernels.parse_table(lines, SacctParser(Slurm._sacct_format_parsable.split(',')))
+			for name in table.columns:
+				columns['parse_table %s' % name] = list(table.values(name))
+			return columns
+
+		with_numpy = convert()
+		numpy = kernels.numpy
+		kernels.numpy = None
+		try:
+			without_numpy = convert()
+		finally:
+			kernels.numpy = numpy
+
+		self.assertEqual(sorted(with_numpy.keys()), sorted(without_numpy.keys()))
+		for name in without_numpy:
+			self.assertEqual(with_numpy[name], without_numpy[name], name)
+
+
+if __name__=='__main__':
+	unittest.main()
@@ -0,0 +1,85 @@
+# Copyright (c) 2013-2014
+# Harvard FAS Research Computing
+# All rights reserved.
+
+"""unit tests"""
+
+import sys, os, time
+import unittest
+
+from slyme import nodeprobe, util
+from slyme.nodes import Node
+
+import settings
+
+
+PROBE_TEXT = """12.50 11.90 11.20 13/2016 54847
+16
+MemTotal:       65931224 kB
+MemFree:        40000000 kB
+Buffers:          500000 kB
+Cached:          5000000 kB
+SwapCached:       100000 kB
+Active:         10000000 kB
+"""
+
+
+def scontrol_node(NodeName):
+	n = Node()
+	n.load_data_from_scontrol_text("NodeName=%s CPUAlloc=16 CPUTot=16 CPULoad=12.50" % NodeName)
+	return n
+
+
+class NodeProbeTestCase(unittest.TestCase):
+	def test_parse(self):
+		self.assertEqual(nodeprobe.parse_probe_output(PROBE_TEXT), (16, 12, 65931224, 20331224))
+		self.assertRaises(ValueError, nodeprobe.parse_probe_output, '')
+
+	def test_collect(self):
+		"""That nodes are probed fanout at a time and their values merged in."""
+		nodes = [scontrol_node('holy2a01%03d' % i) for i in range(20)]
+		transport = nodeprobe.FakeTransport(dict((n['NodeName'], PROBE_TEXT) for n in nodes), delay=0.2)
+		t = time.time()
+		errors = nodeprobe.collect(nodes, transport, fanout=10)
+		self.assertTrue(time.time() - t < 1)
+		self.assertEqual(errors, {})
+		self.assertEqual(transport.calls, 20)
+		for n in nodes:
+			self.assertEqual(n['OS_Cores_Total'], 16)
+			self.assertEqual(n['OS_Cores_Used'], 12)
+			self.assertEqual(n['OS_Memory_Total'], 65931224)
+			self.assertEqual(n['OS_Memory_Used'], 20331224)
+			self.assertEqual(n['CPUAlloc'], 16)
+
+	def test_errors(self):
+		"""That failed and timed out nodes are reported and their keys left unset."""
+		nodes = [scontrol_node(name) for name in ('good', 'bad')]
+		transport = nodeprobe.FakeTransport({'good': PROBE_TEXT, 'bad': util.ShError("ssh failed")})
+		errors = nodeprobe.collect(nodes, transport)
+		self.assertEqual(errors.keys(), ['bad'])
+		self.assertEqual(nodes[0]['OS_Cores_Total'], 16)
+		Node.probe_transport = transport
+		try:
+			for key in nodeprobe.OS_KEYS:
+				self.assertFalse(dict.__contains__(nodes[1], key))
+				self.assertFalse(key in nodes[1])
+		finally:
+			Node.probe_transport = None
+		#not probed again
+		self.assertEqual(transport.calls, 2)
+
+		t = time.time()
+		errors = nodeprobe.collect(nodes, nodeprobe.FakeTransport({}, delay=10), timeout=0.2)
+		self.assertTrue(time.time() - t < 1)
+		self.assertEqual(sorted(errors.keys()), ['bad', 'good'])
+
+	def test_local(self):
+		"""That the probe command works here."""
+		n = scontrol_node('localhost')
+		self.assertEqual(nodeprobe.collect([n], nodeprobe.LocalTransport()), {})
+		self.assertTrue(n['OS_Cores_Total'] > 0)
+		self.assertTrue(0 < n['OS_Memory_Used'] < n['OS_Memory_Total'])
+
+
+if __name__=='__main__':
+	unittest.main()
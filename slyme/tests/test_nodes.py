@@ -0,0 +1,94 @@
+# Copyright (c) 2013-2014
+# Harvard FAS Research Computing
+# All rights reserved.
+
+"""unit tests"""
+
+import sys, os, tempfile, shutil
+import unittest
+
+from slyme import nodes, nodeprobe, util
+from slyme.nodes import Node
+
+import settings
+from test_nodeprobe import PROBE_TEXT
+
+
+SCONTROL = """#!/bin/sh
+echo "$*" >> "$(dirname "$0")/calls"
+echo "NodeName=$4 Arch=x86_64 CoresPerSocket=8 CPUAlloc=12 CPUErr=0 CPUTot=16 CPULoad=10.50 AllocMem=2048 Features=intel"
+"""
+
+
+class NodeTestCase(unittest.TestCase):
+	def setUp(self):
+		self.tmpdir = tempfile.mkdtemp()
+		path = os.path.join(self.tmpdir, 'scontrol')
+		with open(path, 'w') as f:
+			f.write(SCONTROL)
+		os.chmod(path, 0755)
+		self.path = os.environ['PATH']
+		os.environ['PATH'] = self.tmpdir + os.pathsep + self.path
+
+	def tearDown(self):
+		os.environ['PATH'] = self.path
+		shutil.rmtree(self.tmpdir)
+		Node.probe_transport = None
+
+	def calls(self):
+		try:
+			with open(os.path.join(self.tmpdir, 'calls')) as f:
+				return [line.split() for line in f]
+		except IOError:
+			return []
+
+	def test_one_scontrol(self):
+		"""That all the scontrol keys come from one scontrol of the node itself."""
+		n = Node(NodeName='holy2a01101')
+		self.assertEqual(n['CPUTot'], 16)
+		self.assertEqual(n['CPUAlloc'], 12)
+		self.assertEqual(n['CPULoad'], 10.5)
+		self.assertEqual(n['AllocMem_kB'], 2048000)
+		self.assertEqual(n['Cores_Wasted'], 1.5)
+		self.assertEqual(self.calls(), [['show', 'node', '--oneliner', 'holy2a01101']])
+
+	def test_scontrol_text(self):
+		"""That nodes from get_nodes don't run scontrol again."""
+		n = Node()
+		n.load_data_from_scontrol_text("NodeName=holy2a01102 CPUAlloc=0 CPUTot=16 CPULoad=N/A")
+		self.assertEqual(n['CPUAlloc'], 0)
+		self.assertRaises(KeyError, n.__getitem__, 'CPULoad')
+		self.assertRaises(KeyError, n.__getitem__, 'Cores_Wasted')
+		self.assertEqual(self.calls(), [])
+
+	def test_os_local(self):
+		n = Node(NodeName=util.get_hostname())
+		self.assertTrue(n['OS_Cores_Total'] > 0)
+		self.assertTrue(0 < n['OS_Memory_Used'] < n['OS_Memory_Total'])
+
+	def test_os_remote(self):
+		"""That other nodes' os data needs a transport, and takes one probe."""
+		self.assertRaises(KeyError, Node(NodeName='holy2a01101').__getitem__, 'OS_Cores_Total')
+
+		Node.probe_transport = transport = nodeprobe.FakeTransport({'holy2a01101': PROBE_TEXT})
+		n = Node(NodeName='holy2a01101')
+		self.assertEqual(n['OS_Cores_Total'], 16)
+		self.assertEqual(n['OS_Cores_Used'], 12)
+		self.assertEqual(n['OS_Memory_Total'], 65931224)
+		self.assertEqual(n['OS_Memory_Used'], 20331224)
+		self.assertEqual(transport.calls, 1)
+
+	def test_os_unavailable(self):
+		"""That a node that can't be probed is only probed once."""
+		Node.probe_transport = transport = nodeprobe.FakeTransport({'holy2a01101': util.ShError("ssh failed")})
+		n = Node(NodeName='holy2a01101')
+		for i in range(2):
+			for key in nodeprobe.OS_KEYS:
+				self.assertRaises(KeyError, n.__getitem__, key)
+				self.assertFalse(key in n)
+		self.assertEqual(n['os_data'], nodeprobe.OS_UNAVAILABLE)
+		self.assertEqual(transport.calls, 1)
+
+
+if __name__=='__main__':
+	unittest.main()
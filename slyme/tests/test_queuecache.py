@@ -0,0 +1,90 @@
+# Copyright (c) 2013-2014
+# Harvard FAS Research Computing
+# All rights reserved.
+
+"""unit tests"""
+
+import sys, os, time, tempfile, shutil, threading
+import unittest
+
+from slyme import Slurm
+from slyme import queuecache
+
+import settings
+
+
+SQUEUE = """#!/bin/sh
+echo "$*" >> "$(dirname "$0")/calls"
+sleep 0.3
+echo "1|1|alice|general|RUNNING"
+echo "2|2|bob|general|PENDING"
+echo "3_4|7|alice|bigmem|RUNNING"
+"""
+
+
+class SqueueCacheTestCase(unittest.TestCase):
+	def setUp(self):
+		self.tmpdir = tempfile.mkdtemp()
+		path = os.path.join(self.tmpdir, 'squeue')
+		with open(path, 'w') as f:
+			f.write(SQUEUE)
+		os.chmod(path, 0755)
+		self.path = os.environ['PATH']
+		os.environ['PATH'] = self.tmpdir + os.pathsep + self.path
+
+	def tearDown(self):
+		os.environ['PATH'] = self.path
+		shutil.rmtree(self.tmpdir)
+
+	def ncalls(self):
+		try:
+			with open(os.path.join(self.tmpdir, 'calls')) as f:
+				return len(f.readlines())
+		except IOError:
+			return 0
+
+	def test_snapshot(self):
+		snapshot = queuecache.SqueueCache().get()
+		self.assertEqual(len(snapshot), 3)
+		self.assertEqual(snapshot.status(1), 'RUNNING')
+		self.assertEqual(snapshot.status('3_4'), 'RUNNING')
+		self.assertEqual(snapshot.status(7), 'RUNNING')
+		self.assertEqual(snapshot.status(5), None)
+		self.assertEqual([j.JobID for j in snapshot.user_jobs('alice')], ['1', '3_4'])
+		self.assertEqual([j.JobID for j in snapshot.partition_jobs('general')], ['1', '2'])
+		self.assertEqual(snapshot.user_jobs('carol'), [])
+
+	def test_ttl(self):
+		cache = queuecache.SqueueCache(ttl=0.5)
+		for jobid in (1, 2, 3):
+			cache.status(jobid)
+		self.assertEqual(self.ncalls(), 1)
+		time.sleep(0.5)
+		cache.status(1)
+		self.assertEqual(self.ncalls(), 2)
+		cache.invalidate()
+		cache.status(1)
+		self.assertEqual(self.ncalls(), 3)
+
+	def test_single_flight(self):
+		"""That threads that find the snapshot stale together share one squeue."""
+		cache = queuecache.SqueueCache(ttl=0)
+		snapshots = []
+		threads = [threading.Thread(target=lambda: snapshots.append(cache.get())) for i in range(8)]
+		for t in threads:
+			t.start()
+		for t in threads:
+			t.join()
+		self.assertEqual(len(snapshots), 8)
+		self.assertEqual(self.ncalls(), 1)
+		self.assertEqual(len(set(id(s) for s in snapshots)), 1)
+
+	def test_getJobStatus(self):
+		cache = queuecache.SqueueCache()
+		self.assertEqual(Slurm.getJobStatus(2, cache=cache), 'PENDING\n')
+		self.assertEqual(Slurm.getJobStatuses([1, 2, '3_4'], cache=cache), {'1': 'RUNNING', '2': 'PENDING', '3_4': 'RUNNING'})
+		self.assertEqual(self.ncalls(), 1)
+
+
+if __name__=='__main__':
+	unittest.main()
@@ -0,0 +1,157 @@
+# Copyright (c) 2013-2014
+# Harvard FAS Research Computing
+# All rights reserved.
+
+"""unit tests"""
+
+import sys, os, datetime
+import unittest
+
+from slyme import Slurm
+from slyme import sacctparser
+from slyme.sacctparser import SacctParser, DEFAULT_FIELDS
+from slyme.columnar import JobStepTable
+
+import settings
+
+
+LINE = '10101624.batch||batch|CANCELLED by 100278||8|1|00:03:46|03:37.192|02:57.685|00:39.506|2.5Gc|2407896K|2014-05-04T10:34:55|Unknown|holybigmem08|1-00:24:32|1.5M|16?'
+
+
+class ConversionTestCase(unittest.TestCase):
+	def test_seconds(self):
+		for tstr in ('4-18:29:01', '05:03:43', '01:09.666', '00:00:00', ''):
+			self.assertEqual(sacctparser.seconds(tstr), Slurm.slurmtime_to_seconds(tstr))
+
+	def test_memory_kB(self):
+		for mem in ('2409232K', '1.5M', '2G', '0', '16?'):
+			self.assertEqual(sacctparser.memory_kB(mem), Slurm.MaxRSS_to_kB(mem))
+		self.assertRaises(Exception, sacctparser.memory_kB, '1024')
+
+	def test_timestamp(self):
+		self.assertEqual(sacctparser.timestamp('2014-05-04T10:34:55'), datetime.datetime(2014, 5, 4, 10, 34, 55))
+		self.assertEqual(sacctparser.timestamp('Unknown'), None)
+		self.assertEqual(sacctparser.timestamp(''), None)
+
+	def test_reqmem(self):
+		self.assertEqual(sacctparser.reqmem(('200Mc', 8)), (200*1024**2, None, 200*1024**2, 1600))
+		self.assertEqual(sacctparser.reqmem(('20000Mn', 8)), (20000*1024**2, 20000*1024**2, None, 20000))
+		self.assertEqual(sacctparser.reqmem(('2.001Gn', 1)), (2148557390, 2148557390, None, 2))
+		self.assertEqual(sacctparser.reqmem(('0n', 1)), (0, None, None, None))
+
+
+class SacctParserTestCase(unittest.TestCase):
+	def test_parse_line(self):
+		j = SacctParser().parse_line(LINE)
+		self.assertEqual(j.JobID, '10101624')
+		self.assertEqual(j.JobStepName, 'batch')
+		self.assertEqual(j.State, 'CANCELLED')
+		self.assertEqual(j.CancelledBy, '100278')
+		self.assertEqual(j.NCPUS, 8)
+		self.assertEqual(j.TotalCPU, 217.192)
+		self.assertEqual(j.Elapsed, 87872)
+		self.assertEqual(j.ReqMem_bytes_per_core, int(round(2.5*1024**3)))
+		self.assertEqual(j.ReqMem_MB_total, 20)
+		self.assertEqual(j.MaxRSS_kB, 2407896)
+		self.assertEqual(j.MaxRSS_MB, 2351)
+		self.assertEqual(j.MaxVMSize_MB, 1)
+		self.assertEqual(j.AveVMSize_MB, 0)
+		self.assertEqual(j.Start, datetime.datetime(2014, 5, 4, 10, 34, 55))
+		self.assertEqual(j.End, None)
+
+	def test_blank_lines(self):
+		self.assertEqual(SacctParser().parse_line('  \n'), None)
+		self.assertEqual(len(list(SacctParser().parse(['', LINE, '\n', LINE]))), 2)
+
+	def test_repeated_values_shared(self):
+		p = SacctParser()
+		j1, j2 = p.parse([LINE, LINE])
+		self.assertTrue(j1.NodeList is j2.NodeList)
+		self.assertTrue(j1.Start is j2.Start)
+
+	def test_other_fields(self):
+		p = SacctParser(['JobID', 'Account', 'NCPUS', 'ReqMem'])
+		j = p.parse_line('1234.0|rc_admin|4|100Mc')
+		self.assertEqual(j.JobID, '1234')
+		self.assertEqual(j.JobStepName, '0')
+		self.assertEqual(j.Account, 'rc_admin')
+		self.assertEqual(j.ReqMem_MB_total, 400)
+		self.assertEqual(j['User'], None)
+
+	def test_pipes_in_jobname(self):
+		p = SacctParser()
+		line = LINE.replace('|batch|', '|a|b||c|').replace('CANCELLED by 100278', 'RUNNING')
+		j = p.parse_line(line)
+		self.assertEqual(j.JobName, 'a|b||c')
+		self.assertEqual(j.State, 'RUNNING')
+		self.assertEqual(j.NodeList, 'holybigmem08')
+		self.assertEqual(j.MaxRSS_kB, 2407896)
+		self.assertEqual(p.slow_rows, 1)
+		self.assertEqual(p.bad_rows, 0)
+
+	def test_too_few_columns(self):
+		p = SacctParser()
+		self.assertEqual(p.parse_line('1234|jdoe|RUNNING'), None)
+		self.assertEqual(p.slow_rows, 1)
+		self.assertEqual(p.bad_rows, 1)
+
+	def test_getJobReports_counters(self):
+		lines = [
+			'10897512|akitzmiller|bash | tee log|RUNNING|interact|1|1|02:04:34|00:00:00|00:00:00|00:00:00|1000Mn|0|2014-05-20T09:24:43|Unknown|holy2a18208|00:24:32|1000K|1000K\n',
+			'10897513|akitzmiller|bash|PENDING|interact|1|1|00:00:00|00:00:00|00:00:00|00:00:00|1000Mn|0|Unknown|Unknown|None assigned|00:00:00||\n',
+		]
+		p = SacctParser(Slurm._sacct_format_parsable.split(','))
+		reports = list(Slurm.getJobReports(execfunc=lambda shv: iter(lines), parser=p))
+		self.assertEqual([jr.JobID for jr in reports], ['10897512', '10897513'])
+		self.assertEqual(reports[0].JobName, 'bash | tee log')
+		self.assertEqual(p.slow_rows, 1)
+
+	def test_format_fields(self):
+		self.assertEqual(sacctparser.format_fields(['User', 'CPU_Efficiency']), ['JobID', 'User', 'CPUTime', 'TotalCPU'])
+		self.assertEqual(sacctparser.format_fields(['Account', 'ReqMem_MB_total']), ['JobID', 'NCPUS', 'ReqMem', 'Account'])
+
+	def test_getJobReports_fields(self):
+		calls = []
+		def sacct(shv):
+			calls.append(shv)
+			return iter(['1234|jdoe|00:10:00|00:05:00\n', '1234.batch||00:10:00|00:05:00\n'])
+		for columnar in (False, True):
+			reports = list(Slurm.getJobReports(execfunc=sacct, fields=['User', 'CPU_Efficiency'], columnar=columnar))
+			self.assertEqual(calls[-1][calls[-1].index('--format')+1], 'JobID,User,CPUTime,TotalCPU')
+			self.assertEqual(len(reports), 1)
+			self.assertEqual(reports[0].User, 'jdoe')
+			self.assertEqual(reports[0].CPU_Efficiency, 0.5)
+			self.assertEqual(reports[0].JobName, None)
+			#unrequested max keys are their floors, not None
+			self.assertEqual(reports[0].NCPUS, 0)
+			self.assertEqual(reports[0].MaxRSS_kB, -1)
+
+	def test_parse_into(self):
+		"""That parse_into makes the same rows as appending parse's JobSteps."""
+		pipes = LINE.replace('|batch|', '|a|b||c|').replace('10101624.batch', '10101625')
+		for fields, lines in (
+			(DEFAULT_FIELDS, [LINE, '', pipes, LINE.replace('10101624.batch', '10101625.batch'), '1234|jdoe|RUNNING', LINE.replace('10101624.', '10101626.')]),
+			(['JobID', 'Account', 'ReqMem', 'Start'], ['1234|rc_admin|100Mc|Unknown', '1234.0|rc_admin|2Gn|2014-05-04T10:34:55', '1235|rc_admin|100Mc|2014-05-05T00:00:00']),
+		):
+			for batch_rows in (0, 1024):
+				p = SacctParser(fields)
+				table = JobStepTable(p.attributes)
+				ranges = list(p.parse_into(table, lines, batch_rows=batch_rows))
+				expected = JobStepTable(p.attributes)
+				for j in SacctParser(fields).parse(lines):
+					expected.append(j)
+				self.assertEqual(len(table), len(expected))
+				for name in expected.columns:
+					self.assertEqual(list(table.values(name)), list(expected.values(name)), name)
+				self.assertEqual(ranges[0][0], 0)
+				self.assertEqual(ranges[-1][1], len(table))
+				for (s1, e1), (s2, e2) in zip(ranges, ranges[1:]):
+					self.assertEqual(e1, s2)
+				self.assertEqual([table.values('JobID', s, e)[0] for s, e in ranges], sorted(set(table.values('JobID'))))
+
+	def test_bad_field_name(self):
+		self.assertRaises(ValueError, SacctParser, ['JobID', 'x; import os'])
+
+
+if __name__=='__main__':
+	unittest.main()
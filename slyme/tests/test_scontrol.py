@@ -0,0 +1,73 @@
+# Copyright (c) 2013-2014
+# Harvard FAS Research Computing
+# All rights reserved.
+
+"""unit tests"""
+
+import sys, os, pickle
+import unittest
+from datetime import datetime
+
+from slyme import scontrol
+
+import settings
+
+
+LINE = "NodeName=holy2a01101 Arch=x86_64 CoresPerSocket=8 CPUAlloc=12 CPUErr=0 CPUTot=16 CPULoad=11.50 " \
+	"Features=intel,holyib Gres=gpu:2(IDX:0,1),mic:1 NodeAddr=holy2a01101 NodeHostName=holy2a01101 " \
+	"OS=Linux 2.6.32-431.17.1.el6.x86_64 #1 SMP RealMemory=258302 AllocMem=48000 FreeMem=N/A Sockets=4 Boards=1 " \
+	"State=MIXED+DRAIN* ThreadsPerCore=1 TmpDisk=0 Weight=1 BootTime=2014-04-23T14:36:16 " \
+	"SlurmdStartTime=2014-05-05T18:23:44 Partitions=general,serial_requeue CurrentWatts=0 LowestJoules=0 " \
+	"ConsumedJoules=0 ExtSensorsJoules=n/s ExtSensorsWatts=0 ExtSensorsTemp=n/s " \
+	"Reason=Kill task failed [root@2014-05-06T10:00:00]\n"
+
+
+class ScontrolTestCase(unittest.TestCase):
+	def test_tokenize(self):
+		pairs = scontrol.tokenize(LINE)
+		d = dict(pairs)
+		self.assertEqual(pairs[0], ('NodeName', 'holy2a01101'))
+		self.assertEqual(d['OS'], 'Linux 2.6.32-431.17.1.el6.x86_64 #1 SMP')
+		self.assertEqual(d['Reason'], 'Kill task failed [root@2014-05-06T10:00:00]')
+		self.assertEqual(len(pairs), 31)
+		self.assertEqual(scontrol.tokenize(''), [])
+
+	def test_parse_node(self):
+		r = scontrol.parse_node(LINE)
+		self.assertEqual(r.NodeName, 'holy2a01101')
+		self.assertEqual(r.CPUAlloc, 12)
+		self.assertEqual(r.CPUTot, 16)
+		self.assertEqual(r.CPULoad, 11.5)
+		self.assertEqual(r.RealMemory, 258302)
+		self.assertEqual(r.AllocMem, 48000)
+		self.assertEqual(r.FreeMem, None)
+		self.assertEqual(r.Features, ('intel', 'holyib'))
+		self.assertEqual(r.Gres, ('gpu:2(IDX:0,1)', 'mic:1'))
+		self.assertEqual(r.Partitions, ('general', 'serial_requeue'))
+		self.assertEqual(r.State, 'MIXED')
+		self.assertEqual(r.StateFlags, ('DRAIN', 'NOT_RESPONDING'))
+		self.assertEqual(r.BootTime, datetime(2014, 4, 23, 14, 36, 16))
+		self.assertEqual(r.Reason, 'Kill task failed [root@2014-05-06T10:00:00]')
+		self.assertEqual(r.extra['ExtSensorsWatts'], '0')
+		self.assertEqual(r.get('ExtSensorsTemp'), 'n/s')
+		self.assertEqual(r.get('CPUErr'), 0)
+		self.assertEqual(r.LastBusyTime, None)
+
+	def test_shared_values(self):
+		"""That repeated values are converted once and shared."""
+		r1 = scontrol.parse_node(LINE)
+		r2 = scontrol.parse_node(LINE.replace('holy2a01101', 'holy2a01102'))
+		self.assertEqual(r2.NodeName, 'holy2a01102')
+		self.assertTrue(r1.Partitions is r2.Partitions)
+		self.assertTrue(r1.BootTime is r2.BootTime)
+
+	def test_pickle(self):
+		r = pickle.loads(pickle.dumps(scontrol.parse_node(LINE), pickle.HIGHEST_PROTOCOL))
+		self.assertEqual(r.as_dict(), scontrol.parse_node(LINE).as_dict())
+
+	def test_bad_value(self):
+		self.assertRaises(Exception, scontrol.parse_node, "NodeName=x CPUTot=lots")
+
+
+if __name__=='__main__':
+	unittest.main()
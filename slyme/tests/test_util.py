@@ -4,7 +4,7 @@
 
 """unit tests"""
 
-import sys, os
+import sys, os, time
 import unittest
 
 import slyme
@@ -90,5 +90,115 @@ class ShTestCase(unittest.TestCase):
 			raise AssertionError("bash sh code did not raise proper exception")
 
 
+
+class ShStreamTestCase(unittest.TestCase):
+	def test_lines(self):
+		"""That lines come out as runsh_i's do, and are counted."""
+		with util.ShStream(['/bin/echo', '-e', 'foo\nbar']) as stream:
+			lines = list(stream)
+		self.assertEqual(lines, ['foo\n', 'bar\n'])
+		self.assertEqual(stream.lines_read, 2)
+		self.assertEqual(stream.bytes_read, 8)
+		self.assertEqual(stream.returncode, 0)
+		self.assertTrue(stream.elapsed() >= 0)
+	def test_small_blocks(self):
+		"""That lines split across reads are put back together."""
+		self.assertEqual(
+			list(util.runsh_i("/bin/echo -e 'foo\nbarbaz\nqux'", block_size=2)),
+			['foo\n', 'barbaz\n', 'qux\n'],
+		)
+	def test_early_close(self):
+		"""That leaving the with block early terminates and reaps the child."""
+		with util.ShStream(['yes']) as stream:
+			for i, line in enumerate(stream):
+				if i==10:
+					break
+		self.assertEqual(stream.returncode, -15)
+	def test_runsh_i_early_close(self):
+		"""That closing runsh_i early leaves no process behind."""
+		lines = util.runsh_i("echo $$; exec yes")
+		pid = int(lines.next())
+		lines.next()
+		lines.close()
+		self.assertRaises(OSError, os.kill, pid, 0)
+	def test_stderr_limit(self):
+		"""That only the first stderr_limit bytes of stderr are kept."""
+		with util.ShStream("head -c 200000 /dev/zero >&2; echo foo", stderr_limit=100) as stream:
+			try:
+				list(stream)
+			except util.ShError, e:
+				self.assertEqual(len(e.stderr), 100)
+			else:
+				raise AssertionError("stderr did not raise an exception")
+		self.assertEqual(stream.stderr_bytes, 200000)
+		self.assertEqual(stream.lines_read, 1)
+	def test_timeout(self):
+		"""That a child still running after the timeout is terminated."""
+		t = time.time()
+		with util.ShStream("echo foo; sleep 10", timeout=0.5) as stream:
+			lines = []
+			try:
+				for line in stream:
+					lines.append(line)
+			except util.ShError, e:
+				self.assertEqual(e.returncode, -15)
+			else:
+				raise AssertionError("timeout did not raise an exception")
+		self.assertEqual(lines, ['foo\n'])
+		self.assertTrue(time.time() - t < 2)
+
+class ShMultiplexerTestCase(unittest.TestCase):
+	def test_concurrent(self):
+		"""That commands run at the same time, and lines go to the right callback."""
+		mux = util.ShMultiplexer()
+		lines = {}
+		done = []
+		for name in ('a', 'b', 'c'):
+			lines[name] = []
+			mux.add("sleep 0.5; echo %s1; echo -n %s2" % (name, name), online=lines[name].append, ondone=done.append)
+		t = time.time()
+		mux.run()
+		self.assertTrue(time.time() - t < 1.4)
+		self.assertEqual(lines['b'], ['b1\n', 'b2'])
+		self.assertEqual(done, [None, None, None])
+
+	def test_errors(self):
+		"""That each command's error goes to its own ondone, whichever finishes
+		first, and an unhandled one is raised from run()."""
+		mux = util.ShMultiplexer()
+		errors = {}
+		mux.add('exit 3', ondone=lambda e: errors.__setitem__('exit', e))
+		mux.add('echo foo >&2', ondone=lambda e: errors.__setitem__('stderr', e), check=False)
+		mux.run()
+		self.assertEqual(errors['exit'].returncode, 3)
+		self.assertEqual(errors['stderr'], None)
+
+		mux.add('exit 4')
+		mux.add('sleep 10')
+		self.assertRaises(util.ShError, mux.run)
+		self.assertEqual(len(mux), 0)
+
+	def test_stderr_limit(self):
+		"""That only the first stderr_limit bytes of each command's stderr are kept."""
+		mux = util.ShMultiplexer()
+		errors = []
+		mp = mux.add("head -c 200000 /dev/zero >&2; echo foo", ondone=errors.append, stderr_limit=100)
+		mux.run()
+		self.assertEqual(len(errors[0].stderr), 100)
+		self.assertEqual(mp.stderr_bytes, 200000)
+
+	def test_followup(self):
+		"""That a callback can start another command on the same run."""
+		mux = util.ShMultiplexer()
+		lines = []
+		mux.add('echo first', online=lines.append, ondone=lambda e: mux.add('echo second', online=lines.append))
+		mux.run()
+		self.assertEqual(lines, ['first\n', 'second\n'])
+
+	def test_runsh_multi(self):
+		self.assertEqual(util.runsh_multi(['echo foo', ['/bin/echo', 'bar']]), ['foo\n', 'bar\n'])
+		self.assertRaises(util.ShError, util.runsh_multi, ['echo foo', 'exit 1'])
+
+
 if __name__=='__main__':
 	unittest.main()
@@ -0,0 +1,136 @@
+# Copyright (c) 2013-2014
+# Harvard FAS Research Computing
+# All rights reserved.
+
+"""unit tests"""
+
+import sys, os, time, tempfile, shutil
+import unittest
+
+from slyme import scontrol, utilization
+
+import settings
+
+
+NODES = [
+	#12 allocated, 10.5 busy: 1.5 wasted
+	"NodeName=holy2a01101 CPUAlloc=12 CPUTot=16 CPULoad=10.50 RealMemory=1000 AllocMem=800 FreeMem=600 State=MIXED Partitions=general,bigmem",
+	#busier than allocated: nothing wasted
+	"NodeName=holy2a01102 CPUAlloc=4 CPUTot=16 CPULoad=6.00 RealMemory=1000 AllocMem=200 FreeMem=900 State=MIXED Partitions=general",
+	#not responding: unknown use
+	"NodeName=holy2a01103 CPUAlloc=0 CPUTot=16 CPULoad=N/A RealMemory=1000 AllocMem=0 FreeMem=N/A State=IDLE* Partitions=general",
+]
+
+JOBS = [
+	('alice', 8, 'holy2a01101'),
+	('bob', 8, 'holy2a01101,holy2a01102'),
+]
+
+
+def sample(t):
+	return utilization.take_sample([scontrol.parse_node(line) for line in NODES], JOBS, sample_time=t)
+
+
+class UtilizationTestCase(unittest.TestCase):
+	def setUp(self):
+		self.tmpdir = tempfile.mkdtemp()
+		self.path = os.path.join(self.tmpdir, 'utilization.db')
+
+	def tearDown(self):
+		shutil.rmtree(self.tmpdir)
+
+	def test_sample(self):
+		s = sample(1000)
+		self.assertEqual(s.rows[('node', 'holy2a01101')], [16, 12, 10.5, 1.5, 1000, 800, 400])
+		self.assertEqual(s.rows[('node', 'holy2a01102')], [16, 4, 6.0, 0.0, 1000, 200, 100])
+		self.assertEqual(s.rows[('node', 'holy2a01103')], [16, 0, None, None, 1000, 0, None])
+		self.assertEqual(s.rows[('partition', 'bigmem')], [16, 12, 10.5, 1.5, 1000, 800, 400])
+		self.assertEqual(s.rows[('cluster', '')], [48, 16, 16.5, 1.5, 3000, 1000, 500])
+		#alice has 8 of holy2a01101's 12 cores, bob 4
+		self.assertEqual(s.rows[('user', 'alice')], [None, 8, 7.0, 1.0, None, None, None])
+		self.assertEqual(s.rows[('user', 'bob')], [None, 8, 7.5, 0.5, None, None, None])
+
+	def test_store(self):
+		now = time.time()
+		t0 = int(now) - int(now) % 60 - 540
+		store = utilization.UtilizationStore(self.path, tiers=((60, 5), (600, 10)))
+		#two samples a minute for 10 minutes
+		for i in range(20):
+			store.add(sample(t0 + i * 30))
+		#the first tier only keeps 5 minutes
+		series = store.series('user', 'alice', start=t0, tier=0)
+		self.assertEqual([t for t, values in series], [t0 + 300 + i * 60 for i in range(5)])
+		coarse = store.series('user', 'alice', start=t0, tier=1)
+		self.assertTrue(1 <= len(coarse) <= 2)
+		self.assertEqual(store.keys('user'), ['alice', 'bob'])
+
+		series = store.series('node', 'holy2a01101', start=now - 290)
+		self.assertEqual([values['wasted_cores'] for t, values in series], [1.5] * len(series))
+		self.assertEqual(store.series('node', 'holy2a01103', start=now - 290)[0][1]['used_cores'], None)
+
+		#the last 5 minutes are at minute resolution, 1 core wasted each
+		self.assertAlmostEqual(store.wasted_core_hours('user', start=now - 290)['alice'], len(series) / 60.0)
+		#longer ago is at 10 minute resolution
+		self.assertAlmostEqual(store.wasted_core_hours('user', start=t0)['bob'], 0.5 * len(coarse) / 6.0)
+		store.close()
+
+		#samples survive reopening
+		store = utilization.UtilizationStore(self.path, tiers=((60, 5), (600, 10)))
+		self.assertEqual(store.keys('partition'), ['bigmem', 'general'])
+		store.close()
+
+	def test_partial_series(self):
+		"""That a series missing from some of a bucket's samples is averaged over all of them."""
+		store = utilization.UtilizationStore(self.path, tiers=((60, 100), (600, 100)))
+		t0 = int(time.time()) // 600 * 600 - 1200
+		for i in range(10):
+			s = utilization.Sample(t0 + i * 60)
+			s.add('cluster', '', (16, 0, 0, 0, None, None, None))
+			if i == 3:
+				s.add('user', 'alice', (None, 10, 0, 10, None, None, None))
+			store.add(s)
+		self.assertEqual(store.series('user', 'alice', start=t0, tier=1), [(t0, {
+			'total_cores': None, 'alloc_cores': 1.0, 'used_cores': 0.0, 'wasted_cores': 1.0,
+			'total_mem': None, 'alloc_mem': None, 'used_mem': None,
+		})])
+		self.assertEqual(store.series('user', 'alice', start=t0, tier=0)[0][1]['wasted_cores'], 10.0)
+		#10 cores for one minute
+		self.assertAlmostEqual(store.core_hours('user', start=t0 - 40 * 86400)['alice'], 10 / 60.0)
+		self.assertAlmostEqual(store.core_hours('user', start=t0)['alice'], 10 / 60.0)
+		store.close()
+
+	def test_sampler_errors(self):
+		"""That a failed sample is logged and the sampler carries on."""
+		take_sample = utilization.take_sample
+		calls = []
+		def failing_take_sample(sample_time=None):
+			calls.append(sample_time)
+			if len(calls) == 1:
+				raise ValueError("unexpected scontrol output")
+			return take_sample([scontrol.parse_node(line) for line in NODES], JOBS, sample_time=sample_time)
+		utilization.take_sample = failing_take_sample
+		try:
+			utilization.run_sampler(self.path, interval=0, count=2)
+		finally:
+			utilization.take_sample = take_sample
+		self.assertEqual(len(calls), 2)
+		store = utilization.UtilizationStore(self.path)
+		self.assertEqual(store.keys('user'), ['alice', 'bob'])
+		store.close()
+
+	def test_main(self):
+		store = utilization.UtilizationStore(self.path)
+		store.add(sample(time.time()))
+		store.close()
+		stdout = sys.stdout
+		sys.stdout = out = tempfile.TemporaryFile()
+		try:
+			utilization.main(['--db', self.path, '--report', 'user'])
+		finally:
+			sys.stdout = stdout
+		out.seek(0)
+		self.assertEqual([line.split()[0] for line in out], ['alice', 'bob'])
+
+
+if __name__=='__main__':
+	unittest.main()
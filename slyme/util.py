@@ -5,7 +5,9 @@
 """general utilities"""
 
 
-import os, select, subprocess, socket, logging
+import os, time, select, subprocess, socket, logging
+
+from slyme import hostmetrics
 
 
 #--- basic resource utilization
@@ -21,21 +23,12 @@ def get_cpu():
 	[total number of cores (int), number of running tasks (int)]
 
 	This is just a normal resource computation, independent of Slurm.
-	The number of running tasks is from the 4th colum of /proc/loadavg;
-	it's decremented by one in order to account for this process asking for it.
+	The total is the number of online cores, which is cached (see
+	hostmetrics.HostMetrics).  The number of running tasks is from the 4th
+	colum of /proc/loadavg; it's decremented by one in order to account for
+	this process asking for it.
 	"""
-	#running processes
-	with open('/proc/loadavg','r') as f:
-		#e.g. 52.10 52.07 52.04 53/2016 54847 -> 53-1 = 52
-		used = max(int(f.read().split()[3].split('/')[0]) - 1, 0)
-
-	with open('/proc/cpuinfo','r') as f:
-		total = 0
-		for l in f.readlines():
-			if l.startswith('processor'):
-				total += 1
-
-	return total, used
+	return hostmetrics.HOST.cores(), hostmetrics.HOST.running_tasks()
 
 def get_mem():
 	"""Return the memory capacity and usage on this host.
@@ -46,20 +39,7 @@ def get_mem():
 	This is just a normal resource computation, independent of Slurm.
 	The used memory does not count Buffers, Cached, and SwapCached.
 	"""
-	with open('/proc/meminfo','r') as f:
-		total = 0
-		free = 0
-
-		for line in f.readlines():
-			fields = line.split()
-			if fields[0]=='MemTotal:':
-				total = int(fields[1])
-			if fields[0] in ('MemFree:', 'Buffers:', 'Cached:', 'SwapCached'):
-				free += int(fields[1])
-
-		used = total - free
-
-		return total, used
+	return hostmetrics.HOST.memory()
 
 
 #--- subprocess handling
@@ -135,54 +115,321 @@ def runsh(sh, inputstr=None):
 	sherrcheck(sh, stderr, p.returncode)
 	return stdout
 
-def runsh_i(sh):
+#how much to read from a subprocess at a time
+BLOCK_SIZE = 1024*1024
+
+#how much of a subprocess's stderr to keep
+STDERR_LIMIT = 64*1024
+
+#how long to wait for a terminated subprocess to exit before killing it
+TERMINATE_TIMEOUT = 5
+
+class ShStream(object):
+	"""Runs shell code and streams its stdout lines.
+
+	This is a context manager:
+
+		with ShStream(sh) as stream:
+			for line in stream:
+				...
+
+	Output is only read as it's consumed, so a slow consumer makes the child
+	block on a full pipe rather than buffering without bound.  stderr is
+	read in the same select loop, so the child can't deadlock on it, but only
+	the first stderr_limit bytes are kept (stderr_bytes counts all of it).
+
+	When stdout is exhausted, the exit status and stderr are checked as runsh
+	does, unless check is False.  Leaving the with block or calling close()
+	before then terminates and reaps the child, without error checking.  If
+	timeout (seconds) is given and the child is still running after that
+	long, it's terminated and an ShError is raised.
+
+	The counters bytes_read, lines_read, and stderr_bytes, and elapsed() and
+	rate(), are for monitoring throughput.
+	"""
+
+	def __init__(self, sh, block_size=BLOCK_SIZE, stderr_limit=STDERR_LIMIT, check=True, timeout=None):
+		self.sh = sh
+		self.block_size = block_size
+		self.stderr_limit = stderr_limit
+		self.check = check
+		self.timeout = timeout
+
+		self.stderr = ''
+		self.returncode = None
+		self.bytes_read = 0
+		self.lines_read = 0
+		self.stderr_bytes = 0
+
+		logging.getLogger('slyme.subprocess').debug(repr(sh))
+		with open('/dev/null', 'r') as devnull:
+			self.p = subprocess.Popen(
+				sh,
+				shell=isinstance(sh, basestring),
+				stdin=devnull,
+				stdout=subprocess.PIPE,
+				stderr=subprocess.PIPE
+			)
+		self.start_time = time.time()
+		self.end_time = None
+		self._lines = self._iter_lines()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, tb):
+		self.close()
+		return False
+
+	def __iter__(self):
+		return self._lines
+
+	def _iter_lines(self):
+		stdoutfd = self.p.stdout.fileno()
+		stderrfd = self.p.stderr.fileno()
+		fds = [stdoutfd, stderrfd]
+		partial = ''
+		while fds:
+			if self.timeout is None:
+				rfds, ignored, ignored2 = select.select(fds, [], [])
+			else:
+				remaining = self.start_time + self.timeout - time.time()
+				rfds = []
+				if remaining > 0:
+					rfds, ignored, ignored2 = select.select(fds, [], [], remaining)
+				if not rfds:
+					self.close()
+					e = ShError("shell code [%r] timed out after [%s] seconds" % (self.sh, self.timeout))
+					e.sh = self.sh
+					e.returncode = self.returncode
+					e.stderr = self.stderr
+					raise e
+			if stdoutfd in rfds:
+				s = os.read(stdoutfd, self.block_size)
+				if s=='':
+					fds.remove(stdoutfd)
+				else:
+					self.bytes_read += len(s)
+					#split the whole block at once; only the last line can be partial
+					lines = (partial + s).split('\n')
+					partial = lines.pop()
+					self.lines_read += len(lines)
+					for line in lines:
+						yield line + '\n'
+			if stderrfd in rfds:
+				s = os.read(stderrfd, self.block_size)
+				if s=='':
+					fds.remove(stderrfd)
+				else:
+					self.stderr_bytes += len(s)
+					room = self.stderr_limit - len(self.stderr)
+					if room > 0:
+						self.stderr += s[:room]
+		if partial!='':
+			self.lines_read += 1
+			yield partial
+		self._finish(self.p.wait())
+		if self.check:
+			sherrcheck(self.sh, self.stderr, self.returncode)
+
+	def _finish(self, returncode):
+		self.returncode = returncode
+		self.end_time = time.time()
+		self.p.stdout.close()
+		self.p.stderr.close()
+
+	def close(self):
+		"""Terminate the child if it's still running, and reap it."""
+		if self.returncode is not None:
+			return
+		if self.p.poll() is None:
+			try:
+				self.p.terminate()
+			except OSError:
+				pass
+			deadline = time.time() + TERMINATE_TIMEOUT
+			while self.p.poll() is None and time.time() < deadline:
+				time.sleep(0.01)
+			if self.p.returncode is None:
+				try:
+					self.p.kill()
+				except OSError:
+					pass
+		self._finish(self.p.wait())
+
+	def elapsed(self):
+		"""Seconds since the child was started, until it finished."""
+		end = self.end_time
+		if end is None:
+			end = time.time()
+		return end - self.start_time
+
+	def rate(self):
+		"""Bytes of stdout read per second."""
+		elapsed = self.elapsed()
+		if elapsed <= 0:
+			return 0.0
+		return self.bytes_read / elapsed
+
+def runsh_i(sh, block_size=BLOCK_SIZE):
 	"""Run shell code and yield stdout lines.
 
 	This raises an Exception if exit status is non-zero or stderr is non-empty.
-	Be sure to fully iterate this or you will probably leave orphans.
+	Output is read block_size bytes at a time (see ShStream).  If this is
+	closed before it's exhausted (explicitly, or by being garbage collected
+	when a consumer like dio.coreutils.head stops early), the child is
+	terminated rather than left running.
 	"""
-	BLOCK_SIZE = 4096
-	if type(sh)==type(''):
-		shell=True
-	else:
-		shell=False
+	with ShStream(sh, block_size=block_size) as stream:
+		for line in stream:
+			yield line
 
-	logging.getLogger('slyme.subprocess').debug(repr(sh))
 
-	p = subprocess.Popen(
-		sh,
-		shell=shell,
-		stdin=open('/dev/null', 'r'),
-		stdout=subprocess.PIPE,
-		stderr=subprocess.PIPE
-	)
-	stdoutDone, stderrDone = False, False
-	stdout = ''
-	stderr = ''
-	while not (stdoutDone and stderrDone):
-		rfds, ignored, ignored2 = select.select([p.stdout.fileno(), p.stderr.fileno()], [], [])
-		if p.stdout.fileno() in rfds:
-			s = os.read(p.stdout.fileno(), BLOCK_SIZE)
-			if s=='':
-				stdoutDone = True
-			else:
-				i = 0
-				j = s.find('\n')
-				while j!=-1:
-					yield stdout + s[i:j+1]
-					stdout = ''
-					i = j+1
-					j = s.find('\n',i)
-				stdout += s[i:]
-		if p.stderr.fileno() in rfds:
-			s = os.read(p.stderr.fileno(), BLOCK_SIZE)
-			if s=='':
-				stderrDone = True
-			else:
-				stderr += s
-	if stdout!='':
-		yield stdout
-	sherrcheck(sh, stderr, p.wait())
+#--- many subprocesses at once
+
+class ShMultiplexer(object):
+	"""Runs many subprocesses concurrently from a single select loop.
+
+	Python 2 has no asyncio, so this is the event loop: add() starts a
+	command and registers callbacks for it, and run() services every command
+	until they are all done.  Callbacks may add() more commands (e.g. a
+	follow-up query), which are picked up by the same run().
+
+	Each command's stdout lines are passed to online as they arrive.  When
+	the command finishes, its output is checked as runsh does (sherrcheck, so
+	non-zero exit status or any stderr is an error, unless check is False),
+	and ondone is called with the ShError, or None.  If there is no ondone,
+	an error is raised from run(), after the other commands are killed.
+	"""
+
+	BLOCK_SIZE = BLOCK_SIZE
+
+	def __init__(self):
+		self.running = {}  #fd -> _MuxProcess
+
+	def add(self, sh, online=None, ondone=None, check=True, stderr_limit=STDERR_LIMIT):
+		"""Start the given shell code (str or argv list).
+
+		Only the first stderr_limit bytes of its stderr are kept, as in ShStream.
+		"""
+		logging.getLogger('slyme.subprocess').debug(repr(sh))
+		with open('/dev/null', 'r') as devnull:
+			p = subprocess.Popen(
+				sh,
+				shell=isinstance(sh, basestring),
+				stdin=devnull,
+				stdout=subprocess.PIPE,
+				stderr=subprocess.PIPE
+			)
+		mp = _MuxProcess(sh, p, online, ondone, check, stderr_limit)
+		self.running[p.stdout.fileno()] = mp
+		self.running[p.stderr.fileno()] = mp
+		return mp
+
+	def __len__(self):
+		"""The number of commands still running."""
+		return len(set(self.running.itervalues()))
+
+	def run(self, timeout=None):
+		"""Service the commands until all are done.
+
+		If timeout (seconds) is given, return after that long without any
+		output even if commands are still running.
+		"""
+		try:
+			while self.running:
+				rfds, ignored, ignored2 = select.select(self.running.keys(), [], [], timeout)
+				if not rfds:
+					return
+				for fd in rfds:
+					mp = self.running[fd]
+					s = os.read(fd, self.BLOCK_SIZE)
+					if fd==mp.p.stdout.fileno():
+						if s=='':
+							del self.running[fd]
+							mp.flush()
+						else:
+							mp.out(s)
+					else:
+						if s=='':
+							del self.running[fd]
+						else:
+							mp.err(s)
+					if mp.p.stdout.fileno() not in self.running and mp.p.stderr.fileno() not in self.running:
+						mp.finish()
+		except:
+			self.kill()
+			raise
+
+	def kill(self):
+		"""Kill and reap every command that is still running."""
+		for mp in set(self.running.itervalues()):
+			try:
+				mp.p.kill()
+			except OSError:
+				pass
+			mp.p.wait()
+		self.running.clear()
+
+class _MuxProcess(object):
+	"""ShMultiplexer's state for one command."""
+	def __init__(self, sh, p, online, ondone, check, stderr_limit):
+		self.sh = sh
+		self.p = p
+		self.online = online
+		self.ondone = ondone
+		self.check = check
+		self.stderr_limit = stderr_limit
+		self.partial = ''
+		self.stderr = ''
+		self.stderr_bytes = 0
+		self.returncode = None
+
+	def out(self, s):
+		lines = (self.partial + s).split('\n')
+		self.partial = lines.pop()
+		if self.online is not None:
+			for line in lines:
+				self.online(line + '\n')
+
+	def err(self, s):
+		self.stderr_bytes += len(s)
+		room = self.stderr_limit - len(self.stderr)
+		if room > 0:
+			self.stderr += s[:room]
+
+	def flush(self):
+		if self.partial!='' and self.online is not None:
+			self.online(self.partial)
+		self.partial = ''
+
+	def finish(self):
+		self.returncode = self.p.wait()
+		self.p.stdout.close()
+		self.p.stderr.close()
+		error = None
+		if self.check:
+			try:
+				sherrcheck(self.sh, self.stderr, self.returncode)
+			except ShError, e:
+				error = e
+		if self.ondone is not None:
+			self.ondone(error)
+		elif error is not None:
+			raise error
+
+def runsh_multi(shs):
+	"""Run several shell codes concurrently and return a list of their stdouts.
+
+	This raises an Exception if any exit status is non-zero or any stderr is
+	non-empty, like runsh.
+	"""
+	mux = ShMultiplexer()
+	stdouts = [[] for sh in shs]
+	for sh, stdout in zip(shs, stdouts):
+		mux.add(sh, online=stdout.append)
+	mux.run()
+	return [''.join(stdout) for stdout in stdouts]
 
 
 if __name__=='__main__':
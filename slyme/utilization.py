@@ -0,0 +1,340 @@
+'''
+Copyright (c) 2014
+Harvard FAS Research Computing
+All rights reserved.
+
+Time series of cluster allocation vs. actual use.
+
+take_sample() snapshots every node (scontrol.snapshot) and the running jobs
+(squeue), and computes allocated, used, and wasted cores and memory for each
+node, each partition, the whole cluster, and each user.  Wasted cores are a
+node's Cores_Wasted (CPUAlloc - CPULoad, see nodes.Node), not counting
+nodes that are busier than their allocation; a user is charged the share of
+a node's wasted cores that their jobs' CPUs are of its CPUAlloc.
+
+A UtilizationStore keeps samples in a SQLite file as a set of ring buffers,
+one per tier (by default, minutes for a week, 10 minutes for a month, and
+hours for a year).  Each sample is added into the current bucket of every
+tier, so the coarser tiers are averages of the finer ones and the file never
+grows beyond the tiers' slots.  Each bucket also counts the samples taken in
+it, and a series is averaged over all of them, so one that was only in some
+of a bucket's samples (e.g. a user whose job started partway through) counts
+as zero for the rest.  Queries use the finest tier that still covers
+the requested time range, e.g.
+
+    UtilizationStore(path).wasted_core_hours('user',start=time.time() - WEEK)
+
+run_sampler() is the daemon loop, and main() the slyme.utilization command.
+'''
+import sys
+import time
+import logging
+import sqlite3
+import optparse
+from slyme import util, hostlist, scontrol
+from slyme.nodes import x_cores_wasted
+
+
+logger = logging.getLogger('slyme')
+
+
+HOUR = 3600
+DAY = 24 * HOUR
+WEEK = 7 * DAY
+
+#(seconds per bucket, number of buckets) of each tier, finest first
+DEFAULT_TIERS = (
+    (60,   WEEK / 60),
+    (600,  31 * DAY / 600),
+    (HOUR, 366 * DAY / HOUR),
+)
+
+#seconds between samples
+DEFAULT_INTERVAL = 60
+
+#what's recorded for each node, partition, user, and the cluster; memory is
+#in MB, and users have no memory values
+VALUES = ('total_cores','alloc_cores','used_cores','wasted_cores','total_mem','alloc_mem','used_mem')
+
+#the kinds of series
+KIND_CLUSTER = 'cluster'
+KIND_PARTITION = 'partition'
+KIND_NODE = 'node'
+KIND_USER = 'user'
+
+#squeue --format of the running jobs
+SQUEUE_FORMAT = '%u|%C|%N'
+
+_cores_wasted = x_cores_wasted()
+
+
+#--- sampling
+
+class Sample(object):
+    '''
+    The values of every series at one time
+    '''
+
+    def __init__(self,sample_time):
+        self.time = sample_time
+        self.rows = {}  #(kind,key) -> list of VALUES
+
+    def add(self,kind,key,values):
+        """
+        Add values (None for unknown) to the series' row.
+        """
+        row = self.rows.get((kind,key))
+        if row is None:
+            row = self.rows[(kind,key)] = [None] * len(VALUES)
+        for i,v in enumerate(values):
+            if v is not None:
+                row[i] = (row[i] or 0) + v
+
+def node_values(record):
+    """
+    Return VALUES for a scontrol.NodeRecord.
+    """
+    alloc = record.CPUAlloc or 0
+    load = record.CPULoad
+    used = wasted = None
+    if load is not None:
+        used = min(load,record.CPUTot or 0)
+        wasted = max(_cores_wasted(alloc,load)[0],0.0)
+    used_mem = None
+    if record.RealMemory is not None and record.FreeMem is not None:
+        used_mem = record.RealMemory - record.FreeMem
+    return (record.CPUTot, alloc, used, wasted, record.RealMemory, record.AllocMem, used_mem)
+
+def running_jobs():
+    """
+    Yield (User, NumCPUs, NodeList) for each running job.
+    """
+    for line in util.runsh_i(['squeue','--all','--noheader','--states','RUNNING','--format',SQUEUE_FORMAT]):
+        fields = line.strip().split('|')
+        if len(fields) == 3:
+            yield fields[0],int(fields[1]),fields[2]
+
+def take_sample(records=None,jobs=None,sample_time=None):
+    """
+    Return a Sample of the cluster.  records are scontrol.NodeRecords and
+    jobs are (User, NumCPUs, NodeList) tuples; by default, they're fetched
+    with scontrol and squeue.
+    """
+    if sample_time is None:
+        sample_time = time.time()
+    if records is None:
+        records = scontrol.get_node_records()
+    if jobs is None:
+        jobs = running_jobs()
+
+    sample = Sample(int(sample_time))
+    wasted = {}
+    for record in records:
+        values = node_values(record)
+        wasted[record.NodeName] = (values[1],values[3])
+        sample.add(KIND_NODE,record.NodeName,values)
+        sample.add(KIND_CLUSTER,'',values)
+        for partition in record.Partitions or ():
+            sample.add(KIND_PARTITION,partition,values)
+
+    # Charge each user for their share of the wasted cores of their nodes,
+    # assuming a job's CPUs are spread evenly over its nodes
+    for User,NumCPUs,NodeList in jobs:
+        nodes = hostlist.expand(NodeList)
+        if not nodes:
+            continue
+        cpus = float(NumCPUs) / len(nodes)
+        share = 0.0
+        for node in nodes:
+            alloc,node_wasted = wasted.get(node,(0,None))
+            if alloc and node_wasted:
+                share += node_wasted * min(cpus / alloc,1.0)
+        sample.add(KIND_USER,User,(None,NumCPUs,NumCPUs - share,share,None,None,None))
+    return sample
+
+
+#--- storage
+
+class UtilizationStore(object):
+    '''
+    SQLite file of ring-buffered, multi-resolution utilization time series
+    '''
+
+    def __init__(self,path,tiers=DEFAULT_TIERS):
+        '''
+        Constructor.  Takes the path of the SQLite file, which is created if
+        it does not exist, and the (seconds per bucket, number of buckets) of
+        each tier, finest first.
+        '''
+        self.path = path
+        self.tiers = tuple(tiers)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript('''
+            create table if not exists samples (
+                tier integer, slot integer, time integer, kind text, key text, n integer,
+                %s,
+                primary key (tier, kind, key, slot)
+            );
+            create index if not exists samples_slot on samples (tier, slot);
+            create index if not exists samples_time on samples (tier, kind, time);
+        ''' % ', '.join('%s real' % v for v in VALUES))
+        if self.conn.execute("select count(*) from sqlite_master where type = 'table' and name = 'buckets'").fetchone()[0] == 0:
+            # The number of samples in each bucket, counted from the series
+            # in files from before there was this table
+            self.conn.executescript('''
+                create table buckets (
+                    tier integer, slot integer, time integer, n integer,
+                    primary key (tier, slot)
+                );
+                insert into buckets select tier, slot, time, max(n) from samples group by tier, slot;
+            ''')
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def add(self,sample):
+        """
+        Add a Sample to the current bucket of every tier, and commit.
+        """
+        # (unknown values are skipped, and a sum stays null until there is one)
+        sets = ', '.join('%s = case when ? is null then %s else coalesce(%s, 0) + ? end' % (v,v,v) for v in VALUES)
+        for tier,(step,slots) in enumerate(self.tiers):
+            bucket = sample.time - sample.time % step
+            slot = (bucket / step) % slots
+            # Reuse the slot if it still holds an old bucket
+            self.conn.execute('delete from samples where tier = ? and slot = ? and time != ?',(tier,slot,bucket))
+            self.conn.execute('delete from buckets where tier = ? and slot = ? and time != ?',(tier,slot,bucket))
+            cursor = self.conn.execute('update buckets set n = n + 1 where tier = ? and slot = ?',(tier,slot))
+            if cursor.rowcount == 0:
+                self.conn.execute('insert into buckets values (?, ?, ?, 1)',(tier,slot,bucket))
+            for (kind,key),values in sample.rows.iteritems():
+                cursor = self.conn.execute(
+                    'update samples set n = n + 1, %s where tier = ? and kind = ? and key = ? and slot = ?' % sets,
+                    [x for v in values for x in (v,v)] + [tier,kind,key,slot]
+                )
+                if cursor.rowcount == 0:
+                    self.conn.execute(
+                        'insert into samples values (?, ?, ?, ?, ?, 1, %s)' % ', '.join('?' * len(VALUES)),
+                        [tier,slot,bucket,kind,key] + list(values)
+                    )
+        self.conn.commit()
+
+    def tier(self,start,now=None):
+        """
+        Return the index of the finest tier that still holds start.
+        """
+        if now is None:
+            now = time.time()
+        for tier,(step,slots) in enumerate(self.tiers):
+            if now - step * slots <= start:
+                return tier
+        return len(self.tiers) - 1
+
+    def series(self,kind,key,start=None,end=None,tier=None):
+        """
+        Return a list of (time, dict of VALUES) for the buckets of one series
+        in [start,end), averaged over all the samples in each bucket.
+        """
+        if end is None:
+            end = time.time()
+        if start is None:
+            start = end - WEEK
+        if tier is None:
+            tier = self.tier(start)
+        result = []
+        for row in self.conn.execute(
+            'select s.time, b.n, %s from samples s join buckets b on b.tier = s.tier and b.slot = s.slot '
+            'where s.tier = ? and s.kind = ? and s.key = ? and s.time >= ? and s.time < ? order by s.time' % ', '.join('s.' + v for v in VALUES),
+            (tier,kind,key,start - start % self.tiers[tier][0],end)
+        ):
+            n = float(row[1])
+            result.append((row[0],dict((v,None if x is None else x / n) for v,x in zip(VALUES,row[2:]))))
+        return result
+
+    def keys(self,kind):
+        """
+        Return the sorted keys of the series of the given kind.
+        """
+        return sorted(r[0] for r in self.conn.execute('select distinct key from samples where tier = 0 and kind = ?',(kind,)))
+
+    def core_hours(self,kind,value='wasted_cores',start=None,end=None):
+        """
+        Return a dict of key to the core-hours of the given value (e.g.
+        wasted_cores, alloc_cores) for every series of the given kind in
+        [start,end), by default the last week.
+        """
+        if end is None:
+            end = time.time()
+        if start is None:
+            start = end - WEEK
+        tier = self.tier(start)
+        step = self.tiers[tier][0]
+        totals = {}
+        for key,total in self.conn.execute(
+            'select s.key, sum(s.%s / b.n) from samples s join buckets b on b.tier = s.tier and b.slot = s.slot '
+            'where s.tier = ? and s.kind = ? and s.time >= ? and s.time < ? group by s.key' % value,
+            (tier,kind,start - start % step,end)
+        ):
+            totals[key] = (total or 0.0) * step / HOUR
+        return totals
+
+    def wasted_core_hours(self,kind=KIND_USER,start=None,end=None):
+        """
+        core_hours of wasted_cores, e.g. wasted core-hours per user this week.
+        """
+        return self.core_hours(kind,'wasted_cores',start,end)
+
+
+#--- the daemon
+
+def run_sampler(path,interval=DEFAULT_INTERVAL,count=None,tiers=DEFAULT_TIERS):
+    """
+    Take a sample every interval seconds, and add it to the store at path.
+    Stops after count samples, if given.  Any error taking or storing a sample
+    (e.g. from scontrol, squeue, or SQLite) is logged and the sample skipped.
+    """
+    store = UtilizationStore(path,tiers)
+    n = 0
+    try:
+        while count is None or n < count:
+            t = time.time()
+            try:
+                sample = take_sample(sample_time=t)
+                store.add(sample)
+                logger.info("Sampled %d series in %.2fs" % (len(sample.rows),time.time() - t))
+            except Exception, e:
+                logger.exception("Unable to sample utilization: %s" % e)
+                store.conn.rollback()
+            n += 1
+            if count is None or n < count:
+                time.sleep(max(interval - (time.time() - t),0))
+    finally:
+        store.close()
+
+def main(argv=None):
+    """
+    The slyme.utilization command: run the sampler, or report wasted
+    core-hours.
+    """
+    parser = optparse.OptionParser(usage='%prog [--sample | --report KIND] --db PATH')
+    parser.add_option('--db',help='the SQLite file of samples')
+    parser.add_option('--sample',action='store_true',help='run the sampler')
+    parser.add_option('--interval',type='int',default=DEFAULT_INTERVAL,help='seconds between samples [%default]')
+    parser.add_option('--count',type='int',help='stop after this many samples')
+    parser.add_option('--report',metavar='KIND',help='print wasted core-hours per user, partition, node, or cluster')
+    parser.add_option('--days',type='float',default=7,help='days to report on [%default]')
+    options,args = parser.parse_args(argv)
+    if options.db is None or (options.sample is None and options.report is None):
+        parser.error("--db, and --sample or --report, are required")
+
+    if options.sample:
+        run_sampler(options.db,options.interval,options.count)
+    else:
+        store = UtilizationStore(options.db)
+        try:
+            totals = store.wasted_core_hours(options.report,start=time.time() - options.days * DAY)
+        finally:
+            store.close()
+        for key,total in sorted(totals.iteritems(),key=lambda kv: -kv[1]):
+            sys.stdout.write('%-20s %12.1f\n' % (key or options.report,total))